@@ -5,13 +5,36 @@
 # ========================================= #
 
 import aiomysql
+import asyncio
+import hashlib
 import os
+import random
+import sqlite3
+import time
+import zlib
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone
 from dotenv import load_dotenv
 import json
+from utils.logging import get_logger
+from utils.cache import LRUCache, LRUSet, TTLCache
+from utils.catalog_index import CatalogIndex
+from database.play_counter import PlayCounter
+from database.play_compactor import PlayEventCompactor
+from database.leaderboard_cache import LeaderboardCache
+from database import sqlite_backend
+from database import query_tracer
 
 # Load environment variables from the .env file
 load_dotenv()
 
+logger = get_logger(__name__)
+
+# Storage backend: 'mysql' (default) or 'sqlite' for an embedded database file
+DB_BACKEND = os.getenv('DB_BACKEND', 'mysql').lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'music_monkey.db')
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', 4))
+
 # Define MySQL configuration
 MYSQL_CONFIG = {
     'host': 'us.mysql.db.bot-hosting.net',
@@ -22,125 +45,242 @@ MYSQL_CONFIG = {
     'autocommit': True
 }
 
+# Define connection pool configuration
+MYSQL_POOL_CONFIG = {
+    'minsize': int(os.getenv('MYSQL_POOL_MINSIZE', 2)),
+    'maxsize': int(os.getenv('MYSQL_POOL_MAXSIZE', 10)),
+    'pool_recycle': int(os.getenv('MYSQL_POOL_RECYCLE', 3600))
+}
 
-# Setup database
-async def setup_database():
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
-        async with conn.cursor() as cur:
-            await cur.execute('''
-            CREATE TABLE IF NOT EXISTS guilds (
-                guild_id BIGINT NOT NULL,
-                dj_only_enabled BOOLEAN DEFAULT 0,
-                dj_role_id BIGINT,
-                restricted_commands TEXT DEFAULT NULL,
-                updates_enabled TINYINT DEFAULT 1,
-                updates_channel_id BIGINT,
-                PRIMARY KEY (guild_id)
-            );
-            CREATE TABLE IF NOT EXISTS songs (
-                song_id VARCHAR(255) NOT NULL,
-                name VARCHAR(255) NOT NULL,
-                artist VARCHAR(255) NOT NULL,
-                length INT NOT NULL,
-                uri VARCHAR(255) NOT NULL,
-                PRIMARY KEY (song_id)
-            );
-            CREATE TABLE IF NOT EXISTS users (
-                user_id BIGINT NOT NULL,
-                guild_id BIGINT NOT NULL,
-                PRIMARY KEY (user_id, guild_id),
-                FOREIGN KEY (guild_id) REFERENCES guilds(guild_id)
-            );
-            CREATE TABLE IF NOT EXISTS plays (
-                user_id BIGINT NOT NULL,
-                guild_id BIGINT NOT NULL,
-                song_id VARCHAR(255) NOT NULL,
-                count INT,
-                PRIMARY KEY (user_id, guild_id, song_id),
-                FOREIGN KEY (user_id, guild_id) REFERENCES users(user_id, guild_id),
-                FOREIGN KEY (song_id) REFERENCES songs(song_id)
-            );
-            CREATE TABLE IF NOT EXISTS wonderTrades (
-                user_id BIGINT NOT NULL,
-                song_id VARCHAR(255) NOT NULL,
-                note VARCHAR(60),
-                PRIMARY KEY (user_id, song_id),
-                FOREIGN KEY (user_id) REFERENCES users(user_id),
-                FOREIGN KEY (song_id) REFERENCES songs(song_id)
-            );
-            CREATE TABLE IF NOT EXISTS playlists (
-                playlist_id INT AUTO_INCREMENT PRIMARY KEY,
-                user_id BIGINT NOT NULL,
-                guild_id BIGINT NOT NULL,
-                name VARCHAR(255) NOT NULL,
-                privacy TINYINT NOT NULL,
-                collaborators TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(user_id),
-                FOREIGN KEY (guild_id) REFERENCES guilds(guild_id)
-            );
-            CREATE TABLE IF NOT EXISTS playlist_songs (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                playlist_id INT NOT NULL,
-                song_id VARCHAR(255) NOT NULL,
-                song_name VARCHAR(255) NOT NULL,
-                artist VARCHAR(255) NOT NULL,
-                raw_data JSON NOT NULL,
-                FOREIGN KEY (playlist_id) REFERENCES playlists(playlist_id)
-            );
-            CREATE TABLE IF NOT EXISTS playlist_invites (
-                invite_id INT AUTO_INCREMENT PRIMARY KEY,
-                playlist_id INT NOT NULL,
-                invitee_id BIGINT NOT NULL,
-                FOREIGN KEY (playlist_id) REFERENCES playlists(playlist_id)
-            );
-            ''')
-            await conn.commit()
+# Seconds to wait for a free pooled connection before giving up
+MYSQL_ACQUIRE_TIMEOUT = float(os.getenv('MYSQL_ACQUIRE_TIMEOUT', 10))
+
+# Seconds between play count flushes, and the number of pending rows that triggers an early flush
+PLAY_FLUSH_INTERVAL = float(os.getenv('PLAY_FLUSH_INTERVAL', 5))
+PLAY_FLUSH_MAX_PENDING = int(os.getenv('PLAY_FLUSH_MAX_PENDING', 500))
+
+# Flushes failing with a data error in a row after which pending plays are written one row at a time and
+# the rejected rows dropped, and the most seconds a failed flush waits before it is retried
+PLAY_FLUSH_MAX_RETRIES = int(os.getenv('PLAY_FLUSH_MAX_RETRIES', 5))
+PLAY_FLUSH_MAX_BACKOFF = float(os.getenv('PLAY_FLUSH_MAX_BACKOFF', 300))
+
+# Errors for a row the database rejects, as opposed to the database being unreachable or overloaded
+DATA_ERRORS = (aiomysql.IntegrityError, aiomysql.DataError, sqlite3.IntegrityError, sqlite3.DataError)
+
+# Seconds between play event compactions, the number of events rolled up per transaction,
+# and how many months of play_events partitions are created ahead of time
+PLAY_COMPACT_INTERVAL = float(os.getenv('PLAY_COMPACT_INTERVAL', 60))
+PLAY_COMPACT_BATCH = int(os.getenv('PLAY_COMPACT_BATCH', 5000))
+PLAY_EVENT_MONTHS_AHEAD = int(os.getenv('PLAY_EVENT_MONTHS_AHEAD', 2))
+
+# Number of leaderboard entries kept in memory per guild, and the seconds a guild's entries stay valid,
+# as a safety net for rebuilds made outside this process (python -m database.manage rebuild-leaderboard)
+LEADERBOARD_CACHE_SIZE = int(os.getenv('LEADERBOARD_CACHE_SIZE', 100))
+LEADERBOARD_CACHE_TTL = float(os.getenv('LEADERBOARD_CACHE_TTL', 300))
+# Number of guilds whose leaderboard is kept in memory
+LEADERBOARD_CACHE_GUILDS = int(os.getenv('LEADERBOARD_CACHE_GUILDS', 1000))
+
+# Number of decoded playlist tracks kept in memory
+TRACK_CACHE_SIZE = int(os.getenv('TRACK_CACHE_SIZE', 2000))
+
+# Random slots looked up for a wondertrade before falling back to the first trade after a random slot
+WONDER_TRADE_PICK_ATTEMPTS = 8
+
+# Number of stored tracks checked per statement when deleting the ones no playlist uses anymore
+TRACK_DELETE_BATCH = 1000
+
+# Number of playlist songs read per batch when removing duplicates
+PLAYLIST_DEDUPE_BATCH = 1000
+
+# Number of guild, user and song keys remembered as already stored, per kind
+KNOWN_ENTITY_CACHE_SIZE = int(os.getenv('KNOWN_ENTITY_CACHE_SIZE', 10000))
+
+# Number of played songs, the most recently entered first, that /play autocomplete can answer from
+# memory, and the number of songs read per batch when loading them
+CATALOG_INDEX_SIZE = int(os.getenv('CATALOG_INDEX_SIZE', 20000))
+CATALOG_LOAD_BATCH = 5000
+
+# Seconds a cached guilds row stays valid, as a safety net for writes made outside this process,
+# and the number of guilds whose settings are kept in memory
+GUILD_SETTINGS_TTL = float(os.getenv('GUILD_SETTINGS_TTL', 300))
+GUILD_SETTINGS_CACHE_SIZE = int(os.getenv('GUILD_SETTINGS_CACHE_SIZE', 10000))
+
+# Settings used for guilds that have no row yet
+DEFAULT_GUILD_SETTINGS = {
+    'dj_only_enabled': 0,
+    'dj_role_id': None,
+    'restricted_commands': None,
+    'updates_enabled': 1,
+    'updates_channel_id': None
+}
+
+_guild_settings_cache = TTLCache(GUILD_SETTINGS_CACHE_SIZE, GUILD_SETTINGS_TTL)
+_guild_settings_versions = {}  # guild_id -> number of times its settings were written by this process
+leaderboard_cache = LeaderboardCache(LEADERBOARD_CACHE_SIZE, LEADERBOARD_CACHE_TTL, LEADERBOARD_CACHE_GUILDS)
+_track_cache = LRUCache(TRACK_CACHE_SIZE)  # track_hash -> decoded track
+
+# Keys known to exist in guilds, users and songs. None of these rows are ever deleted, so a key
+# stays valid once seen and enter_guild/enter_user/enter_song can skip the database entirely.
+known_guilds = LRUSet(KNOWN_ENTITY_CACHE_SIZE)
+known_users = LRUSet(KNOWN_ENTITY_CACHE_SIZE)
+known_songs = LRUSet(KNOWN_ENTITY_CACHE_SIZE)
+# song_id -> song_key. A song's surrogate key never changes once assigned.
+song_keys = LRUCache(KNOWN_ENTITY_CACHE_SIZE)
+# Played songs searchable by title and artist, filled by load_song_catalog and kept fresh by enter_song(s)
+song_catalog = CatalogIndex(CATALOG_INDEX_SIZE)
+_pool = None
+_pool_lock = asyncio.Lock()
+_pool_stats = {
+    'acquired': 0,
+    'timeouts': 0,
+    'total_wait': 0.0,
+    'max_wait': 0.0
+}
+
+
+# Creates the process-wide connection pool. Called once from the bot's setup_hook.
+async def init_pool():
+    global _pool
+    async with _pool_lock:
+        if _pool is None and DB_BACKEND == 'sqlite':
+            _pool = await sqlite_backend.create_pool(SQLITE_PATH, size=SQLITE_POOL_SIZE)
+            logger.info(f"SQLite database opened at {SQLITE_PATH} ({_pool.size} connections).")
+        elif _pool is None:
+            _pool = await aiomysql.create_pool(**MYSQL_CONFIG, **MYSQL_POOL_CONFIG)
+            logger.info(f"MySQL pool created (min={MYSQL_POOL_CONFIG['minsize']}, "
+                        f"max={MYSQL_POOL_CONFIG['maxsize']}).")
+    return _pool
+
+
+# Closes the connection pool, waiting for connections in use to be released.
+async def close_pool():
+    global _pool
+    async with _pool_lock:
+        if _pool is not None:
+            logger.info(f"Closing {DB_BACKEND} pool. Usage stats: {get_pool_stats()}")
+            _pool.close()
+            await _pool.wait_closed()
+            _pool = None
+
+
+# Returns a comma-separated list of %s placeholders, one per value.
+def placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+# Borrows a connection from the pool for the duration of the block.
+@asynccontextmanager
+async def acquire():
+    pool = _pool or await init_pool()
+    started = time.perf_counter()
+    try:
+        conn = await asyncio.wait_for(pool.acquire(), timeout=MYSQL_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        _pool_stats['timeouts'] += 1
+        logger.error(f"Timed out after {MYSQL_ACQUIRE_TIMEOUT}s waiting for a database connection. "
+                     f"Pool stats: {get_pool_stats()}")
+        raise
+    waited = time.perf_counter() - started
+    _pool_stats['acquired'] += 1
+    _pool_stats['total_wait'] += waited
+    _pool_stats['max_wait'] = max(_pool_stats['max_wait'], waited)
+    try:
+        yield query_tracer.wrap(conn)  # Reports the queries to the running command's trace, if any
+    finally:
+        pool.release(conn)
+
+
+# Yields conn if one is given, such as the connection a migration runs on, and a pooled one otherwise.
+# Lets code that runs inside a migration avoid waiting for a second connection, which an in-memory
+# SQLite database does not have.
+@asynccontextmanager
+async def use_connection(conn=None):
+    if conn is not None:
+        yield conn
+        return
+    async with acquire() as pooled:
+        yield pooled
+
+
+# Returns a snapshot of the pool's size and usage counters.
+def get_pool_stats():
+    acquired = _pool_stats['acquired']
+    return {
+        'size': _pool.size if _pool else 0,
+        'free': _pool.freesize if _pool else 0,
+        'backend': DB_BACKEND,
+        'minsize': MYSQL_POOL_CONFIG['minsize'] if DB_BACKEND == 'mysql' else SQLITE_POOL_SIZE,
+        'maxsize': MYSQL_POOL_CONFIG['maxsize'] if DB_BACKEND == 'mysql' else SQLITE_POOL_SIZE,
+        'acquired': acquired,
+        'timeouts': _pool_stats['timeouts'],
+        'avg_wait_ms': round(_pool_stats['total_wait'] / acquired * 1000, 2) if acquired else 0.0,
+        'max_wait_ms': round(_pool_stats['max_wait'] * 1000, 2)
+    }
+
+
+# Returns the whole guilds row for the given guild, served from an in-process cache.
+# The cache entry is dropped by every setter below, so reads normally cost no round trip.
+# Callers get their own copy of the settings, so changing it cannot alter the cached entry.
+async def get_guild_settings(guild_id):
+    cached = _guild_settings_cache.get(guild_id)
+    if cached is not None:
+        return dict(cached)
+
+    version = _guild_settings_versions.get(guild_id, 0)
+    async with acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            await cur.execute(
+                'SELECT dj_only_enabled, dj_role_id, restricted_commands, updates_enabled, updates_channel_id '
+                'FROM guilds WHERE guild_id = %s', (guild_id,))
+            row = await cur.fetchone()
+
+    settings = dict(row) if row else dict(DEFAULT_GUILD_SETTINGS)
+    # A setter that invalidated the guild during the read may have written after it, so the row is
+    # only cached if none did
+    if _guild_settings_versions.get(guild_id, 0) == version:
+        _guild_settings_cache.set(guild_id, settings)
+    return dict(settings)
+
+
+# Drops the cached settings of a guild after its row has been written.
+def invalidate_guild_settings(guild_id):
+    _guild_settings_cache.pop(guild_id)
+    _guild_settings_versions[guild_id] = _guild_settings_versions.get(guild_id, 0) + 1
 
 
 async def get_dj_only_enabled(guild_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
-        async with conn.cursor() as cur:
-            await cur.execute('SELECT dj_only_enabled FROM guilds WHERE guild_id = %s', (guild_id,))
-            result = await cur.fetchone()
-            if result is None:
-                return False
-            return bool(result[0])
+    settings = await get_guild_settings(guild_id)
+    return bool(settings['dj_only_enabled'])
 
 
 async def set_dj_only_enabled(guild_id, dj_only):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute('UPDATE guilds SET dj_only_enabled = %s WHERE guild_id = %s', (dj_only, guild_id))
             await conn.commit()
+    invalidate_guild_settings(guild_id)
 
 
 async def get_dj_role(guild_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
-        async with conn.cursor() as cur:
-            await cur.execute('SELECT dj_role_id FROM guilds WHERE guild_id = %s', guild_id)
-            result = await cur.fetchone()
-            return result[0] if result else None
+    settings = await get_guild_settings(guild_id)
+    return settings['dj_role_id']
 
 
 async def set_dj_role(guild_id, role_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute('UPDATE guilds SET dj_role_id = %s WHERE guild_id = %s', (role_id, guild_id))
             await conn.commit()
+    invalidate_guild_settings(guild_id)
 
 
 async def get_restricted_commands(guild_id: int):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
-        async with conn.cursor() as cur:
-            await cur.execute('SELECT restricted_commands FROM guilds WHERE guild_id=%s', (guild_id,))
-            result = await cur.fetchone()
-            if result:
-                return result[0]  # Assuming the field contains a list or string of commands
-            return None
+    settings = await get_guild_settings(guild_id)
+    return settings['restricted_commands']  # Comma-separated string of commands, or None
 
 
 async def add_restricted_command(guild_id: int, command: str):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute('SELECT restricted_commands FROM guilds WHERE guild_id=%s', (guild_id,))
             result = await cur.fetchone()
@@ -160,10 +300,11 @@ async def add_restricted_command(guild_id: int, command: str):
                 await cur.execute('INSERT INTO guilds (guild_id, restricted_commands) VALUES (%s, %s)',
                                   (guild_id, command))
             await conn.commit()
+    invalidate_guild_settings(guild_id)
 
 
 async def remove_restricted_command(guild_id: int, command: str):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute('SELECT restricted_commands FROM guilds WHERE guild_id=%s', (guild_id,))
             result = await cur.fetchone()
@@ -177,56 +318,137 @@ async def remove_restricted_command(guild_id: int, command: str):
                         await cur.execute('UPDATE guilds SET restricted_commands=%s WHERE guild_id=%s',
                                           (commands, guild_id))
                         await conn.commit()
+    invalidate_guild_settings(guild_id)
 
 
-# Checks if a given guild_id is in the guilds table.
+# Makes sure a given guild_id is in the guilds table, with a single idempotent upsert.
 async def enter_guild(guild_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
-        async with conn.cursor(aiomysql.DictCursor) as cur:
-            await cur.execute("SELECT guild_id FROM guilds WHERE guild_id = %s", guild_id)
-            guild = await cur.fetchall()
-            if not guild:
-                await cur.execute("INSERT INTO guilds (guild_id, dj_only_enabled, dj_role_id) VALUES (%s, 0, NULL)",
-                                  guild_id)
-                await conn.commit()
+    if guild_id in known_guilds:
+        return
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute('INSERT INTO guilds (guild_id) VALUES (%s) ON DUPLICATE KEY UPDATE guild_id = guild_id',
+                              (guild_id,))
+            await conn.commit()
+    known_guilds.add(guild_id)
 
 
-# Checks if a given user_id is in the users table, associated with the given guild_id.
+# Makes sure a given user_id is in the users table, associated with the given guild_id.
 async def enter_user(user_id, guild_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
-        async with conn.cursor(aiomysql.DictCursor) as cur:
-            await cur.execute("SELECT user_id, guild_id FROM users WHERE  user_id = %s AND guild_id = %s",
-                              (user_id, guild_id))
-            user = await cur.fetchall()
-            if not user:
-                await cur.execute("INSERT INTO users (user_id, guild_id) VALUES (%s, %s)", (user_id, guild_id))
-                await conn.commit()
+    if (user_id, guild_id) in known_users:
+        return
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                'INSERT INTO users (user_id, guild_id) VALUES (%s, %s) ON DUPLICATE KEY UPDATE user_id = user_id',
+                (user_id, guild_id))
+            await conn.commit()
+    known_users.add((user_id, guild_id))
+
+
+# Streaming services recognised in track URIs, checked in this order. Anything else is stored as 'Other'.
+SONG_SOURCES = ('YouTube', 'SoundCloud', 'Spotify', 'Deezer')
+
+
+# Returns the streaming service a track URI belongs to.
+def song_source(uri):
+    lowered = (uri or '').lower()
+    for source in SONG_SOURCES:
+        if source.lower() in lowered:
+            return source
+    return 'Other'
 
 
 # Tries to enter a given song into the songs table. If the song already exists, nothing happens.
+# The track's source is classified once here, so stats never have to look at URIs again.
 async def enter_song(song_id, name, artist, length, uri):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    if song_id in known_songs:
+        return
+    async with acquire() as conn:
         async with conn.cursor() as cur:
-            await cur.execute('SELECT song_id FROM songs WHERE song_id = %s', song_id)
-            result = await cur.fetchone()
-            if not result:
-                await cur.execute('INSERT INTO songs (song_id, name, artist, length, uri) VALUES (%s, %s, %s, %s, %s)',
-                                  (song_id, name, artist, length, uri))
-                await conn.commit()
+            await cur.execute(
+                'INSERT INTO songs (song_id, name, artist, length, uri, source) VALUES (%s, %s, %s, %s, %s, %s) '
+                'ON DUPLICATE KEY UPDATE song_id = song_id',
+                (song_id, name, artist, length, uri, song_source(uri)))
+            await conn.commit()
+    known_songs.add(song_id)
+    song_catalog.add(name, artist, uri)
+
+
+# Enters many songs at once with a single multi-row INSERT IGNORE; songs that already exist are left as they are.
+# rows are (song_id, name, artist, length, uri) tuples.
+async def enter_songs(rows):
+    rows = [row for song_id, row in {row[0]: row for row in rows}.items() if song_id not in known_songs]
+    if not rows:
+        return
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.executemany(
+                'INSERT IGNORE INTO songs (song_id, name, artist, length, uri, source) VALUES (%s, %s, %s, %s, %s, %s)',
+                [(song_id, name, artist, length, uri, song_source(uri)) for song_id, name, artist, length, uri in rows])
+            await conn.commit()
+    known_songs.update(row[0] for row in rows)
+    for _, name, artist, _, uri in rows:
+        song_catalog.add(name, artist, uri)
+
+
+# Fills the song catalog with the most recently entered songs, walking songs backwards by song_key.
+# They are added oldest first, so the catalog drops the oldest songs first once it is full.
+async def load_song_catalog(batch_size=CATALOG_LOAD_BATCH):
+    rows = []
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            while len(rows) < song_catalog.maxsize:
+                limit = min(batch_size, song_catalog.maxsize - len(rows))
+                if rows:
+                    await cur.execute('SELECT song_key, name, artist, uri FROM songs WHERE song_key < %s '
+                                      'ORDER BY song_key DESC LIMIT %s', (rows[-1][0], limit))
+                else:
+                    await cur.execute('SELECT song_key, name, artist, uri FROM songs '
+                                      'ORDER BY song_key DESC LIMIT %s', (limit,))
+                batch = await cur.fetchall()
+                if not batch:
+                    break
+                rows.extend(batch)
+    for _, name, artist, uri in reversed(rows):
+        song_catalog.add(name, artist, uri)
+    logger.info(f"Loaded {len(song_catalog)} songs into the song catalog.")
+
+
+# Maps Lavalink song_ids to their integer song_key, asking the database only for ids not in the cache.
+# Songs that were never entered are missing from the result.
+async def resolve_song_keys(cur, song_ids):
+    keys, missing = {}, []
+    for song_id in set(song_ids):
+        key = song_keys.get(song_id)
+        if key is None:
+            missing.append(song_id)
+        else:
+            keys[song_id] = key
+    if missing:
+        await cur.execute(f'SELECT song_id, song_key FROM songs WHERE song_id IN ({placeholders(missing)})', missing)
+        for song_id, key in await cur.fetchall():
+            song_keys.set(song_id, key)
+            keys[song_id] = key
+    return keys
 
 
 # Tries to enter a given wonder trade into the wonderTrades table. If the song has already been recommended, nothing happens. If the user has already recommended a song, nothing happens.
+# The trade gets a slot of its own from the counter, so concurrent submitters never take the same one.
 async def enter_wonder_trade(user_id, song_id, note):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute('SELECT user_id FROM wonderTrades WHERE user_id = %s', user_id)
             result = await cur.fetchone()
             if not result:
-                await cur.execute('SELECT song_id FROM wonderTrades WHERE song_id = %s', song_id)
+                song_key = (await resolve_song_keys(cur, [song_id]))[song_id]
+                await cur.execute('SELECT song_key FROM wonderTrades WHERE song_key = %s', song_key)
                 result = await cur.fetchone()
                 if not result:
-                    await cur.execute('INSERT INTO wonderTrades (song_id, user_id, note) VALUES (%s, %s, %s)',
-                                      (song_id, user_id, note))
+                    slot = await next_wonder_trade_slot(cur)
+                    await cur.execute(
+                        'INSERT INTO wonderTrades (song_key, user_id, note, slot) VALUES (%s, %s, %s, %s)',
+                        (song_key, user_id, note, slot))
                     await conn.commit()
                     return 'Your recommendation has been submitted!'
                 else:
@@ -242,112 +464,600 @@ async def submit_wonder_trade(song_id, name, artist, length, uri, user_id, note)
     return await enter_wonder_trade(user_id, song_id, note)
 
 
+# Returns the next unused wondertrade slot. The counter row is bumped in a statement of its own, so its
+# lock is released at once; a slot whose insert then fails is simply never used.
+async def next_wonder_trade_slot(cur):
+    if DB_BACKEND == 'sqlite':
+        await cur.execute('UPDATE wonder_trade_slots SET last_slot = last_slot + 1 WHERE id = 1 RETURNING last_slot')
+        (slot,) = await cur.fetchone()
+        return slot
+    # LAST_INSERT_ID(expr) hands the new value back to this connection without a second read
+    await cur.execute('UPDATE wonder_trade_slots SET last_slot = LAST_INSERT_ID(last_slot + 1) WHERE id = 1')
+    return cur.lastrowid
+
+
 # Sends a recommendation to the user.
+# A random trade is picked by looking up random slots between the lowest and highest in use instead of
+# sorting the table, and it is claimed (deleted) in the same transaction. Every lookup hits each trade
+# with the same chance, so the first one found is a uniform pick. Claimed trades leave gaps, so when
+# WONDER_TRADE_PICK_ATTEMPTS lookups all miss, the first trade after a random slot is taken instead.
+# SKIP LOCKED lets concurrent receivers pass over trades someone else is claiming, so no trade is handed
+# out twice and receivers do not wait on each other; on SQLite the write-locking transaction does the same.
 async def receive_wonder_trade(user_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
-            await cur.execute('SELECT COUNT(*) FROM wonderTrades WHERE user_id != %s', (user_id,))
-            count = await cur.fetchone()
-            if count and count[0] != 0:
-                await cur.execute(
-                    'SELECT s.uri, wt.note FROM songs AS s JOIN wonderTrades AS wt ON wt.song_id = s.song_id WHERE wt.user_id != %s ORDER BY RAND() LIMIT 1',
-                    (user_id,))
-                result = await cur.fetchone()
-                if result:
-                    return result[0], result[1]
-            return '_There are no available wondertrades available at this moment. Try again later!', None
+            await cur.execute('SELECT MIN(slot), MAX(slot) FROM wonderTrades')
+            low, high = await cur.fetchone()
+            if low is None:
+                return '_There are no available wondertrades available at this moment. Try again later!', None
+
+            await conn.begin()
+            try:
+                trade = None
+                for _ in range(WONDER_TRADE_PICK_ATTEMPTS):
+                    await cur.execute(
+                        'SELECT wt.slot, s.uri, wt.note FROM wonderTrades AS wt '
+                        'JOIN songs AS s ON wt.song_key = s.song_key '
+                        'WHERE wt.slot = %s AND wt.user_id != %s FOR UPDATE OF wt SKIP LOCKED',
+                        (random.randint(low, high), user_id))
+                    trade = await cur.fetchone()
+                    if trade:
+                        break
+
+                if not trade:
+                    # Take the first trade at or after a random slot, wrapping around to the ones before it
+                    pivot = random.randint(low, high)
+                    for condition, order in (('>=', 'ASC'), ('<', 'DESC')):
+                        await cur.execute(
+                            'SELECT wt.slot, s.uri, wt.note FROM wonderTrades AS wt '
+                            'JOIN songs AS s ON wt.song_key = s.song_key '
+                            f'WHERE wt.slot {condition} %s AND wt.user_id != %s '
+                            f'ORDER BY wt.slot {order} LIMIT 1 FOR UPDATE OF wt SKIP LOCKED',
+                            (pivot, user_id))
+                        trade = await cur.fetchone()
+                        if trade:
+                            break
+
+                if not trade:
+                    await conn.rollback()
+                    return '_There are no available wondertrades available at this moment. Try again later!', None
+
+                slot, uri, note = trade
+                await cur.execute('DELETE FROM wonderTrades WHERE slot = %s', (slot,))
+                await conn.commit()
+                return uri, note
+            except Exception:
+                await conn.rollback()
+                raise
 
 
 # Deletes a wonder trade based on the song URI.
 async def delete_wonder_trade(uri):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute(
-                'DELETE wonderTrades FROM wonderTrades JOIN songs ON wonderTrades.song_id = songs.song_id WHERE songs.uri = %s',
-                uri)
+                'DELETE FROM wonderTrades WHERE song_key IN (SELECT song_key FROM songs WHERE uri = %s)', (uri,))
             await conn.commit()
 
 
+# Increments the play counts of many songs for one user in one guild, e.g. when a playlist is queued.
+def increment_plays_bulk(user_id, song_ids, guild_id):
+    for song_id in song_ids:
+        play_counter.add(user_id, guild_id, song_id)
+
+
 # Increments the play count for the given song, for the given user, in the given guild.
+# The increment is buffered in memory and written in batches by play_counter.
 async def increment_plays(user_id, song_id, guild_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
-        async with conn.cursor() as cur:
-            # Ensure the guild exists
-            await enter_guild(guild_id)
+    play_counter.add(user_id, guild_id, song_id)
 
-            # Ensure the user exists
-            await enter_user(user_id, guild_id)
 
-            # Check if the play record exists
-            await cur.execute('SELECT count FROM plays WHERE user_id = %s AND song_id = %s AND guild_id = %s',
-                              (user_id, song_id, guild_id))
-            result = await cur.fetchone()
-            if result:
-                new_count = result[0] + 1
-                await cur.execute('UPDATE plays SET count = %s WHERE user_id = %s AND song_id = %s AND guild_id = %s',
-                                  (new_count, user_id, song_id, guild_id))
-            else:
-                await cur.execute('INSERT INTO plays (user_id, song_id, guild_id, count) VALUES (%s, %s, %s, 1)',
-                                  (user_id, song_id, guild_id))
+# Records a track started by /play: stores the song if it is new and counts the play. This is all of
+# /play's database work after its restriction check, and database.manage check-query-budgets holds
+# it to the command's query budget.
+async def record_play(user_id, guild_id, song_id, name, artist, length, uri):
+    await enter_song(song_id, name, artist, length, uri)
+    await increment_plays(user_id, song_id, guild_id)
 
+
+# Writes a batch of buffered play counts, keyed by (user_id, guild_id, song_id), in one transaction,
+# and appends the individual (user_id, guild_id, song_id, played_at) events to the play event log.
+# The play tables store the song's integer song_key, so the Lavalink ids are resolved first.
+async def flush_plays(batch, events=()):
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            keys = await resolve_song_keys(cur, [song_id for _, _, song_id in batch])
+        # A song that was never entered has no key; its plays cannot be stored and are dropped
+        unknown = {song_id for _, _, song_id in batch if song_id not in keys}
+        if unknown:
+            logger.warning(f"Dropping plays of {len(unknown)} songs missing from the songs table: {sorted(unknown)[:5]}")
+        rows = [(user_id, guild_id, keys[song_id], count)
+                for (user_id, guild_id, song_id), count in batch.items() if song_id in keys]
+        events = [(user_id, guild_id, keys[song_id], played_at)
+                  for user_id, guild_id, song_id, played_at in events if song_id in keys]
+        if not rows:
+            return
+        # Guilds and users already known to exist need no upsert
+        guild_ids = {(guild_id,) for _, guild_id, _, _ in rows if guild_id not in known_guilds}
+        users = {(user_id, guild_id) for user_id, guild_id, _, _ in rows if (user_id, guild_id) not in known_users}
+
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                # executemany() sends each of these as a single multi-row INSERT
+                if guild_ids:
+                    await cur.executemany(
+                        'INSERT INTO guilds (guild_id) VALUES (%s) ON DUPLICATE KEY UPDATE guild_id = guild_id',
+                        list(guild_ids))
+                if users:
+                    await cur.executemany(
+                        'INSERT INTO users (user_id, guild_id) VALUES (%s, %s) ON DUPLICATE KEY UPDATE user_id = user_id',
+                        list(users))
+                await cur.executemany(
+                    'INSERT INTO plays (user_id, guild_id, song_key, count) VALUES (%s, %s, %s, %s) '
+                    'ON DUPLICATE KEY UPDATE count = count + VALUES(count)',
+                    rows)
+                await update_user_stats(cur, rows)
+                leaderboard_totals = await update_guild_leaderboard(cur, rows)
+                await record_play_events(cur, events)
             await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+
+    # Guilds that were not loaded when the totals were read may have been loaded since, from totals that
+    # did not include this flush yet; dropping them makes the next read load them again
+    updated = set()
+    for guild_id, user_id, plays in leaderboard_totals:
+        leaderboard_cache.update(guild_id, user_id, plays)
+        updated.add(guild_id)
+    for guild_id in {guild_id for _, guild_id, _, _ in rows} - updated:
+        leaderboard_cache.invalidate(guild_id)
+    known_guilds.update(guild_id for (guild_id,) in guild_ids)
+    known_users.update(users)
+
+
+# Appends (user_id, guild_id, song_key, played_at) play events to the play_events log, tagged with
+# each song's source. Events are only ever inserted by the play flush, one transaction at a time,
+# so event_ids commit in order.
+async def record_play_events(cur, events):
+    if not events:
+        return
+    keys = list({song_key for _, _, song_key, _ in events})
+    await cur.execute(f'SELECT song_key, source FROM songs WHERE song_key IN ({placeholders(keys)})', keys)
+    sources = dict(await cur.fetchall())
+    await cur.executemany(
+        'INSERT INTO play_events (played_at, user_id, guild_id, song_key, source) VALUES (%s, %s, %s, %s, %s)',
+        [(played_at.strftime('%Y-%m-%d %H:%M:%S'), user_id, guild_id, song_key, sources.get(song_key, 'Other'))
+         for user_id, guild_id, song_key, played_at in events])
+
+
+# Adds a batch of play increments to guild_leaderboard and returns the new (guild_id, user_id, plays)
+# totals of the affected users in guilds whose leaderboard is cached, so the cache can be updated after commit.
+async def update_guild_leaderboard(cur, rows):
+    increments = {}
+    for user_id, guild_id, _, count in rows:
+        increments[(guild_id, user_id)] = increments.get((guild_id, user_id), 0) + count
+    await cur.executemany(
+        'INSERT INTO guild_leaderboard (guild_id, user_id, plays) VALUES (%s, %s, %s) '
+        'ON DUPLICATE KEY UPDATE plays = plays + VALUES(plays)',
+        [(guild_id, user_id, count) for (guild_id, user_id), count in increments.items()])
+
+    cached = [key for key in increments if leaderboard_cache.is_loaded(key[0])]
+    if not cached:
+        return []
+    await cur.execute(
+        f"SELECT guild_id, user_id, plays FROM guild_leaderboard WHERE (guild_id, user_id) IN "
+        f"({', '.join(['(%s, %s)'] * len(cached))})",
+        [value for key in cached for value in key])
+    return await cur.fetchall()
+
+
+# Applies a batch of (user_id, guild_id, song_key, count) play increments to the user_stats rollup
+# and its per-artist and per-song tallies, then refreshes the top artist and song of those users.
+async def update_user_stats(cur, rows):
+    keys = list({song_key for _, _, song_key, _ in rows})
+    await cur.execute(f'SELECT song_key, artist, length FROM songs WHERE song_key IN ({placeholders(keys)})', keys)
+    songs = {song_key: (artist, length) for song_key, artist, length in await cur.fetchall()}
+
+    totals, artist_plays, song_plays = {}, {}, {}
+    for user_id, _, song_key, count in rows:
+        artist, length = songs.get(song_key, (None, 0))
+        plays, ms = totals.get(user_id, (0, 0))
+        totals[user_id] = (plays + count, ms + count * length)
+        song_plays[(user_id, song_key)] = song_plays.get((user_id, song_key), 0) + count
+        if artist is not None:
+            artist_plays[(user_id, artist)] = artist_plays.get((user_id, artist), 0) + count
+
+    await cur.executemany(
+        'INSERT INTO user_song_plays (user_id, song_key, plays) VALUES (%s, %s, %s) '
+        'ON DUPLICATE KEY UPDATE plays = plays + VALUES(plays)',
+        [(user_id, song_key, count) for (user_id, song_key), count in song_plays.items()])
+    if artist_plays:
+        await cur.executemany(
+            'INSERT INTO user_artist_plays (user_id, artist, plays) VALUES (%s, %s, %s) '
+            'ON DUPLICATE KEY UPDATE plays = plays + VALUES(plays)',
+            [(user_id, artist, count) for (user_id, artist), count in artist_plays.items()])
+    await cur.executemany(
+        'INSERT INTO user_stats (user_id, total_plays, total_ms) VALUES (%s, %s, %s) '
+        'ON DUPLICATE KEY UPDATE total_plays = total_plays + VALUES(total_plays), total_ms = total_ms + VALUES(total_ms)',
+        [(user_id, plays, ms) for user_id, (plays, ms) in totals.items()])
+    await refresh_user_top_entries(cur, list(totals))
+
+
+# Recomputes top_artist and top_song of the given users (or of everyone) from the per-user tallies.
+# Both lookups are index seeks on (user_id, plays).
+async def refresh_user_top_entries(cur, user_ids=None):
+    query = '''
+        UPDATE user_stats SET
+            top_artist = (SELECT uap.artist FROM user_artist_plays AS uap
+                          WHERE uap.user_id = user_stats.user_id ORDER BY uap.plays DESC LIMIT 1),
+            top_song = (SELECT s.name FROM user_song_plays AS usp JOIN songs AS s ON s.song_key = usp.song_key
+                        WHERE usp.user_id = user_stats.user_id ORDER BY usp.plays DESC LIMIT 1)
+    '''
+    if user_ids is None:
+        await cur.execute(query)
+    else:
+        await cur.execute(query + f'WHERE user_id IN ({placeholders(user_ids)})', user_ids)
+
+
+# Rebuilds the user_stats rollup and its tallies from the plays table, for one user or for everyone.
+# Migrations pass their own connection as conn.
+async def rebuild_user_stats(user_id=None, conn=None):
+    where = 'WHERE p.user_id = %s' if user_id is not None else ''
+    params = (user_id,) if user_id is not None else ()
+
+    # Keep the play counter from flushing into the tables while they are being rebuilt
+    async with play_counter.paused():
+        async with use_connection(conn) as conn:
+            await conn.begin()
+            try:
+                async with conn.cursor() as cur:
+                    for table in ('user_song_plays', 'user_artist_plays', 'user_stats'):
+                        await cur.execute(f'DELETE FROM {table}' + (' WHERE user_id = %s' if params else ''), params)
+                    await cur.execute(
+                        'INSERT INTO user_song_plays (user_id, song_key, plays) '
+                        f'SELECT p.user_id, p.song_key, SUM(p.count) FROM plays AS p {where} '
+                        'GROUP BY p.user_id, p.song_key', params)
+                    await cur.execute(
+                        'INSERT INTO user_artist_plays (user_id, artist, plays) '
+                        'SELECT p.user_id, s.artist, SUM(p.count) FROM plays AS p '
+                        f'JOIN songs AS s ON s.song_key = p.song_key {where} '
+                        'GROUP BY p.user_id, s.artist', params)
+                    await cur.execute(
+                        'INSERT INTO user_stats (user_id, total_plays, total_ms) '
+                        'SELECT p.user_id, SUM(p.count), SUM(p.count * s.length) FROM plays AS p '
+                        f'JOIN songs AS s ON s.song_key = p.song_key {where} '
+                        'GROUP BY p.user_id', params)
+                    await refresh_user_top_entries(cur, [user_id] if user_id is not None else None)
+                    await cur.execute('SELECT COUNT(*) FROM user_stats')
+                    (users,) = await cur.fetchone()
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+    logger.info(f"Rebuilt user stats for {'user ' + str(user_id) if user_id is not None else f'{users} users'}.")
+
 
+play_counter = PlayCounter(flush_plays, interval=PLAY_FLUSH_INTERVAL, max_pending=PLAY_FLUSH_MAX_PENDING,
+                           max_retries=PLAY_FLUSH_MAX_RETRIES, max_backoff=PLAY_FLUSH_MAX_BACKOFF,
+                           data_errors=DATA_ERRORS)
 
-# Returns the total play counts for each user of the given guild, in said guild. In other words, only count of songs played in the given guild.
-async def get_leaderboard(guild_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+
+# Rolls the next batch of play events past the watermark up into the daily rollup tables and moves
+# the watermark, all in one transaction. Returns the number of events compacted.
+async def compact_play_events(batch_size=PLAY_COMPACT_BATCH):
+    async with acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT last_event_id FROM rollup_watermarks WHERE name = 'play_events' FOR UPDATE")
+                row = await cur.fetchone()
+                last_event_id = row[0] if row else 0
+
+                await cur.execute(
+                    'SELECT COUNT(*), MAX(event_id) FROM (SELECT event_id FROM play_events WHERE event_id > %s '
+                    'ORDER BY event_id LIMIT %s) AS batch', (last_event_id, batch_size))
+                compacted, upto = await cur.fetchone()
+                if not compacted:
+                    await conn.rollback()
+                    return 0
+
+                window = (last_event_id, upto)
+                await cur.execute(
+                    'INSERT INTO user_daily_plays (user_id, day, plays, ms) '
+                    'SELECT e.user_id, DATE(e.played_at), COUNT(*), SUM(COALESCE(s.length, 0)) FROM play_events AS e '
+                    'LEFT JOIN songs AS s ON s.song_key = e.song_key '
+                    'WHERE e.event_id > %s AND e.event_id <= %s GROUP BY e.user_id, DATE(e.played_at) '
+                    'ON DUPLICATE KEY UPDATE plays = plays + VALUES(plays), ms = ms + VALUES(ms)', window)
+                await cur.execute(
+                    'INSERT INTO user_daily_song_plays (user_id, day, song_key, plays) '
+                    'SELECT e.user_id, DATE(e.played_at), e.song_key, COUNT(*) FROM play_events AS e '
+                    'WHERE e.event_id > %s AND e.event_id <= %s GROUP BY e.user_id, DATE(e.played_at), e.song_key '
+                    'ON DUPLICATE KEY UPDATE plays = plays + VALUES(plays)', window)
+                await cur.execute(
+                    "INSERT INTO rollup_watermarks (name, last_event_id) VALUES ('play_events', %s) "
+                    'ON DUPLICATE KEY UPDATE last_event_id = VALUES(last_event_id)', (upto,))
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+    logger.debug(f"Compacted {compacted} play events up to event {upto}.")
+    return compacted
+
+
+# Returns the definition of the monthly play_events partition holding the month that starts at month_start.
+def play_event_partition(month_start):
+    next_month = date(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+    return f"PARTITION p{month_start:%Y%m} VALUES LESS THAN ('{next_month.isoformat()}')"
+
+
+# Returns the first day of this month and of the following months_ahead months.
+def upcoming_months(months_ahead=PLAY_EVENT_MONTHS_AHEAD):
+    today = datetime.now(timezone.utc).date()
+    months = []
+    for offset in range(months_ahead + 1):
+        month = today.month - 1 + offset
+        months.append(date(today.year + month // 12, month % 12 + 1, 1))
+    return months
+
+
+# Splits play_events' catch-all pmax partition so that the coming months each get their own partition.
+# Only MySQL partitions the table; on SQLite this does nothing.
+async def ensure_play_event_partitions(months_ahead=PLAY_EVENT_MONTHS_AHEAD):
+    if DB_BACKEND != 'mysql':
+        return []
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute(
-                'SELECT user_id, SUM(count) AS total_count FROM plays WHERE guild_id = %s GROUP BY user_id ORDER BY total_count DESC;',
-                guild_id)
-            rows = await cur.fetchall()
-            return rows
+                'SELECT partition_name FROM information_schema.partitions '
+                "WHERE table_schema = DATABASE() AND table_name = 'play_events' AND partition_name IS NOT NULL")
+            existing = {name for (name,) in await cur.fetchall()}
+            if 'pmax' not in existing:
+                return []
+            missing = [month for month in upcoming_months(months_ahead) if f"p{month:%Y%m}" not in existing]
+            if not missing:
+                return []
+            partitions = ', '.join(play_event_partition(month) for month in missing)
+            await cur.execute(f'ALTER TABLE play_events REORGANIZE PARTITION pmax INTO '
+                              f'({partitions}, PARTITION pmax VALUES LESS THAN (MAXVALUE))')
+    logger.info(f"Added play_events partitions: {', '.join(f'p{month:%Y%m}' for month in missing)}.")
+    return missing
+
+
+play_compactor = PlayEventCompactor(compact_play_events, ensure_play_event_partitions, interval=PLAY_COMPACT_INTERVAL)
+
+
+# Tables that reference songs, whose keys and indexes grow with the width of the song key
+SONG_TABLES = ('songs', 'plays', 'wonderTrades', 'user_song_plays', 'user_daily_song_plays', 'play_events')
+
+
+# Returns {table: (data_bytes, index_bytes)} for the given tables. MySQL's statistics are refreshed
+# first; on SQLite the sizes come from the dbstat table, and are empty if SQLite was built without it.
+async def get_table_sizes(cur, tables=SONG_TABLES):
+    if DB_BACKEND == 'mysql':
+        for table in tables:
+            await cur.execute(f'ANALYZE TABLE {table}')
+            await cur.fetchall()
+        await cur.execute(
+            'SELECT table_name, data_length, index_length FROM information_schema.tables '
+            f'WHERE table_schema = DATABASE() AND table_name IN ({placeholders(tables)})', list(tables))
+        return {table: (data, index) for table, data, index in await cur.fetchall()}
+    try:
+        await cur.execute(
+            "SELECT m.tbl_name, SUM(CASE WHEN m.type = 'table' THEN d.pgsize ELSE 0 END), "
+            "SUM(CASE WHEN m.type = 'index' THEN d.pgsize ELSE 0 END) "
+            'FROM dbstat AS d JOIN sqlite_master AS m ON m.name = d.name '
+            f'WHERE m.tbl_name IN ({placeholders(tables)}) GROUP BY m.tbl_name', list(tables))
+    except Exception:
+        return {}
+    return {table: (data, index) for table, data, index in await cur.fetchall()}
+
+
+# Times the plays-to-songs join behind the user stats rebuild on the given key column and returns
+# the best of `runs` in milliseconds.
+async def time_song_join(cur, column='song_key', runs=5):
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        await cur.execute('SELECT p.user_id, SUM(p.count * s.length) FROM plays AS p '
+                          f'JOIN songs AS s ON s.{column} = p.{column} GROUP BY p.user_id')
+        await cur.fetchall()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# Measures the song tables: their sizes and the speed of the plays-to-songs join.
+async def benchmark_song_tables(column='song_key', runs=5):
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            sizes = await get_table_sizes(cur)
+            join_ms = await time_song_join(cur, column, runs)
+    return sizes, join_ms
+
+
+# Rebuilds the guild_leaderboard summary from the plays table, for one guild or for all of them.
+# Migrations pass their own connection as conn.
+async def rebuild_leaderboard(guild_id=None, conn=None):
+    params = (guild_id,) if guild_id is not None else ()
+    async with play_counter.paused():
+        async with use_connection(conn) as conn:
+            await conn.begin()
+            try:
+                async with conn.cursor() as cur:
+                    await cur.execute('DELETE FROM guild_leaderboard' + (' WHERE guild_id = %s' if params else ''),
+                                      params)
+                    await cur.execute(
+                        'INSERT INTO guild_leaderboard (guild_id, user_id, plays) '
+                        'SELECT guild_id, user_id, SUM(count) FROM plays '
+                        + ('WHERE guild_id = %s ' if params else '') +
+                        'GROUP BY guild_id, user_id', params)
+                    rebuilt = cur.rowcount
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+    leaderboard_cache.invalidate(guild_id)
+    logger.info(f"Rebuilt {rebuilt} leaderboard entries for {'guild ' + str(guild_id) if guild_id is not None else 'all guilds'}.")
+
+
+# Loads the top of a guild's leaderboard into the in-memory cache if it is not there yet.
+async def _load_leaderboard(cur, guild_id):
+    if leaderboard_cache.is_loaded(guild_id):
+        return
+    version = leaderboard_cache.version(guild_id)
+    await cur.execute(
+        'SELECT user_id, plays FROM guild_leaderboard WHERE guild_id = %s ORDER BY plays DESC, user_id LIMIT %s',
+        (guild_id, leaderboard_cache.size))
+    leaderboard_cache.load(guild_id, await cur.fetchall(), version)
+
+
+# Returns one page of the given guild's leaderboard as (user_id, plays) rows, together with the number of
+# ranked users, or None for it with with_total=False. Pages within the cached top-N never touch the plays
+# table; deeper pages are an index range read. The total is counted only when the cache cannot tell it.
+async def get_leaderboard(guild_id, page=0, per_page=10, with_total=True):
+    offset = page * per_page
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            await _load_leaderboard(cur, guild_id)
+            rows = leaderboard_cache.page(guild_id, offset, per_page)
+            if rows is None:
+                await cur.execute(
+                    'SELECT user_id, plays FROM guild_leaderboard WHERE guild_id = %s '
+                    'ORDER BY plays DESC, user_id LIMIT %s OFFSET %s',
+                    (guild_id, per_page, offset))
+                rows = await cur.fetchall()
+            total = leaderboard_cache.total(guild_id) if with_total else None
+            if with_total and total is None:
+                await cur.execute('SELECT COUNT(*) FROM guild_leaderboard WHERE guild_id = %s', (guild_id,))
+                (total,) = await cur.fetchone()
+    return list(rows), total
+
+
+# Returns (rank, plays) of a user in the given guild's leaderboard, or None if they have no plays there.
+# Users in the cached top-N (LEADERBOARD_CACHE_SIZE) are ranked with a bisect in memory. Below it the
+# rank is a COUNT of the users ahead on the (guild_id, plays) index, which reads one index entry per
+# user ahead, so it grows with the rank rather than logarithmically. Raise LEADERBOARD_CACHE_SIZE if
+# users outside the cached top are looked up often.
+async def get_leaderboard_rank(guild_id, user_id):
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            await _load_leaderboard(cur, guild_id)
+            rank = leaderboard_cache.rank(guild_id, user_id)
+            await cur.execute('SELECT plays FROM guild_leaderboard WHERE guild_id = %s AND user_id = %s',
+                              (guild_id, user_id))
+            row = await cur.fetchone()
+            if row is None:
+                return None
+            (plays,) = row
+            if rank is None:
+                await cur.execute(
+                    'SELECT COUNT(*) FROM guild_leaderboard WHERE guild_id = %s '
+                    'AND (plays > %s OR (plays = %s AND user_id < %s))',
+                    (guild_id, plays, plays, user_id))
+                (ahead,) = await cur.fetchone()
+                rank = ahead + 1
+    return rank, plays
 
 
 # Returns the top stats for a given user. Total amount of songs played, total playtime of all songs played, top played artist and top played song.
+# Served from the user_stats rollup with a single primary-key lookup.
 async def get_user_stats(user_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
-            await cur.execute('SELECT SUM(count) AS total_count FROM plays WHERE user_id = %s', (user_id,))
-            total_songs = await cur.fetchone()
-            if not total_songs or total_songs[0] is None:
-                total_songs = 0
-            else:
-                total_songs = total_songs[0]
-
-            await cur.execute(
-                'SELECT SUM(songs.length * plays.count) AS total_played_length FROM plays JOIN songs ON plays.song_id = songs.song_id WHERE plays.user_id = %s;',
-                (user_id,))
-            total_playtime = await cur.fetchone()
-            if not total_playtime or total_playtime[0] is None:
-                total_playtime = 0
-            else:
-                total_playtime = total_playtime[0] / 3600000  # Convert milliseconds to hours
-
-            await cur.execute(
-                'SELECT songs.artist, SUM(plays.count) AS total_artist_plays FROM plays JOIN songs ON plays.song_id = songs.song_id WHERE plays.user_id = %s GROUP BY songs.artist ORDER BY total_artist_plays DESC LIMIT 1;',
-                (user_id,))
-            top_artist = await cur.fetchone()
-            if not top_artist:
-                top_artist = "None"
-            else:
-                top_artist = top_artist[0]
-
-            await cur.execute(
-                'SELECT songs.name, plays.count FROM plays JOIN songs ON plays.song_id = songs.song_id WHERE plays.user_id = %s ORDER BY plays.count DESC LIMIT 1;',
-                (user_id,))
-            top_song = await cur.fetchone()
-            if not top_song:
-                top_song = "None"
-            else:
-                top_song = top_song[0]
-
-            return {
-                'top_artist': top_artist,
-                'top_song': top_song,
-                'total_songs_played': total_songs,
-                'total_hours_played': total_playtime
-            }
+            await cur.execute('SELECT total_plays, total_ms, top_artist, top_song FROM user_stats WHERE user_id = %s',
+                              (user_id,))
+            row = await cur.fetchone()
+
+    total_songs, total_ms, top_artist, top_song = row if row else (0, 0, None, None)
+    return {
+        'top_artist': top_artist or "None",
+        'top_song': top_song or "None",
+        'total_songs_played': total_songs,
+        'total_hours_played': total_ms / 3600000  # Convert milliseconds to hours
+    }
+
+
+# Returns everything /recap shows for a user. Without a window it reads the lifetime user_stats rollup and
+# its tallies; with since/until dates (until exclusive) it reads the daily rollups of the play event log.
+# Either way it is three queries running concurrently.
+async def get_user_recap(user_id, since=None, until=None):
+    async def fetch(query, params, fetch_all=True):
+        async with acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute(query, params)
+                return await cur.fetchall() if fetch_all else await cur.fetchone()
+
+    if since is not None or until is not None:
+        window = (user_id, (since or date.min).isoformat(), (until or date.max).isoformat())
+        summary, top_artists, top_songs = await asyncio.gather(
+            fetch('''
+                SELECT (SELECT SUM(plays) FROM user_daily_plays
+                        WHERE user_id = %s AND day >= %s AND day < %s) AS total_plays,
+                       (SELECT SUM(ms) FROM user_daily_plays
+                        WHERE user_id = %s AND day >= %s AND day < %s) AS total_ms,
+                       COUNT(DISTINCT s.artist) AS total_artists,
+                       COUNT(DISTINCT d.song_key) AS total_unique_songs,
+                       (SELECT s2.source FROM user_daily_song_plays AS d2 JOIN songs AS s2 ON s2.song_key = d2.song_key
+                        WHERE d2.user_id = %s AND d2.day >= %s AND d2.day < %s
+                        GROUP BY s2.source ORDER BY SUM(d2.plays) DESC LIMIT 1) AS most_used_source
+                FROM user_daily_song_plays AS d
+                JOIN songs AS s ON s.song_key = d.song_key
+                WHERE d.user_id = %s AND d.day >= %s AND d.day < %s
+            ''', window * 4, fetch_all=False),
+            fetch('''
+                SELECT s.artist, SUM(d.plays) AS plays FROM user_daily_song_plays AS d
+                JOIN songs AS s ON s.song_key = d.song_key
+                WHERE d.user_id = %s AND d.day >= %s AND d.day < %s
+                GROUP BY s.artist ORDER BY plays DESC LIMIT 3
+            ''', window),
+            fetch('''
+                SELECT s.name, s.artist, SUM(d.plays) AS plays FROM user_daily_song_plays AS d
+                JOIN songs AS s ON s.song_key = d.song_key
+                WHERE d.user_id = %s AND d.day >= %s AND d.day < %s
+                GROUP BY d.song_key, s.name, s.artist ORDER BY plays DESC LIMIT 3
+            ''', window)
+        )
+        summary = dict(summary or {})
+        summary['top_artist'] = top_artists[0]['artist'] if top_artists else None
+        summary['top_song'] = top_songs[0]['name'] if top_songs else None
+        summary['total_plays'] = int(summary.get('total_plays') or 0)
+        summary['total_ms'] = int(summary.get('total_ms') or 0)
+    else:
+        summary, top_artists, top_songs = await asyncio.gather(
+            fetch('''
+                SELECT us.total_plays, us.total_ms, us.top_artist, us.top_song,
+                       (SELECT COUNT(*) FROM user_artist_plays AS uap WHERE uap.user_id = us.user_id) AS total_artists,
+                       (SELECT COUNT(*) FROM user_song_plays AS usp WHERE usp.user_id = us.user_id) AS total_unique_songs,
+                       (SELECT s.source FROM user_song_plays AS usp JOIN songs AS s ON s.song_key = usp.song_key
+                        WHERE usp.user_id = us.user_id GROUP BY s.source ORDER BY SUM(usp.plays) DESC LIMIT 1) AS most_used_source
+                FROM user_stats AS us
+                WHERE us.user_id = %s
+            ''', (user_id,), fetch_all=False),
+            fetch('''
+                SELECT artist, plays FROM user_artist_plays
+                WHERE user_id = %s ORDER BY plays DESC LIMIT 3
+            ''', (user_id,)),
+            fetch('''
+                SELECT s.name, s.artist, usp.plays FROM user_song_plays AS usp
+                JOIN songs AS s ON s.song_key = usp.song_key
+                WHERE usp.user_id = %s ORDER BY usp.plays DESC LIMIT 3
+            ''', (user_id,))
+        )
+
+    summary = summary or {}
+    return {
+        'top_artist': summary.get('top_artist') or "None",
+        'top_song': summary.get('top_song') or "None",
+        'total_songs_played': summary.get('total_plays', 0),
+        'total_hours_played': summary.get('total_ms', 0) / 3600000,  # Convert milliseconds to hours
+        'total_artists': summary.get('total_artists', 0),
+        'total_unique_songs': summary.get('total_unique_songs', 0),
+        'most_used_source': summary.get('most_used_source') or "Unknown",
+        'top_artists': [(row['artist'], row['plays']) for row in top_artists],
+        'top_songs': [(row['name'], row['artist'], row['plays']) for row in top_songs]
+    }
 
 
 # Sets the updates status of a given guild.
@@ -360,127 +1070,258 @@ async def set_updates_status(guild_id, status):
     else:
         raise ValueError("Invalid status value. Must be 'enable' or 'disable'.")
 
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute(
                 'INSERT INTO guilds (guild_id, updates_enabled) VALUES (%s, %s) ON DUPLICATE KEY UPDATE updates_enabled = %s',
                 (guild_id, status_value, status_value))
             await conn.commit()
+    invalidate_guild_settings(guild_id)
 
 
 # Gets the updates status of a given guild.
 async def get_updates_status(guild_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
-        async with conn.cursor() as cur:
-            await cur.execute('SELECT updates_enabled FROM guilds WHERE guild_id = %s', (guild_id,))
-            result = await cur.fetchone()
-            return result[0] if result is not None else 1  # Default to 1 (enabled) if not set
+    settings = await get_guild_settings(guild_id)
+    return settings['updates_enabled']  # Defaults to 1 (enabled) if not set
 
 
 # Sets the updates channel of a given guild.
 async def set_updates_channel(guild_id, channel_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute(
                 'INSERT INTO guilds (guild_id, updates_channel_id) VALUES (%s, %s) ON DUPLICATE KEY UPDATE updates_channel_id = %s',
                 (guild_id, channel_id, channel_id))
             await conn.commit()
+    invalidate_guild_settings(guild_id)
 
 
 # Retrieves the updates channel of a given guild.
 async def get_updates_channel(guild_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
-        async with conn.cursor() as cur:
-            await cur.execute('SELECT updates_channel_id FROM guilds WHERE guild_id = %s', (guild_id,))
-            result = await cur.fetchone()
-            return result[0] if result else None
+    settings = await get_guild_settings(guild_id)
+    return settings['updates_channel_id']
+
+
+# Returns the ID of the playlist with the given name that the user owns or collaborates on.
+async def find_editable_playlist(cur, user_id, name):
+    await cur.execute(
+        'SELECT p.playlist_id FROM playlists p '
+        'LEFT JOIN playlist_collaborators pc ON pc.playlist_id = p.playlist_id AND pc.user_id = %s '
+        'WHERE p.name = %s AND (p.user_id = %s OR pc.user_id IS NOT NULL) LIMIT 1',
+        (user_id, name, user_id))
+    playlist = await cur.fetchone()
+    return playlist[0] if playlist else None
 
 
 # Create a new playlist
 async def create_playlist(user_id, guild_id, name, privacy):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute(
-                'INSERT INTO playlists (user_id, guild_id, name, privacy, collaborators) VALUES (%s, %s, %s, %s, %s)',
-                (user_id, guild_id, name, privacy, '[]'))
+                'INSERT INTO playlists (user_id, guild_id, name, privacy) VALUES (%s, %s, %s, %s)',
+                (user_id, guild_id, name, privacy))
             await conn.commit()
 
 
 # Get playlist details by name (used for editing a playlist)
 async def get_playlist_by_name(name):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
             await cur.execute('SELECT * FROM playlists WHERE name = %s', (name,))
             playlist = await cur.fetchone()
             return playlist
 
 
-# Add a song to a playlist
+# Returns (track_hash, data) for a Lavalink track: the SHA-256 of its encoded form, which identifies the
+# track across playlists, and its JSON compressed with zlib.
+def encode_track(raw_data):
+    key = raw_data.get('encoded') or json.dumps(raw_data, sort_keys=True)
+    data = zlib.compress(json.dumps(raw_data, separators=(',', ':')).encode('utf-8'))
+    return hashlib.sha256(key.encode('utf-8')).digest(), data
+
+
+def decode_track(data):
+    return json.loads(zlib.decompress(data))
+
+
+# Returns the decoded track data for each of the given hashes, from the in-process cache where possible.
+async def load_tracks(cur, track_hashes):
+    tracks = {}
+    missing = []
+    for track_hash in set(track_hashes):
+        track = _track_cache.get(track_hash)
+        if track is not None:
+            tracks[track_hash] = track
+        else:
+            missing.append(track_hash)
+
+    if missing:
+        await cur.execute(f'SELECT track_hash, data FROM tracks WHERE track_hash IN ({placeholders(missing)})',
+                          missing)
+        for row in await cur.fetchall():
+            track_hash, data = (row['track_hash'], row['data']) if isinstance(row, dict) else row
+            tracks[track_hash] = decode_track(data)
+            _track_cache.set(track_hash, tracks[track_hash])
+    return tracks
+
+
+def get_track_cache_stats():
+    return _track_cache.get_stats()
+
+
+# Deletes those of the given tracks that no playlist song references anymore and returns how many were
+# deleted. Called after deleting playlist songs, in the same transaction where there is one.
+async def delete_unused_tracks(cur, track_hashes):
+    track_hashes = list(set(track_hashes))
+    deleted = 0
+    for start in range(0, len(track_hashes), TRACK_DELETE_BATCH):
+        batch = track_hashes[start:start + TRACK_DELETE_BATCH]
+        deleted += await cur.execute(
+            f'DELETE FROM tracks WHERE track_hash IN ({placeholders(batch)}) '
+            'AND NOT EXISTS (SELECT 1 FROM playlist_songs AS ps WHERE ps.track_hash = tracks.track_hash)',
+            batch)
+    return deleted
+
+
+# Deletes every track no playlist song references, walking the tracks table in batches. Catches up on
+# tracks left behind before unused ones were deleted along with their playlist songs.
+async def prune_unused_tracks(batch_size=TRACK_DELETE_BATCH):
+    deleted, after = 0, b''
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            while True:
+                await cur.execute('SELECT track_hash FROM tracks WHERE track_hash > %s ORDER BY track_hash LIMIT %s',
+                                  (after, batch_size))
+                batch = [track_hash for (track_hash,) in await cur.fetchall()]
+                if not batch:
+                    break
+                after = batch[-1]
+                deleted += await delete_unused_tracks(cur, batch)
+                await conn.commit()
+    logger.info(f"Deleted {deleted} tracks no playlist song referenced.")
+    return deleted
+
+
+# Add a song to a playlist. Returns 'Song already in playlist' if the playlist holds unique tracks
+# and already has this one.
 async def add_song_to_playlist(user_id, name, song_id, song_name, artist, raw_data):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             # Fetch the playlist ID based on the playlist name and user ID
-            await cur.execute(
-                'SELECT playlist_id, collaborators FROM playlists WHERE name = %s AND (user_id = %s OR FIND_IN_SET(%s, collaborators))',
-                (name, user_id, user_id)
-            )
-            playlist = await cur.fetchone()
-
-            if not playlist:
+            playlist_id = await find_editable_playlist(cur, user_id, name)
+            if not playlist_id:
                 return 'Playlist not found'
 
-            playlist_id = playlist[0]  # Ensure playlist_id is correctly obtained
-
-            # Serialize raw_data to JSON string
-            raw_data_json = json.dumps(raw_data)
-
-            # Insert the song into the playlist
-            await cur.execute(
-                'INSERT INTO playlist_songs (playlist_id, song_id, song_name, artist, raw_data) VALUES (%s, %s, %s, %s, %s)',
-                (playlist_id, song_id, song_name, artist, raw_data_json)
-            )
-            await conn.commit()
+            # Store the track once in the shared tracks table and reference it by hash
+            track_hash, data = encode_track(raw_data)
+
+            # Append the song at the end of the playlist and keep its song_count in step. The playlist row
+            # is updated first, which locks it, so concurrent adds cannot take the same position.
+            # In unique tracks mode the song's dedupe_key makes a repeat add insert nothing.
+            await conn.begin()
+            try:
+                await cur.execute('UPDATE playlists SET song_count = song_count + 1 WHERE playlist_id = %s',
+                                  (playlist_id,))
+                # An existing track row is locked rather than skipped, so delete_unused_tracks cannot remove
+                # it before the song referencing it is inserted
+                await cur.execute('INSERT INTO tracks (track_hash, data) VALUES (%s, %s) '
+                                  'ON DUPLICATE KEY UPDATE track_hash = track_hash', (track_hash, data))
+                added = await cur.execute(
+                    'INSERT IGNORE INTO playlist_songs '
+                    '(playlist_id, song_id, song_name, artist, track_hash, position, dedupe_key) '
+                    'SELECT p.playlist_id, %s, %s, %s, %s, '
+                    '(SELECT COALESCE(MAX(ps.position), 0) + 1 FROM playlist_songs AS ps WHERE ps.playlist_id = p.playlist_id), '
+                    'CASE WHEN p.unique_tracks = 1 THEN %s END '
+                    'FROM playlists AS p WHERE p.playlist_id = %s',
+                    (song_id, song_name, artist, track_hash, song_id, playlist_id)
+                )
+                if not added:
+                    await conn.rollback()
+                    return 'Song already in playlist'
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
 
 
 # Remove a song from a playlist
 async def remove_song_from_playlist(user_id, name, song_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
-            await cur.execute(
-                'SELECT playlist_id, collaborators FROM playlists WHERE name = %s AND (user_id = %s OR FIND_IN_SET(%s, collaborators))',
-                (name, user_id, user_id))
-            playlist = await cur.fetchone()
-            if not playlist:
+            playlist_id = await find_editable_playlist(cur, user_id, name)
+            if not playlist_id:
                 return 'Playlist not found'
-            playlist_id = playlist[0]
-            await cur.execute('DELETE FROM playlist_songs WHERE playlist_id = %s AND song_id = %s',
-                              (playlist_id, song_id))
-            await conn.commit()
+            await conn.begin()
+            try:
+                await cur.execute('SELECT track_hash FROM playlist_songs WHERE playlist_id = %s AND song_id = %s',
+                                  (playlist_id, song_id))
+                track_hashes = [track_hash for (track_hash,) in await cur.fetchall()]
+                removed = await cur.execute('DELETE FROM playlist_songs WHERE playlist_id = %s AND song_id = %s',
+                                            (playlist_id, song_id))
+                await cur.execute('UPDATE playlists SET song_count = song_count - %s WHERE playlist_id = %s',
+                                  (removed, playlist_id))
+                await delete_unused_tracks(cur, track_hashes)
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+
+
+# Removes all but the first copy of every song in a playlist and returns how many were removed.
+# The playlist is read once, in position order and in batches, and each batch's duplicates are deleted
+# by primary key, so the work grows linearly with the size of the playlist. Runs in the caller's transaction.
+async def remove_duplicate_songs(cur, playlist_id, batch_size=PLAYLIST_DEDUPE_BATCH):
+    seen, removed, after = set(), 0, 0
+    removed_tracks = set()
+    while True:
+        await cur.execute('SELECT id, song_id, position, track_hash FROM playlist_songs '
+                          'WHERE playlist_id = %s AND position > %s ORDER BY position LIMIT %s',
+                          (playlist_id, after, batch_size))
+        rows = await cur.fetchall()
+        if not rows:
+            await delete_unused_tracks(cur, removed_tracks)
+            return removed
+        after = rows[-1][2]
+        duplicates = []
+        for row_id, song_id, _, track_hash in rows:
+            if song_id in seen:
+                duplicates.append(row_id)
+                removed_tracks.add(track_hash)
+            else:
+                seen.add(song_id)
+        if duplicates:
+            removed += await cur.execute(f'DELETE FROM playlist_songs WHERE id IN ({placeholders(duplicates)})',
+                                         duplicates)
 
 
 # Dedupe songs in a playlist
 async def dedupe_playlist(user_id, name):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
-            await cur.execute(
-                'SELECT playlist_id, collaborators FROM playlists WHERE name = %s AND (user_id = %s OR FIND_IN_SET(%s, collaborators))',
-                (name, user_id, user_id))
-            playlist = await cur.fetchone()
-            if not playlist:
+            playlist_id = await find_editable_playlist(cur, user_id, name)
+            if not playlist_id:
                 return 'Playlist not found'
-            playlist_id = playlist[0]
-            await cur.execute(
-                'DELETE ps1 FROM playlist_songs ps1 INNER JOIN playlist_songs ps2 WHERE ps1.playlist_id = %s AND ps1.song_id = ps2.song_id AND ps1.id > ps2.id',
-                (playlist_id,))
-            await conn.commit()
+            await conn.begin()
+            try:
+                # Lock the playlist row first so no song is added while it is being deduped
+                await cur.execute('SELECT song_count FROM playlists WHERE playlist_id = %s FOR UPDATE', (playlist_id,))
+                await cur.fetchone()
+                removed = await remove_duplicate_songs(cur, playlist_id)
+                await cur.execute('UPDATE playlists SET song_count = song_count - %s WHERE playlist_id = %s',
+                                  (removed, playlist_id))
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+            return removed
 
 # View playlist by name
 async def view_playlist(name: str):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
             # Fetch playlists with the given name
             await cur.execute(
-                'SELECT playlist_id, name, user_id, privacy FROM playlists WHERE name = %s',
+                'SELECT playlist_id, name, user_id, privacy, song_count FROM playlists WHERE name = %s',
                 (name,)
             )
             playlists = await cur.fetchall()
@@ -491,18 +1332,51 @@ async def view_playlist(name: str):
             return playlists
 
 
-# Get playlist contents by playlist ID
+# Get a page of a playlist's songs for display, without their track data. Pages are read by position
+# with an index seek: the songs after position `after`, or, when `before` is given, the last `limit`
+# songs ahead of that position (of the whole playlist if before is 0), still returned in playlist order.
+async def get_playlist_songs(playlist_id, after=0, limit=None, before=None):
+    query = 'SELECT song_id, song_name, artist, position FROM playlist_songs WHERE playlist_id = %s '
+    if before is None:
+        query += 'AND position > %s ORDER BY position'
+        params = (playlist_id, after)
+    else:
+        query += ('AND position < %s ' if before else '') + 'ORDER BY position DESC'
+        params = (playlist_id, before) if before else (playlist_id,)
+    if limit is not None:
+        query += ' LIMIT %s'
+        params += (limit,)
+    async with acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            await cur.execute(query, params)
+            songs = await cur.fetchall()
+    return songs if before is None else songs[::-1]
+
+
+# Get the number of songs in a playlist from its maintained song_count
+async def get_playlist_song_count(playlist_id):
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute('SELECT song_count FROM playlists WHERE playlist_id = %s', (playlist_id,))
+            row = await cur.fetchone()
+            return row[0] if row else 0
+
+
+# Get playlist contents by playlist ID, including the decoded track data needed to queue them under 'track'
 async def get_playlist_contents(playlist_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
-            await cur.execute('SELECT song_id, song_name, artist, raw_data FROM playlist_songs WHERE playlist_id = %s',
-                              (playlist_id,))
-            return await cur.fetchall()
+            await cur.execute('SELECT song_id, song_name, artist, track_hash FROM playlist_songs WHERE playlist_id = %s '
+                              'ORDER BY position', (playlist_id,))
+            songs = await cur.fetchall()
+            if songs:
+                tracks = await load_tracks(cur, [song['track_hash'] for song in songs])
+    return [dict(song, track=tracks[song['track_hash']]) for song in songs if song['track_hash'] in tracks]
 
 
 # Get playlist details
 async def get_playlist(user_id, name):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
             await cur.execute('SELECT * FROM playlists WHERE user_id = %s AND name = %s', (user_id, name))
             playlist = await cur.fetchone()
@@ -511,7 +1385,7 @@ async def get_playlist(user_id, name):
 
 # Invite user to a playlist
 async def invite_user_to_playlist(user_id, name, invitee_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             # Ensure the playlist exists
             await cur.execute('''
@@ -528,7 +1402,7 @@ async def invite_user_to_playlist(user_id, name, invitee_id):
 
             # Check if the invitee is already a collaborator
             await cur.execute('''
-            SELECT collaborators FROM playlists WHERE playlist_id = %s AND FIND_IN_SET(%s, collaborators)
+            SELECT user_id FROM playlist_collaborators WHERE playlist_id = %s AND user_id = %s
             ''', (playlist_id, invitee_id))
             collaborator = await cur.fetchone()
             if collaborator:
@@ -559,7 +1433,7 @@ async def invite_user_to_playlist(user_id, name, invitee_id):
 
 # Get user invites
 async def get_user_invites(user_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
             await cur.execute('''
             SELECT DISTINCT pi.invite_id, p.name, u.user_id
@@ -574,97 +1448,89 @@ async def get_user_invites(user_id):
 
 # Check if user is playlist creator or collaborator
 async def check_playlist_permission(user_id, playlist_name):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
-        async with conn.cursor(aiomysql.DictCursor) as cur:
-            await cur.execute('SELECT playlist_id, collaborators FROM playlists WHERE user_id = %s AND name = %s',
-                              (user_id, playlist_name))
-            playlist = await cur.fetchone()
-            if playlist:
-                return True
-            await cur.execute('SELECT playlist_id FROM playlists WHERE name = %s AND FIND_IN_SET(%s, collaborators)',
-                              (playlist_name, user_id))
-            collaborator_playlist = await cur.fetchone()
-            if collaborator_playlist:
-                return True
-            return False
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            return await find_editable_playlist(cur, user_id, playlist_name) is not None
 
 
 # Add collaborator to a playlist
 async def add_collaborator_to_playlist(playlist_id, user_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
-            await cur.execute('SELECT collaborators FROM playlists WHERE playlist_id = %s', (playlist_id,))
-            result = await cur.fetchone()
-            if result:
-                collaborators = result[0]
-                if collaborators:
-                    collaborators_list = collaborators.split(',')
-                else:
-                    collaborators_list = []
-                if str(user_id) not in collaborators_list:
-                    collaborators_list.append(str(user_id))
-                    new_collaborators = ','.join(collaborators_list)
-                    await cur.execute('UPDATE playlists SET collaborators = %s WHERE playlist_id = %s',
-                                      (new_collaborators, playlist_id))
-                    await cur.execute('DELETE FROM playlist_invites WHERE playlist_id = %s AND invitee_id = %s',
-                                      (playlist_id, user_id))
-                    await conn.commit()
+            await cur.execute('INSERT IGNORE INTO playlist_collaborators (playlist_id, user_id) VALUES (%s, %s)',
+                              (playlist_id, user_id))
+            await cur.execute('DELETE FROM playlist_invites WHERE playlist_id = %s AND invitee_id = %s',
+                              (playlist_id, user_id))
+            await conn.commit()
 
 
 # Get playlists where the user is a collaborator
 async def get_collaborator_playlists(user_id: int):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
             # Find playlists where the user is listed as a collaborator
-            await cur.execute("SELECT * FROM playlists WHERE FIND_IN_SET(%s, collaborators)", (user_id,))
+            await cur.execute('SELECT p.* FROM playlists p '
+                              'JOIN playlist_collaborators pc ON pc.playlist_id = p.playlist_id '
+                              'WHERE pc.user_id = %s', (user_id,))
             playlists = await cur.fetchall()
             return playlists
 
 
 # Update playlist privacy
 async def update_playlist_privacy(playlist_id, privacy):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute('UPDATE playlists SET privacy = %s WHERE playlist_id = %s', (privacy, playlist_id))
             await conn.commit()
 
 
+# Turns a playlist's unique tracks mode on or off. Turning it on removes the duplicates the playlist
+# already has and keys its songs for the unique index. Returns the number of duplicates removed.
+async def update_playlist_unique_tracks(playlist_id, unique_tracks):
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            await conn.begin()
+            try:
+                # Updating the playlist row first keeps songs from being added until the mode has switched
+                await cur.execute('UPDATE playlists SET unique_tracks = %s WHERE playlist_id = %s',
+                                  (int(unique_tracks), playlist_id))
+                removed = 0
+                if unique_tracks:
+                    removed = await remove_duplicate_songs(cur, playlist_id)
+                    await cur.execute('UPDATE playlists SET song_count = song_count - %s WHERE playlist_id = %s',
+                                      (removed, playlist_id))
+                    await cur.execute('UPDATE playlist_songs SET dedupe_key = song_id WHERE playlist_id = %s',
+                                      (playlist_id,))
+                else:
+                    await cur.execute('UPDATE playlist_songs SET dedupe_key = NULL WHERE playlist_id = %s',
+                                      (playlist_id,))
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+    return removed
+
+
 # Remove collaborator from playlist
 async def remove_collaborator_from_playlist(playlist_id, user_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
-            await cur.execute('SELECT collaborators FROM playlists WHERE playlist_id = %s', (playlist_id,))
-            result = await cur.fetchone()
-            if result:
-                collaborators = result[0]
-                if collaborators:
-                    collaborators_list = collaborators.split(',')
-                    if str(user_id) in collaborators_list:
-                        collaborators_list.remove(str(user_id))
-                        new_collaborators = ','.join(collaborators_list)
-                        await cur.execute('UPDATE playlists SET collaborators = %s WHERE playlist_id = %s',
-                                          (new_collaborators, playlist_id))
-                        await conn.commit()
+            await cur.execute('DELETE FROM playlist_collaborators WHERE playlist_id = %s AND user_id = %s',
+                              (playlist_id, user_id))
+            await conn.commit()
 
 
 # Get playlist collaborators
 async def get_playlist_collaborators(playlist_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
-            await cur.execute('SELECT collaborators FROM playlists WHERE playlist_id = %s', (playlist_id,))
-            result = await cur.fetchone()
-            if result:
-                collaborators = result[0]
-                if collaborators:
-                    return collaborators.split(',')
-                else:
-                    return []
-            return []
+            await cur.execute('SELECT user_id FROM playlist_collaborators WHERE playlist_id = %s', (playlist_id,))
+            return [row[0] for row in await cur.fetchall()]
 
 
 # Edit playlist name
 async def edit_playlist_name(playlist_id, new_name):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute('UPDATE playlists SET name = %s WHERE playlist_id = %s', (new_name, playlist_id))
             await conn.commit()
@@ -672,21 +1538,23 @@ async def edit_playlist_name(playlist_id, new_name):
 
 # Accept playlist invite
 async def accept_playlist_invite(invite_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute('SELECT playlist_id, invitee_id FROM playlist_invites WHERE invite_id = %s', (invite_id,))
             invite = await cur.fetchone()
             if not invite:
                 return 'Invite not found'
             playlist_id, invitee_id = invite
-            await add_collaborator_to_playlist(playlist_id, invitee_id)
+    await add_collaborator_to_playlist(playlist_id, invitee_id)
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
             await cur.execute('DELETE FROM playlist_invites WHERE invite_id = %s', (invite_id,))
             await conn.commit()
 
 
 # Decline playlist invite
 async def decline_playlist_invite(invite_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute('DELETE FROM playlist_invites WHERE invite_id = %s', (invite_id,))
             await conn.commit()
@@ -694,18 +1562,20 @@ async def decline_playlist_invite(invite_id):
 
 # Function to check if a user is already a collaborator or has a pending invite
 async def is_collaborator(user_id, playlist_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute(
-                'SELECT p.playlist_id FROM playlists p LEFT JOIN playlist_invites pi ON p.playlist_id = pi.playlist_id AND pi.invitee_id = %s WHERE p.playlist_id = %s AND (p.collaborators LIKE %s OR pi.invitee_id IS NOT NULL)',
-                (user_id, playlist_id, f'%{user_id}%'))
+                'SELECT 1 FROM playlist_collaborators WHERE playlist_id = %s AND user_id = %s '
+                'UNION ALL '
+                'SELECT 1 FROM playlist_invites WHERE playlist_id = %s AND invitee_id = %s LIMIT 1',
+                (playlist_id, user_id, playlist_id, user_id))
             result = await cur.fetchone()
             return result is not None
 
 
 # Delete a playlist
 async def delete_playlist(user_id, name, playlist_id):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor() as cur:
             # Ensure the playlist exists and the user is the owner
             await cur.execute('''
@@ -721,10 +1591,18 @@ async def delete_playlist(user_id, name, playlist_id):
             DELETE FROM playlist_invites WHERE playlist_id = %s
             ''', (playlist_id,))
 
-            # Delete songs from the playlist
+            # Delete collaborators of the playlist
+            await cur.execute('''
+            DELETE FROM playlist_collaborators WHERE playlist_id = %s
+            ''', (playlist_id,))
+
+            # Delete songs from the playlist, and the stored tracks no other playlist uses
+            await cur.execute('SELECT DISTINCT track_hash FROM playlist_songs WHERE playlist_id = %s', (playlist_id,))
+            track_hashes = [track_hash for (track_hash,) in await cur.fetchall()]
             await cur.execute('''
             DELETE FROM playlist_songs WHERE playlist_id = %s
             ''', (playlist_id,))
+            await delete_unused_tracks(cur, track_hashes)
 
             # Delete the playlist itself
             await cur.execute('''
@@ -737,7 +1615,7 @@ async def delete_playlist(user_id, name, playlist_id):
 
 # Get user playlists
 async def get_user_playlists(user_id: int):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
             await cur.execute("SELECT name FROM playlists WHERE user_id = %s", (user_id,))
             playlists = await cur.fetchall()
@@ -745,15 +1623,44 @@ async def get_user_playlists(user_id: int):
 
 
 async def get_user_playlist_by_name(user_id, name):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
             await cur.execute('SELECT * FROM playlists WHERE user_id = %s AND name = %s', (user_id, name))
             return await cur.fetchone()
 
 
+# Get every non-empty playlist in a guild together with its songs (without raw_data), in one query.
+# Returns playlist dicts in playlist_id order, each with its songs in playlist order under 'songs'.
+async def get_guild_playlists_with_songs(guild_id: int):
+    async with acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            await cur.execute('''
+            SELECT p.playlist_id, p.name, p.user_id, p.privacy, ps.song_id, ps.song_name, ps.artist
+            FROM playlists p
+            JOIN playlist_songs ps ON ps.playlist_id = p.playlist_id
+            WHERE p.guild_id = %s
+            ORDER BY p.playlist_id, ps.position
+            ''', (guild_id,))
+            rows = await cur.fetchall()
+
+    playlists = {}
+    for row in rows:
+        playlist = playlists.get(row['playlist_id'])
+        if playlist is None:
+            playlist = playlists[row['playlist_id']] = {
+                'playlist_id': row['playlist_id'],
+                'name': row['name'],
+                'user_id': row['user_id'],
+                'privacy': row['privacy'],
+                'songs': []
+            }
+        playlist['songs'].append({'song_id': row['song_id'], 'song_name': row['song_name'], 'artist': row['artist']})
+    return list(playlists.values())
+
+
 # Get all playlists in a guild
 async def get_guild_playlists(guild_id: int):
-    async with aiomysql.connect(**MYSQL_CONFIG) as conn:
+    async with acquire() as conn:
         async with conn.cursor(aiomysql.DictCursor) as cur:
             await cur.execute("SELECT * FROM playlists WHERE guild_id = %s", (guild_id,))
             playlists = await cur.fetchall()
@@ -0,0 +1,124 @@
+# ========================================= #
+# Author: Noah S. Kipp                      #
+# Collaborator: Samuel Jaden Garcia Munoz   #
+# Created on: 17.10.2026                    #
+# ========================================= #
+
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+
+class LeaderboardCache:
+    # Keeps the top `size` entries of each guild's leaderboard in memory, sorted by (-plays, user_id),
+    # which is the same order the guild_leaderboard queries use. Play totals only ever grow, so once
+    # a guild is loaded, applying every new total keeps its top-N exact without going back to the database.
+    # A loaded guild expires after ttl seconds, as a safety net for writes made by other processes.
+    # At most max_guilds guilds are kept; loading one more drops the one read longest ago.
+    def __init__(self, size=100, ttl=None, max_guilds=1000):
+        self.size = size
+        self.ttl = ttl
+        self.max_guilds = max_guilds
+        self._entries = OrderedDict()  # guild_id -> sorted list of (-plays, user_id), least recently read first
+        self._plays = {}  # guild_id -> {user_id: plays} for the users in the top-N
+        self._loaded_at = {}  # guild_id -> monotonic time it was loaded
+        self._versions = {}  # guild_id -> number of times it was invalidated
+        self._epoch = 0  # number of times everything was invalidated or the versions were reset
+
+    def is_loaded(self, guild_id):
+        if guild_id not in self._entries:
+            return False
+        if self.ttl is not None and time.monotonic() - self._loaded_at[guild_id] >= self.ttl:
+            self._drop(guild_id)
+            return False
+        self._entries.move_to_end(guild_id)
+        return True
+
+    # Returns a token to pass to load(), taken before the top-N is read from the database
+    def version(self, guild_id):
+        return self._epoch, self._versions.get(guild_id, 0)
+
+    def load(self, guild_id, rows, version=None):
+        # rows are (user_id, plays) pairs, as returned by the top-N query. If the guild was invalidated
+        # since version was taken, the rows may predate a write and are not kept.
+        if version is not None and version != self.version(guild_id):
+            return
+        entries = sorted((-plays, user_id) for user_id, plays in rows)[:self.size]
+        self._entries[guild_id] = entries
+        self._plays[guild_id] = {user_id: -negative_plays for negative_plays, user_id in entries}
+        self._loaded_at[guild_id] = time.monotonic()
+        self._entries.move_to_end(guild_id)
+        while len(self._entries) > self.max_guilds:
+            self._drop(next(iter(self._entries)))
+
+    def invalidate(self, guild_id=None):
+        if guild_id is None:
+            self._entries.clear()
+            self._plays.clear()
+            self._loaded_at.clear()
+            self._epoch += 1
+        else:
+            self._drop(guild_id)
+            self._versions[guild_id] = self._versions.get(guild_id, 0) + 1
+            if len(self._versions) > self.max_guilds:
+                # Every guild played in gets a version, so they are reset now and then. Moving to a new
+                # epoch still turns away loads that started before the reset.
+                self._versions.clear()
+                self._epoch += 1
+
+    def _drop(self, guild_id):
+        self._entries.pop(guild_id, None)
+        self._plays.pop(guild_id, None)
+        self._loaded_at.pop(guild_id, None)
+
+    # Sets a user's new play total in a loaded guild, entering them into the top-N if they now qualify.
+    def update(self, guild_id, user_id, plays):
+        entries = self._entries.get(guild_id)
+        if entries is None:
+            return
+        known = self._plays[guild_id]
+        key = (-plays, user_id)
+
+        if user_id in known:
+            del entries[bisect_left(entries, (-known[user_id], user_id))]
+        elif len(entries) >= self.size:
+            if key >= entries[-1]:
+                return
+            _, evicted = entries.pop()
+            del known[evicted]
+
+        insort(entries, key)
+        known[user_id] = plays
+
+    # Returns a user's 1-based rank if they are in the cached top-N, otherwise None. This is a bisect;
+    # ranks below the top-N are left to a count in the database.
+    def rank(self, guild_id, user_id):
+        known = self._plays.get(guild_id)
+        if not known or user_id not in known:
+            return None
+        return bisect_left(self._entries[guild_id], (-known[user_id], user_id)) + 1
+
+    # Returns (user_id, plays) rows for the slice, or None when it reaches past what the cache can answer.
+    def page(self, guild_id, offset, limit):
+        entries = self._entries.get(guild_id)
+        if entries is None:
+            return None
+        # A full cache may be cut off below the slice; a partial one holds the whole leaderboard
+        if offset + limit > len(entries) and len(entries) >= self.size:
+            return None
+        return [(user_id, -negative_plays) for negative_plays, user_id in entries[offset:offset + limit]]
+
+    # Returns the number of ranked users of a loaded guild when its whole leaderboard fits in the cache,
+    # otherwise None
+    def total(self, guild_id):
+        entries = self._entries.get(guild_id)
+        if entries is None or len(entries) >= self.size:
+            return None
+        return len(entries)
+
+    def get_stats(self):
+        return {
+            'guilds': len(self._entries),
+            'max_guilds': self.max_guilds,
+            'entries': sum(len(entries) for entries in self._entries.values())
+        }
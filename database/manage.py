@@ -0,0 +1,170 @@
+# ========================================= #
+# Author: Noah S. Kipp                      #
+# Collaborator: Samuel Jaden Garcia Munoz   #
+# Created on: 17.10.2026                    #
+# ========================================= #
+
+# Database maintenance commands, run from the project root:
+#   python -m database.manage migrate [--dry-run]
+#   python -m database.manage status
+#   python -m database.manage rebuild-user-stats [--user USER_ID]
+#   python -m database.manage rebuild-leaderboard [--guild GUILD_ID]
+#     (a running bot shows the rebuilt leaderboard once its cached copy expires, see LEADERBOARD_CACHE_TTL)
+#   python -m database.manage compact-play-events
+#   python -m database.manage prune-tracks
+#   python -m database.manage benchmark-song-tables [--runs N]
+#   python -m database.manage check-query-budgets
+#   python -m database.manage check-migrations
+
+import argparse
+import asyncio
+from database import database as db
+from database import migrator
+from database import query_tracer
+from utils.logging import setup_logging, get_logger
+
+logger = get_logger(__name__)
+
+# Most queries /play may make: one for the guild settings and one to enter the track. The play itself is buffered.
+PLAY_QUERY_BUDGET = 2
+
+
+async def migrate(args):
+    applied = await migrator.run_migrations(dry_run=args.dry_run)
+    if args.dry_run:
+        logger.info(f"Dry run complete, {len(applied)} migration(s) would be applied: {', '.join(applied) or '-'}")
+    else:
+        logger.info(f"Applied {len(applied)} migration(s): {', '.join(applied) or '-'}")
+
+
+async def status(args):
+    migration_status = await migrator.get_migration_status()
+    logger.info(f"Applied: {', '.join(migration_status['applied']) or '-'}")
+    logger.info(f"Pending: {', '.join(migration_status['pending']) or '-'}")
+
+
+async def rebuild_user_stats(args):
+    await db.rebuild_user_stats(args.user)
+
+
+async def rebuild_leaderboard(args):
+    await db.rebuild_leaderboard(args.guild)
+
+
+async def compact_play_events(args):
+    await db.ensure_play_event_partitions()
+    compacted = 0
+    while events := await db.compact_play_events():
+        compacted += events
+    logger.info(f"Compacted {compacted} play events into the daily rollups.")
+
+
+async def prune_tracks(args):
+    await db.prune_unused_tracks()
+
+
+async def benchmark_song_tables(args):
+    sizes, join_ms = await db.benchmark_song_tables(runs=args.runs)
+    for table in db.SONG_TABLES:
+        if table in sizes:
+            data, index = sizes[table]
+            logger.info(f"{table}: data {data / 1024:.1f} KiB, indexes {index / 1024:.1f} KiB")
+    if not sizes:
+        logger.info("Table sizes are not available on this database.")
+    logger.info(f"plays-to-songs join: best of {args.runs} runs took {join_ms:.1f} ms")
+
+
+# The database calls /play makes: the guild settings read of its restriction check, then the
+# db.record_play its play_song makes once the track is started
+async def play_database_path(guild_id, user_id, song_id):
+    await db.get_guild_settings(guild_id)
+    await db.record_play(user_id, guild_id, song_id, 'Query budget check', 'Music Monkey', 1000,
+                         f'https://example.com/{song_id}')
+
+
+# Runs the database path of commands under their query budget, on a throwaway in-memory SQLite
+# database so nothing is written to the real one. Fails with an AssertionError if a budget is exceeded.
+async def check_query_budgets(args):
+    db.DB_BACKEND, db.SQLITE_PATH = 'sqlite', ':memory:'
+    await migrator.run_migrations()
+    for attempt in ('first', 'repeated'):
+        async with query_tracer.assert_query_budget(PLAY_QUERY_BUDGET, f'/play ({attempt} play)') as trace:
+            await play_database_path(1, 1, 'budget-check')
+        logger.info(f"{trace.summary()} (budget: {PLAY_QUERY_BUDGET})")
+    await db.play_counter.stop()
+
+
+async def sqlite_schema():
+    async with db.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute('SELECT type, name, sql FROM sqlite_master ORDER BY type, name')
+            return await cur.fetchall()
+
+
+# Dry-runs every migration on throwaway in-memory SQLite databases, one empty and one already holding the
+# initial schema of 0001, and checks that the dry runs get through the whole chain without changing either.
+async def check_migrations(args):
+    db.DB_BACKEND, db.SQLITE_PATH = 'sqlite', ':memory:'
+    for label, until in (('an empty database', None), ('the initial schema', 1)):
+        await db.close_pool()  # The next pool opens a new, empty in-memory database
+        if until:
+            await migrator.run_migrations(until=until)
+        schema = await sqlite_schema()
+        pending = await migrator.run_migrations(dry_run=True)
+        assert await sqlite_schema() == schema, f"The dry run on {label} changed the schema."
+        logger.info(f"Dry run on {label} went through {len(pending)} migration(s).")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m database.manage', description='Music Monkey database maintenance')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = commands.add_parser('migrate', help='Apply pending schema migrations')
+    migrate_parser.add_argument('--dry-run', action='store_true',
+                                help='Log the statements that would run without changing the database')
+    migrate_parser.set_defaults(handler=migrate)
+
+    status_parser = commands.add_parser('status', help='List applied and pending migrations')
+    status_parser.set_defaults(handler=status)
+
+    rebuild_parser = commands.add_parser('rebuild-user-stats', help='Rebuild the user_stats rollup from plays')
+    rebuild_parser.add_argument('--user', type=int, help='Only rebuild the stats of this user ID')
+    rebuild_parser.set_defaults(handler=rebuild_user_stats)
+
+    leaderboard_parser = commands.add_parser('rebuild-leaderboard', help='Rebuild guild_leaderboard from plays')
+    leaderboard_parser.add_argument('--guild', type=int, help='Only rebuild the leaderboard of this guild ID')
+    leaderboard_parser.set_defaults(handler=rebuild_leaderboard)
+
+    compact_parser = commands.add_parser('compact-play-events',
+                                         help='Roll all pending play events up into the daily rollups')
+    compact_parser.set_defaults(handler=compact_play_events)
+
+    prune_parser = commands.add_parser('prune-tracks', help='Delete stored tracks no playlist song references')
+    prune_parser.set_defaults(handler=prune_tracks)
+
+    benchmark_parser = commands.add_parser('benchmark-song-tables',
+                                           help='Report the size of the song tables and time the plays-to-songs join')
+    benchmark_parser.add_argument('--runs', type=int, default=5, help='Number of times to run the join')
+    benchmark_parser.set_defaults(handler=benchmark_song_tables)
+
+    budget_parser = commands.add_parser('check-query-budgets',
+                                        help='Check that commands stay within their database query budget')
+    budget_parser.set_defaults(handler=check_query_budgets)
+
+    check_parser = commands.add_parser('check-migrations',
+                                       help='Dry-run every migration on an empty and on an initial-schema database')
+    check_parser.set_defaults(handler=check_migrations)
+    return parser
+
+
+async def main(argv=None):
+    args = build_parser().parse_args(argv)
+    setup_logging()
+    try:
+        await args.handler(args)
+    finally:
+        await db.close_pool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+# Tables that used to be created by setup_database() on every start.
+
+DESCRIPTION = 'Create the base tables'
+
+TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS guilds (
+        guild_id BIGINT NOT NULL,
+        dj_only_enabled BOOLEAN DEFAULT 0,
+        dj_role_id BIGINT,
+        restricted_commands TEXT DEFAULT NULL,
+        updates_enabled TINYINT DEFAULT 1,
+        updates_channel_id BIGINT,
+        PRIMARY KEY (guild_id)
+    )''',
+    '''
+    CREATE TABLE IF NOT EXISTS songs (
+        song_id VARCHAR(255) NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        artist VARCHAR(255) NOT NULL,
+        length INT NOT NULL,
+        uri VARCHAR(255) NOT NULL,
+        PRIMARY KEY (song_id)
+    )''',
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id BIGINT NOT NULL,
+        guild_id BIGINT NOT NULL,
+        PRIMARY KEY (user_id, guild_id),
+        FOREIGN KEY (guild_id) REFERENCES guilds(guild_id)
+    )''',
+    '''
+    CREATE TABLE IF NOT EXISTS plays (
+        user_id BIGINT NOT NULL,
+        guild_id BIGINT NOT NULL,
+        song_id VARCHAR(255) NOT NULL,
+        count INT,
+        PRIMARY KEY (user_id, guild_id, song_id),
+        FOREIGN KEY (user_id, guild_id) REFERENCES users(user_id, guild_id),
+        FOREIGN KEY (song_id) REFERENCES songs(song_id)
+    )''',
+    '''
+    CREATE TABLE IF NOT EXISTS wonderTrades (
+        user_id BIGINT NOT NULL,
+        song_id VARCHAR(255) NOT NULL,
+        note VARCHAR(60),
+        PRIMARY KEY (user_id, song_id),
+        FOREIGN KEY (user_id) REFERENCES users(user_id),
+        FOREIGN KEY (song_id) REFERENCES songs(song_id)
+    )''',
+    '''
+    CREATE TABLE IF NOT EXISTS playlists (
+        playlist_id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        guild_id BIGINT NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        privacy TINYINT NOT NULL,
+        collaborators TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(user_id),
+        FOREIGN KEY (guild_id) REFERENCES guilds(guild_id)
+    )''',
+    '''
+    CREATE TABLE IF NOT EXISTS playlist_songs (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        playlist_id INT NOT NULL,
+        song_id VARCHAR(255) NOT NULL,
+        song_name VARCHAR(255) NOT NULL,
+        artist VARCHAR(255) NOT NULL,
+        raw_data JSON NOT NULL,
+        FOREIGN KEY (playlist_id) REFERENCES playlists(playlist_id)
+    )''',
+    '''
+    CREATE TABLE IF NOT EXISTS playlist_invites (
+        invite_id INT AUTO_INCREMENT PRIMARY KEY,
+        playlist_id INT NOT NULL,
+        invitee_id BIGINT NOT NULL,
+        FOREIGN KEY (playlist_id) REFERENCES playlists(playlist_id)
+    )'''
+]
+
+
+async def upgrade(m):
+    for statement in TABLES:
+        await m.execute(statement)
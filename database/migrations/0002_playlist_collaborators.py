@@ -0,0 +1,33 @@
+# Moves collaborators from the comma-separated playlists.collaborators column into an indexed join table.
+
+DESCRIPTION = 'Create playlist_collaborators and migrate the legacy collaborators column'
+
+
+async def upgrade(m):
+    await m.execute('''
+    CREATE TABLE IF NOT EXISTS playlist_collaborators (
+        playlist_id INT NOT NULL,
+        user_id BIGINT NOT NULL,
+        PRIMARY KEY (playlist_id, user_id),
+        INDEX idx_playlist_collaborators_user (user_id),
+        FOREIGN KEY (playlist_id) REFERENCES playlists(playlist_id)
+    )''')
+
+    legacy = []
+    if await m.column_exists('playlists', 'collaborators'):
+        legacy = await m.fetchall("SELECT playlist_id, collaborators FROM playlists "
+                                  "WHERE collaborators IS NOT NULL AND collaborators NOT IN ('', '[]')")
+    rows = []
+    for playlist_id, collaborators in legacy:
+        for collaborator_id in collaborators.split(','):
+            collaborator_id = collaborator_id.strip()
+            if collaborator_id.isdigit():
+                rows.append((playlist_id, int(collaborator_id)))
+
+    async with m.transaction():
+        if rows:
+            await m.executemany('INSERT IGNORE INTO playlist_collaborators (playlist_id, user_id) VALUES (%s, %s)',
+                                rows)
+        if legacy:
+            await m.executemany('UPDATE playlists SET collaborators = NULL WHERE playlist_id = %s',
+                                [(playlist_id,) for playlist_id, _ in legacy])
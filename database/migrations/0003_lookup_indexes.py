@@ -0,0 +1,17 @@
+# Indexes for the lookups that previously scanned whole tables.
+
+DESCRIPTION = 'Add indexes on playlist names, guilds, playlist songs, plays and song URIs'
+
+INDEXES = [
+    ('playlists', 'idx_playlists_name', ['name']),
+    ('playlists', 'idx_playlists_user_name', ['user_id', 'name']),
+    ('playlists', 'idx_playlists_guild', ['guild_id']),
+    ('playlist_songs', 'idx_playlist_songs_playlist_song', ['playlist_id', 'song_id']),
+    ('plays', 'idx_plays_guild', ['guild_id']),
+    ('songs', 'idx_songs_uri', ['uri'])
+]
+
+
+async def upgrade(m):
+    for table, name, columns in INDEXES:
+        await m.create_index(table, name, columns)
@@ -0,0 +1,20 @@
+# Gives every wondertrade a dense, indexed sequence number so a random one can be picked with an index seek.
+
+DESCRIPTION = 'Add an auto-increment trade_id to wonderTrades'
+
+
+async def upgrade(m):
+    if await m.column_exists('wonderTrades', 'trade_id'):
+        return
+    if m.dialect == 'sqlite':
+        # SQLite cannot add an AUTO_INCREMENT column, so trade_id mirrors the rowid through a trigger
+        await m.execute('ALTER TABLE wonderTrades ADD COLUMN trade_id INTEGER')
+        await m.execute('UPDATE wonderTrades SET trade_id = rowid')
+        await m.execute('CREATE UNIQUE INDEX uq_wondertrades_trade_id ON wonderTrades (trade_id)')
+        await m.execute('CREATE TRIGGER trg_wondertrades_trade_id AFTER INSERT ON wonderTrades '
+                        'WHEN NEW.trade_id IS NULL '
+                        'BEGIN UPDATE wonderTrades SET trade_id = NEW.rowid WHERE rowid = NEW.rowid; END')
+        return
+    await m.execute('ALTER TABLE wonderTrades '
+                    'ADD COLUMN trade_id BIGINT NOT NULL AUTO_INCREMENT, '
+                    'ADD UNIQUE INDEX uq_wondertrades_trade_id (trade_id)')
@@ -0,0 +1,40 @@
+# Rollup tables behind /profile and /recap, maintained by the play counter flush.
+
+from database import database as db
+
+DESCRIPTION = 'Create the user_stats rollup with per-artist and per-song tallies'
+
+TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS user_stats (
+        user_id BIGINT NOT NULL PRIMARY KEY,
+        total_plays BIGINT NOT NULL DEFAULT 0,
+        total_ms BIGINT NOT NULL DEFAULT 0,
+        top_artist VARCHAR(255),
+        top_song VARCHAR(255)
+    )''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_artist_plays (
+        user_id BIGINT NOT NULL,
+        artist VARCHAR(255) NOT NULL,
+        plays BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, artist),
+        INDEX idx_user_artist_plays_top (user_id, plays)
+    )''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_song_plays (
+        user_id BIGINT NOT NULL,
+        song_id VARCHAR(255) NOT NULL,
+        plays BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, song_id),
+        INDEX idx_user_song_plays_top (user_id, plays)
+    )'''
+]
+
+
+async def upgrade(m):
+    for statement in TABLES:
+        await m.execute(statement)
+    # The backfill reads plays by song_key; schemas from before 0011 get it from that migration instead
+    if await m.column_exists('plays', 'song_key'):
+        await m.run('Backfilling user_stats from plays', db.rebuild_user_stats, None, m.conn)
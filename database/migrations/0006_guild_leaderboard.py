@@ -0,0 +1,17 @@
+# Per-guild play totals behind /leaderboard, maintained by the play counter flush.
+
+from database import database as db
+
+DESCRIPTION = 'Create the guild_leaderboard summary table'
+
+
+async def upgrade(m):
+    await m.execute('''
+    CREATE TABLE IF NOT EXISTS guild_leaderboard (
+        guild_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        plays BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, user_id),
+        INDEX idx_guild_leaderboard_rank (guild_id, plays, user_id)
+    )''')
+    await m.run('Backfilling guild_leaderboard from plays', db.rebuild_leaderboard, None, m.conn)
@@ -0,0 +1,19 @@
+# Stores each song's streaming service so recaps can group by it instead of classifying URIs.
+
+DESCRIPTION = 'Add an indexed source column to songs and backfill it from the URIs'
+
+
+async def upgrade(m):
+    if not await m.column_exists('songs', 'source'):
+        await m.execute("ALTER TABLE songs ADD COLUMN source VARCHAR(32) NOT NULL DEFAULT 'Other'")
+
+    # Same precedence as database.song_source(); LIKE is case-insensitive under the default collation
+    await m.execute('''
+    UPDATE songs SET source = CASE
+        WHEN uri LIKE '%youtube%' THEN 'YouTube'
+        WHEN uri LIKE '%soundcloud%' THEN 'SoundCloud'
+        WHEN uri LIKE '%spotify%' THEN 'Spotify'
+        WHEN uri LIKE '%deezer%' THEN 'Deezer'
+        ELSE 'Other'
+    END''')
+    await m.create_index('songs', 'idx_songs_source', ['source'])
@@ -0,0 +1,12 @@
+# Keeps a song count on every playlist so listings never have to count (or load) its songs.
+
+DESCRIPTION = 'Add a maintained song_count column to playlists'
+
+
+async def upgrade(m):
+    if not await m.column_exists('playlists', 'song_count'):
+        await m.execute('ALTER TABLE playlists ADD COLUMN song_count INT NOT NULL DEFAULT 0')
+    await m.execute('''
+    UPDATE playlists SET song_count = (
+        SELECT COUNT(*) FROM playlist_songs AS ps WHERE ps.playlist_id = playlists.playlist_id
+    )''')
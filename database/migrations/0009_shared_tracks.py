@@ -0,0 +1,64 @@
+# Moves the Lavalink track JSON out of playlist_songs into a shared, content-addressed tracks table.
+# Every distinct track is stored once, compressed, and playlist_songs rows reference it by hash.
+
+import json
+from database import database as db
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+DESCRIPTION = 'Deduplicate playlist track data into a compressed, content-addressed tracks table'
+
+BATCH_SIZE = 500
+
+
+async def upgrade(m):
+    await m.execute('''
+    CREATE TABLE IF NOT EXISTS tracks (
+        track_hash BINARY(32) NOT NULL PRIMARY KEY,
+        data MEDIUMBLOB NOT NULL
+    )''')
+
+    if not await m.column_exists('playlist_songs', 'track_hash'):
+        await m.execute('ALTER TABLE playlist_songs ADD COLUMN track_hash BINARY(32) NULL')
+    if not await m.column_exists('playlist_songs', 'raw_data'):
+        return
+
+    rows, before = await m.fetchone('SELECT COUNT(*), COALESCE(SUM(LENGTH(raw_data)), 0) FROM playlist_songs')
+    logger.info(f"Moving the track data of {rows} playlist songs ({before / 1024:.1f} KiB of JSON) into tracks.")
+
+    # Walk the table by primary key so each batch is a range read, and so a dry run still terminates
+    last_id = 0
+    while True:
+        batch = await m.fetchall('SELECT id, raw_data FROM playlist_songs WHERE id > %s ORDER BY id LIMIT %s',
+                                 (last_id, BATCH_SIZE))
+        if not batch:
+            break
+        last_id = batch[-1][0]
+
+        tracks, references = {}, []
+        for song_id, raw_data in batch:
+            track_hash, data = db.encode_track(json.loads(raw_data) if isinstance(raw_data, str) else raw_data)
+            tracks[track_hash] = data
+            references.append((track_hash, song_id))
+
+        async with m.transaction():
+            await m.executemany('INSERT IGNORE INTO tracks (track_hash, data) VALUES (%s, %s)', list(tracks.items()))
+            await m.executemany('UPDATE playlist_songs SET track_hash = %s WHERE id = %s', references)
+
+    if not m.dry_run:
+        tracks, after = await m.fetchone('SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM tracks')
+        saved = 100 * (1 - after / before) if before else 0
+        logger.info(f"{rows} playlist songs now share {tracks} stored tracks: "
+                    f"{before / 1024:.1f} KiB of JSON became {after / 1024:.1f} KiB compressed ({saved:.1f}% saved).")
+
+    if m.dialect == 'sqlite':
+        # SQLite can drop a column but not retype one or add a constraint to an existing table
+        await m.execute('ALTER TABLE playlist_songs DROP COLUMN raw_data')
+        await m.create_index('playlist_songs', 'idx_playlist_songs_track', ['track_hash'])
+        return
+    await m.execute('ALTER TABLE playlist_songs '
+                    'DROP COLUMN raw_data, '
+                    'MODIFY track_hash BINARY(32) NOT NULL, '
+                    'ADD INDEX idx_playlist_songs_track (track_hash), '
+                    'ADD CONSTRAINT fk_playlist_songs_track FOREIGN KEY (track_hash) REFERENCES tracks (track_hash)')
@@ -0,0 +1,63 @@
+# Append-only log of individual plays, partitioned by month on MySQL, with daily per-user rollups
+# that the compactor keeps up to date. Time-windowed stats read only the rollups.
+
+from database import database as db
+
+DESCRIPTION = 'Create the play_events log, its daily rollups and the rollup watermark'
+
+TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS user_daily_plays (
+        user_id BIGINT NOT NULL,
+        day DATE NOT NULL,
+        plays INT NOT NULL DEFAULT 0,
+        ms BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day)
+    )''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_daily_song_plays (
+        user_id BIGINT NOT NULL,
+        day DATE NOT NULL,
+        song_id VARCHAR(255) NOT NULL,
+        plays INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, song_id)
+    )''',
+    '''
+    CREATE TABLE IF NOT EXISTS rollup_watermarks (
+        name VARCHAR(64) NOT NULL PRIMARY KEY,
+        last_event_id BIGINT NOT NULL DEFAULT 0
+    )'''
+]
+
+
+async def upgrade(m):
+    if m.dialect == 'sqlite':
+        await m.execute('''
+        CREATE TABLE IF NOT EXISTS play_events (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            played_at DATETIME NOT NULL,
+            user_id BIGINT NOT NULL,
+            guild_id BIGINT NOT NULL,
+            song_id VARCHAR(255) NOT NULL,
+            source VARCHAR(32) NOT NULL DEFAULT 'Other'
+        )''')
+    else:
+        # The partition column has to be part of every unique key, hence the (event_id, played_at) key
+        partitions = ', '.join(db.play_event_partition(month) for month in db.upcoming_months())
+        await m.execute(f'''
+        CREATE TABLE IF NOT EXISTS play_events (
+            event_id BIGINT NOT NULL AUTO_INCREMENT,
+            played_at DATETIME NOT NULL,
+            user_id BIGINT NOT NULL,
+            guild_id BIGINT NOT NULL,
+            song_id VARCHAR(255) NOT NULL,
+            source VARCHAR(32) NOT NULL DEFAULT 'Other',
+            PRIMARY KEY (event_id, played_at)
+        )
+        PARTITION BY RANGE COLUMNS (played_at) (
+            {partitions},
+            PARTITION pmax VALUES LESS THAN (MAXVALUE)
+        )''')
+
+    for statement in TABLES:
+        await m.execute(statement)
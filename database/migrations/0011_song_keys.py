@@ -0,0 +1,222 @@
+# Keys songs by an integer song_key instead of the VARCHAR(255) Lavalink id, which stays on songs behind
+# a unique index. The tables referencing songs are rebuilt around song_key, so their primary keys and
+# indexes hold 8-byte integers instead of long strings. playlist_songs keeps its song_id: it is the
+# Lavalink id of tracks that need not be in songs at all, and no key or foreign key is built on it.
+
+from database import database as db
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+DESCRIPTION = 'Key songs by an integer song_key and reference it from the play and wondertrade tables'
+
+EVENT_BATCH_SIZE = 10000
+
+# Secondary indexes of the rebuilt tables. SQLite index names are global, so they are created only
+# once the old tables are dropped.
+#
+# Each table is built as <table>_new, filled and checked before it replaces the original, and the
+# originals are only dropped once every copy checked out, so a run that fails anywhere can be repeated.
+INDEXES = [
+    ('songs', 'idx_songs_uri', ['uri']),
+    ('songs', 'idx_songs_source', ['source']),
+    ('plays', 'idx_plays_guild', ['guild_id']),
+    ('user_song_plays', 'idx_user_song_plays_top', ['user_id', 'plays'])
+]
+
+
+# Returns (table, CREATE TABLE statement, columns, SELECT producing them from the old table) in the order the
+# tables have to be rebuilt: songs first, since the others look their song_key up in it. The statements
+# are templates: {table} is the table being created and {source} the old table the rows come from.
+def rebuilt_tables(dialect):
+    if dialect == 'sqlite':
+        song_key = 'song_key INTEGER PRIMARY KEY AUTOINCREMENT'
+        trade_id = 'trade_id INTEGER'
+        trade_index = ''
+    else:
+        song_key = 'song_key BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY'
+        trade_id = 'trade_id BIGINT NOT NULL AUTO_INCREMENT'
+        # MySQL wants an AUTO_INCREMENT column indexed when the table is created
+        trade_index = ',\n        UNIQUE INDEX uq_wondertrades_trade_id (trade_id)'
+
+    return [
+        ('songs', f'''
+        CREATE TABLE {{table}} (
+            {song_key},
+            song_id VARCHAR(255) NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            artist VARCHAR(255) NOT NULL,
+            length INT NOT NULL,
+            uri VARCHAR(255) NOT NULL,
+            source VARCHAR(32) NOT NULL DEFAULT 'Other',
+            UNIQUE INDEX uq_songs_song_id (song_id)
+        )''',
+         'song_id, name, artist, length, uri, source',
+         'SELECT song_id, name, artist, length, uri, source FROM {source}'),
+        ('plays', '''
+        CREATE TABLE {table} (
+            user_id BIGINT NOT NULL,
+            guild_id BIGINT NOT NULL,
+            song_key BIGINT NOT NULL,
+            count INT,
+            PRIMARY KEY (user_id, guild_id, song_key),
+            CONSTRAINT fk_plays_user FOREIGN KEY (user_id, guild_id) REFERENCES users(user_id, guild_id),
+            CONSTRAINT fk_plays_song FOREIGN KEY (song_key) REFERENCES songs(song_key)
+        )''',
+         'user_id, guild_id, song_key, count',
+         'SELECT t.user_id, t.guild_id, s.song_key, t.count FROM {source} AS t '
+         'JOIN songs AS s ON s.song_id = t.song_id'),
+        ('wonderTrades', f'''
+        CREATE TABLE {{table}} (
+            {trade_id},
+            user_id BIGINT NOT NULL,
+            song_key BIGINT NOT NULL,
+            note VARCHAR(60),
+            PRIMARY KEY (user_id, song_key),
+            CONSTRAINT fk_wondertrades_user FOREIGN KEY (user_id) REFERENCES users(user_id),
+            CONSTRAINT fk_wondertrades_song FOREIGN KEY (song_key) REFERENCES songs(song_key){trade_index}
+        )''',
+         'trade_id, user_id, song_key, note',
+         'SELECT t.trade_id, t.user_id, s.song_key, t.note FROM {source} AS t '
+         'JOIN songs AS s ON s.song_id = t.song_id'),
+        # Refilled by the user stats rebuild at the end
+        ('user_song_plays', '''
+        CREATE TABLE {table} (
+            user_id BIGINT NOT NULL,
+            song_key BIGINT NOT NULL,
+            plays BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, song_key)
+        )''', None, None),
+        ('user_daily_song_plays', '''
+        CREATE TABLE {table} (
+            user_id BIGINT NOT NULL,
+            day DATE NOT NULL,
+            song_key BIGINT NOT NULL,
+            plays INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, song_key)
+        )''',
+         'user_id, day, song_key, plays',
+         'SELECT t.user_id, t.day, s.song_key, t.plays FROM {source} AS t '
+         'JOIN songs AS s ON s.song_id = t.song_id')
+    ]
+
+
+async def measure(m, column):
+    if m.dry_run:
+        return {}, None
+    return await db.get_table_sizes(m.cur), await db.time_song_join(m.cur, column)
+
+
+# Copies the rows of source into table and checks that every row that can be keyed arrived.
+async def copy_rows(m, table, columns, select, source):
+    rows = select.format(source=source)
+    copied = await m.execute(f'INSERT INTO {table} ({columns}) {rows}')
+    if m.dry_run:
+        return
+    (expected,) = await m.fetchone(f'SELECT COUNT(*) FROM ({rows}) AS c')
+    (total,) = await m.fetchone(f'SELECT COUNT(*) FROM {source}')
+    (actual,) = await m.fetchone(f'SELECT COUNT(*) FROM {table}')
+    if actual != expected:
+        raise RuntimeError(f"Copying {source} into {table} left {actual} of {expected} rows; "
+                           f"{source} is kept, the migration can be run again.")
+    if total != expected:
+        logger.warning(f"Dropped {total - expected} rows of {source} that reference songs missing from songs.")
+    logger.info(f"Copied {copied} rows from {source} into {table}.")
+
+
+# Rebuilds one table as <table>_new, verifies the copy and swaps it in, keeping the old table as
+# <table>_old. A table renamed away by an earlier interrupted run is rebuilt from <table>_old.
+async def rebuild_table(m, table, create, columns, select):
+    exists = await m.table_exists(table)
+    source = table if exists else f'{table}_old'
+    await m.execute(f'DROP TABLE IF EXISTS {table}_new')
+    await m.execute(create.format(table=f'{table}_new'))
+    if select:
+        await copy_rows(m, f'{table}_new', columns, select, source)
+
+    if not exists:
+        await m.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+    elif m.dialect == 'sqlite':
+        # SQLite DDL is transactional, so the two renames land together
+        async with m.transaction():
+            await m.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
+            await m.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+    else:
+        # The old table is renamed away, so foreign keys of tables not yet rebuilt follow it
+        await m.execute(f'RENAME TABLE {table} TO {table}_old, {table}_new TO {table}')
+
+
+# Refills tables that were swapped in by an earlier run whose copy did not complete, from their _old
+# table. If songs is refilled its keys change, so every table keyed against it is refilled as well.
+async def refill_swapped_tables(m, tables):
+    stale = []
+    for table, _, columns, select in tables:
+        if not select or not await m.table_exists(f'{table}_old') or not await m.column_exists(table, 'song_key'):
+            continue
+        rows = select.format(source=f'{table}_old')
+        (expected,) = await m.fetchone(f'SELECT COUNT(*) FROM ({rows}) AS c')
+        (actual,) = await m.fetchone(f'SELECT COUNT(*) FROM {table}')
+        if stale or actual != expected:
+            stale.append((table, columns, select))
+    if not stale:
+        return
+
+    logger.warning(f"Refilling {', '.join(table for table, _, _ in stale)} from their old tables.")
+    async with m.transaction():
+        for table, _, _ in reversed(stale):
+            await m.execute(f'DELETE FROM {table}')
+        for table, columns, select in stale:
+            await copy_rows(m, table, columns, select, f'{table}_old')
+
+
+async def upgrade(m):
+    tables = rebuilt_tables(m.dialect)
+    sizes_before, join_before = {}, None
+    if not await m.column_exists('songs', 'song_key') and await m.table_exists('songs'):
+        sizes_before, join_before = await measure(m, 'song_id')
+
+    await refill_swapped_tables(m, tables)
+    for table, create, columns, select in tables:
+        if not await m.column_exists(table, 'song_key'):
+            await rebuild_table(m, table, create, columns, select)
+
+    # play_events is partitioned on MySQL, so it gets its song_key in place rather than being rebuilt
+    if not await m.column_exists('play_events', 'song_key'):
+        await m.execute('ALTER TABLE play_events ADD COLUMN song_key BIGINT NULL')
+    if await m.column_exists('play_events', 'song_id'):
+        low, high = await m.fetchone('SELECT MIN(event_id), MAX(event_id) FROM play_events')
+        for start in range(low or 0, (high or 0) + 1, EVENT_BATCH_SIZE):
+            await m.execute('UPDATE play_events SET song_key = '
+                            '(SELECT s.song_key FROM songs AS s WHERE s.song_id = play_events.song_id) '
+                            'WHERE event_id >= %s AND event_id < %s', (start, start + EVENT_BATCH_SIZE))
+        # Events of songs missing from songs could never be joined to one
+        await m.execute('DELETE FROM play_events WHERE song_key IS NULL')
+        if m.dialect == 'sqlite':
+            await m.execute('ALTER TABLE play_events DROP COLUMN song_id')
+        else:
+            await m.execute('ALTER TABLE play_events DROP COLUMN song_id, MODIFY song_key BIGINT NOT NULL')
+
+    # Every copy is verified by now. Tables referencing songs_old go first.
+    for table, *_ in reversed(tables):
+        await m.execute(f'DROP TABLE IF EXISTS {table}_old')
+
+    for table, name, columns in INDEXES:
+        await m.create_index(table, name, columns)
+    if m.dialect == 'sqlite':
+        # The trade_id trigger of 0004 went with the old table
+        await m.create_index('wonderTrades', 'uq_wondertrades_trade_id', ['trade_id'], unique=True)
+        await m.execute('CREATE TRIGGER IF NOT EXISTS trg_wondertrades_trade_id AFTER INSERT ON wonderTrades '
+                        'WHEN NEW.trade_id IS NULL '
+                        'BEGIN UPDATE wonderTrades SET trade_id = NEW.rowid WHERE rowid = NEW.rowid; END')
+
+    # Also after a re-run, since an earlier attempt may have stopped before it
+    await m.run('Rebuilding user_stats from the re-keyed plays', db.rebuild_user_stats, None, m.conn)
+
+    if sizes_before and not m.dry_run:
+        sizes_after, join_after = await measure(m, 'song_key')
+        for table in db.SONG_TABLES:
+            if table in sizes_before and table in sizes_after:
+                logger.info(f"{table}: indexes {sizes_before[table][1] / 1024:.1f} KiB -> "
+                            f"{sizes_after[table][1] / 1024:.1f} KiB, data {sizes_before[table][0] / 1024:.1f} KiB -> "
+                            f"{sizes_after[table][0] / 1024:.1f} KiB")
+        logger.info(f"plays-to-songs join: {join_before:.1f} ms on song_id, {join_after:.1f} ms on song_key.")
@@ -0,0 +1,51 @@
+# Gives every playlist song a stable position within its playlist, so pages can be read with an index
+# seek past the last position shown instead of an OFFSET that scans every earlier row.
+
+DESCRIPTION = 'Add an indexed position column to playlist_songs'
+
+BATCH_SIZE = 1000
+
+
+# Returns True while some playlist still has songs without a position or sharing one, as after a run
+# that stopped before the numbering finished
+async def needs_numbering(m):
+    if await m.fetchone('SELECT 1 FROM playlist_songs WHERE position = 0 LIMIT 1'):
+        return True
+    duplicate = await m.fetchone('SELECT 1 FROM playlist_songs GROUP BY playlist_id, position '
+                                 'HAVING COUNT(*) > 1 LIMIT 1')
+    return duplicate is not None
+
+
+# Numbers the songs of each playlist 1, 2, 3... in insertion order, walking the table by
+# (playlist_id, id) so each batch is a range read and the numbering carries across batches
+async def number_songs(m):
+    last_playlist_id, last_id, position = 0, 0, 0
+    while True:
+        batch = await m.fetchall(
+            'SELECT playlist_id, id FROM playlist_songs '
+            'WHERE playlist_id > %s OR (playlist_id = %s AND id > %s) ORDER BY playlist_id, id LIMIT %s',
+            (last_playlist_id, last_playlist_id, last_id, BATCH_SIZE))
+        if not batch:
+            break
+
+        positions = []
+        for playlist_id, row_id in batch:
+            position = position + 1 if playlist_id == last_playlist_id else 1
+            last_playlist_id, last_id = playlist_id, row_id
+            positions.append((position, row_id))
+        async with m.transaction():
+            await m.executemany('UPDATE playlist_songs SET position = %s WHERE id = %s', positions)
+
+
+# Each step checks its own state, so a run that stopped after any of them picks up where it left off
+async def upgrade(m):
+    if not await m.column_exists('playlist_songs', 'position'):
+        await m.execute('ALTER TABLE playlist_songs ADD COLUMN position INT NOT NULL DEFAULT 0')
+
+    # The column is only missing here in a dry run, where the steps before were logged instead of applied
+    if not await m.column_exists('playlist_songs', 'position'):
+        await m.run('Numbering playlist songs by insertion order', number_songs, m)
+    elif not await m.index_exists('playlist_songs', 'uq_playlist_songs_position') and await needs_numbering(m):
+        await number_songs(m)
+
+    await m.create_index('playlist_songs', 'uq_playlist_songs_position', ['playlist_id', 'position'], unique=True)
@@ -0,0 +1,13 @@
+# Lets a playlist opt into holding every track at most once. Songs of such a playlist carry their song_id
+# in dedupe_key, and a unique index on (playlist_id, dedupe_key) turns a repeated add into a no-op.
+# Other playlists leave dedupe_key NULL, which the index never treats as a duplicate.
+
+DESCRIPTION = 'Add an optional unique tracks mode to playlists'
+
+
+async def upgrade(m):
+    if not await m.column_exists('playlists', 'unique_tracks'):
+        await m.execute('ALTER TABLE playlists ADD COLUMN unique_tracks TINYINT NOT NULL DEFAULT 0')
+    if not await m.column_exists('playlist_songs', 'dedupe_key'):
+        await m.execute('ALTER TABLE playlist_songs ADD COLUMN dedupe_key VARCHAR(255) NULL')
+    await m.create_index('playlist_songs', 'uq_playlist_songs_dedupe', ['playlist_id', 'dedupe_key'], unique=True)
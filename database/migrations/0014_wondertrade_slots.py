@@ -0,0 +1,22 @@
+# Numbers the wondertrades 1..n in a dense slot column, so a uniformly random one is picked with a single
+# index seek on a random slot. trade_id alone is not enough: claimed trades leave gaps in it, and seeking
+# past a random trade_id favours the trades after the largest gaps.
+
+DESCRIPTION = 'Add a dense, indexed slot number to wonderTrades'
+
+
+async def upgrade(m):
+    if not await m.column_exists('wonderTrades', 'slot'):
+        await m.execute('ALTER TABLE wonderTrades ADD COLUMN slot BIGINT NULL')
+
+    # Renumbered from scratch, so a run that stopped halfway is simply repeated. trade_id is only
+    # missing in a dry run, where 0004 and 0011 were logged instead of applied.
+    trade_ids = []
+    if await m.column_exists('wonderTrades', 'trade_id'):
+        trade_ids = await m.fetchall('SELECT trade_id FROM wonderTrades ORDER BY trade_id')
+    async with m.transaction():
+        await m.execute('UPDATE wonderTrades SET slot = NULL')
+        await m.executemany('UPDATE wonderTrades SET slot = %s WHERE trade_id = %s',
+                            [(slot, trade_id) for slot, (trade_id,) in enumerate(trade_ids, start=1)])
+
+    await m.create_index('wonderTrades', 'uq_wondertrades_slot', ['slot'], unique=True)
@@ -0,0 +1,17 @@
+# Hands out wondertrade slots from a counter row instead of after the highest slot in use. Submitters
+# no longer lock the last slot to number a trade, so two of them can never take the same slot, and
+# claiming a trade no longer has to move the last one into its gap, which left every receiver waiting on
+# the same row. The slots may now have gaps; receive_wonder_trade looks up random slots until it hits one.
+
+DESCRIPTION = 'Add a counter that hands out wondertrade slots'
+
+
+async def upgrade(m):
+    await m.execute('''
+    CREATE TABLE IF NOT EXISTS wonder_trade_slots (
+        id TINYINT NOT NULL PRIMARY KEY,
+        last_slot BIGINT NOT NULL
+    )''')
+    # Kept as it is if an earlier run already created it
+    await m.execute('INSERT IGNORE INTO wonder_trade_slots (id, last_slot) '
+                    'SELECT 1, COALESCE(MAX(slot), 0) FROM wonderTrades')
@@ -0,0 +1,8 @@
+# Numbered schema migrations, applied in order by database/migrator.py.
+#
+# Each module is named NNNN_short_description.py and defines:
+#   DESCRIPTION     - one line shown in the logs when the migration runs
+#   upgrade(m)      - coroutine receiving a MigrationContext
+#
+# MySQL commits DDL implicitly, so a migration that fails halfway is simply run again on the next
+# start. Write every step so that repeating it is harmless (IF NOT EXISTS, m.index_exists(), ...).
@@ -0,0 +1,205 @@
+# ========================================= #
+# Author: Noah S. Kipp                      #
+# Collaborator: Samuel Jaden Garcia Munoz   #
+# Created on: 17.10.2026                    #
+# ========================================= #
+
+import importlib
+import pkgutil
+import re
+import time
+from contextlib import asynccontextmanager
+from database import database as db
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+MIGRATIONS_PACKAGE = 'database.migrations'
+
+# Named lock that keeps two bot processes from migrating the same schema at once
+MIGRATION_LOCK_NAME = 'music_monkey_schema_migrations'
+MIGRATION_LOCK_TIMEOUT = 60
+
+
+class MigrationContext:
+    # Handed to every migration's upgrade(). Reads always run; writes are only logged in dry-run mode.
+    # A dry run therefore never creates the tables and columns of the migrations before it, so a
+    # migration reading them checks table_exists()/column_exists() first.
+    # dialect is 'mysql' or 'sqlite', for the few statements a migration has to spell differently.
+    def __init__(self, conn, cur, dry_run=False, dialect='mysql'):
+        self.conn = conn
+        self.cur = cur
+        self.dry_run = dry_run
+        self.dialect = dialect
+
+    async def execute(self, sql, params=None):
+        if self.dry_run:
+            logger.info(f"[dry-run] {' '.join(sql.split())}" + (f" {params}" if params else ""))
+            return 0
+        return await self.cur.execute(sql, params)
+
+    async def executemany(self, sql, rows):
+        if self.dry_run:
+            logger.info(f"[dry-run] {' '.join(sql.split())} ({len(rows)} rows)")
+            return 0
+        return await self.cur.executemany(sql, rows)
+
+    async def fetchone(self, sql, params=None):
+        await self.cur.execute(sql, params)
+        return await self.cur.fetchone()
+
+    async def fetchall(self, sql, params=None):
+        await self.cur.execute(sql, params)
+        return await self.cur.fetchall()
+
+    async def run(self, description, function, *args):
+        # Runs a data backfill implemented in the database module, or only logs it in dry-run mode
+        if self.dry_run:
+            logger.info(f"[dry-run] {description}")
+            return None
+        logger.info(description)
+        return await function(*args)
+
+    @asynccontextmanager
+    async def transaction(self):
+        if self.dry_run:
+            yield
+            return
+        await self.conn.begin()
+        try:
+            yield
+            await self.conn.commit()
+        except Exception:
+            await self.conn.rollback()
+            raise
+
+    async def table_exists(self, table):
+        if self.dialect == 'sqlite':
+            return await self.fetchone("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                                       (table,)) is not None
+        row = await self.fetchone(
+            'SELECT 1 FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+            (table,))
+        return row is not None
+
+    async def column_exists(self, table, column):
+        if self.dialect == 'sqlite':
+            return await self.fetchone('SELECT 1 FROM pragma_table_info(%s) WHERE name = %s',
+                                       (table, column)) is not None
+        row = await self.fetchone(
+            'SELECT 1 FROM information_schema.columns '
+            'WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s',
+            (table, column))
+        return row is not None
+
+    async def index_exists(self, table, index):
+        if self.dialect == 'sqlite':
+            return await self.fetchone("SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s",
+                                       (table, index)) is not None
+        row = await self.fetchone(
+            'SELECT 1 FROM information_schema.statistics '
+            'WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1',
+            (table, index))
+        return row is not None
+
+    async def create_index(self, table, name, columns, unique=False):
+        if await self.index_exists(table, name):
+            logger.info(f"Index {name} on {table} already exists, skipping.")
+            return
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        if self.dialect == 'sqlite':
+            await self.execute(f"CREATE {kind} {name} ON {table} ({', '.join(columns)})")
+            return
+        # Online DDL: the index is built in place while the table stays readable and writable
+        await self.execute(f"ALTER TABLE {table} ADD {kind} {name} ({', '.join(columns)}), "
+                           f"ALGORITHM=INPLACE, LOCK=NONE")
+
+
+# Returns (version, name, module) for every numbered module in the migrations package, in order.
+def discover_migrations():
+    package = importlib.import_module(MIGRATIONS_PACKAGE)
+    migrations = []
+    seen = {}
+    for module_info in pkgutil.iter_modules(package.__path__):
+        match = re.match(r'^(\d+)_\w+$', module_info.name)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in seen:
+            raise RuntimeError(f"Migrations {seen[version]} and {module_info.name} share version {version}.")
+        seen[version] = module_info.name
+        module = importlib.import_module(f'{MIGRATIONS_PACKAGE}.{module_info.name}')
+        migrations.append((version, module_info.name, module))
+    return sorted(migrations, key=lambda migration: migration[0])
+
+
+async def get_applied_versions(context):
+    if not await context.table_exists('schema_version'):
+        return set()
+    rows = await context.fetchall('SELECT version FROM schema_version')
+    return {row[0] for row in rows}
+
+
+# A SQLite database belongs to a single bot process, so only MySQL needs the named lock.
+async def acquire_migration_lock(cur):
+    if db.DB_BACKEND == 'sqlite':
+        return
+    await cur.execute('SELECT GET_LOCK(%s, %s)', (MIGRATION_LOCK_NAME, MIGRATION_LOCK_TIMEOUT))
+    (locked,) = await cur.fetchone()
+    if not locked:
+        raise RuntimeError("Timed out waiting for another process to finish migrating the schema.")
+
+
+async def release_migration_lock(cur):
+    if db.DB_BACKEND == 'sqlite':
+        return
+    await cur.execute('SELECT RELEASE_LOCK(%s)', (MIGRATION_LOCK_NAME,))
+    await cur.fetchone()
+
+
+# Applies every pending migration in version order and returns the names of those applied.
+# With dry_run=True the statements are logged instead of executed and nothing is recorded.
+# until stops after the migration with that version.
+async def run_migrations(dry_run=False, until=None):
+    migrations = [migration for migration in discover_migrations() if until is None or migration[0] <= until]
+    async with db.acquire() as conn:
+        async with conn.cursor() as cur:
+            await acquire_migration_lock(cur)
+            try:
+                context = MigrationContext(conn, cur, dry_run=dry_run, dialect=db.DB_BACKEND)
+                applied = await get_applied_versions(context)
+                await context.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INT NOT NULL PRIMARY KEY,
+                    name VARCHAR(255) NOT NULL,
+                    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )''')
+
+                pending = [migration for migration in migrations if migration[0] not in applied]
+                if not pending:
+                    logger.info(f"Database schema is up to date (version {max(applied, default=0)}).")
+                    return []
+
+                prefix = '[dry-run] ' if dry_run else ''
+                for version, name, module in pending:
+                    logger.info(f"{prefix}Applying migration {name}: {module.DESCRIPTION}")
+                    started = time.perf_counter()
+                    await module.upgrade(context)
+                    await context.execute('INSERT INTO schema_version (version, name) VALUES (%s, %s)',
+                                          (version, name))
+                    logger.info(f"{prefix}Migration {name} finished in {time.perf_counter() - started:.2f}s.")
+                return [name for _, name, _ in pending]
+            finally:
+                await release_migration_lock(cur)
+
+
+# Returns the applied and pending migration names without changing anything.
+async def get_migration_status():
+    migrations = discover_migrations()
+    async with db.acquire() as conn:
+        async with conn.cursor() as cur:
+            applied = await get_applied_versions(MigrationContext(conn, cur, dry_run=True, dialect=db.DB_BACKEND))
+    return {
+        'applied': [name for version, name, _ in migrations if version in applied],
+        'pending': [name for version, name, _ in migrations if version not in applied]
+    }
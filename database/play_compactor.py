@@ -0,0 +1,71 @@
+# ========================================= #
+# Author: Noah S. Kipp                      #
+# Collaborator: Samuel Jaden Garcia Munoz   #
+# Created on: 17.10.2026                    #
+# ========================================= #
+
+import asyncio
+from datetime import datetime, timezone
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class PlayEventCompactor:
+    # Periodically rolls the play event log up into the daily rollup tables through compact_callback,
+    # which handles one batch per call and returns how many events it compacted. maintenance_callback
+    # (partition upkeep) runs on start and then once per day.
+    def __init__(self, compact_callback, maintenance_callback, interval=60.0, max_batches=20):
+        self.compact_callback = compact_callback
+        self.maintenance_callback = maintenance_callback
+        self.interval = interval
+        self.max_batches = max_batches
+        self._task = None
+        self._maintained_on = None
+        self._stats = {
+            'runs': 0,
+            'failures': 0,
+            'compacted_events': 0
+        }
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self._stats['failures'] += 1
+                logger.error(f"Play event compaction failed, will retry: {e}")
+            await asyncio.sleep(self.interval)
+
+    # Runs due maintenance, then compacts batches until the log is caught up or max_batches were done.
+    async def run_once(self):
+        today = datetime.now(timezone.utc).date()
+        if self._maintained_on != today:
+            await self.maintenance_callback()
+            self._maintained_on = today
+
+        compacted = 0
+        for _ in range(self.max_batches):
+            events = await self.compact_callback()
+            compacted += events
+            if not events:
+                break
+        self._stats['runs'] += 1
+        self._stats['compacted_events'] += compacted
+        return compacted
+
+    def get_stats(self):
+        return dict(self._stats)
@@ -0,0 +1,200 @@
+# ========================================= #
+# Author: Noah S. Kipp                      #
+# Collaborator: Samuel Jaden Garcia Munoz   #
+# Created on: 17.10.2026                    #
+# ========================================= #
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class PlayCounter:
+    # Aggregates play counts in memory, keyed by (user_id, guild_id, song_id), and writes them
+    # to the database in batches through the given flush callback. Every play is also kept as a
+    # timestamped (user_id, guild_id, song_id, played_at) event for the play event log.
+    # A failed batch is kept and retried after a delay that doubles with every failure in a row, up to
+    # max_backoff seconds, so an outage only holds plays back. Only a batch that failed with one of
+    # data_errors (a row the database rejects) max_retries times in a row is written one row at a time,
+    # and the rows rejected again are dropped, so a bad row cannot hold back the others forever.
+    def __init__(self, flush_callback, interval=5.0, max_pending=500, max_retries=5, max_backoff=300.0,
+                 data_errors=()):
+        self.flush_callback = flush_callback
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.data_errors = data_errors
+        self._pending = {}
+        self._events = []
+        self._failures = 0  # Failed flushes in a row
+        self._data_failures = 0  # Of those, the ones that failed with a data error
+        self._retry_at = 0.0  # time.monotonic() before which the next flush waits, after a failure
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = None
+        self._stats = {
+            'flushes': 0,
+            'failures': 0,
+            'dropped_plays': 0,
+            'flushed_plays': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0
+        }
+
+    def add(self, user_id, guild_id, song_id, count=1):
+        key = (user_id, guild_id, song_id)
+        self._pending[key] = self._pending.get(key, 0) + count
+        played_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        self._events.extend([(user_id, guild_id, song_id, played_at)] * count)
+        if self._task is None:
+            self.start()
+        if len(self._pending) >= self.max_pending and not self.backing_off:
+            self._wakeup.set()  # Size threshold reached, flush without waiting for the timer
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        # Lets a flush in progress finish instead of cancelling it, then drains everything still pending
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._pending:
+            logger.error(f"Dropping {self.backlog} buffered plays that could not be written on shutdown.")
+
+    @asynccontextmanager
+    async def paused(self):
+        # Writes out what is pending, then holds off further flushes for the duration of the block
+        await self.flush()
+        async with self._lock:
+            yield
+
+    @property
+    def backing_off(self):
+        return time.monotonic() < self._retry_at
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(),
+                                       timeout=max(self._retry_at - time.monotonic(), self.interval))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._stopping and not self.backing_off:
+                await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            events, self._events = self._events, []
+            started = time.perf_counter()
+            try:
+                await self.flush_callback(batch, events)
+            except asyncio.CancelledError:
+                self._requeue(batch, events)
+                raise
+            except Exception as e:
+                self._stats['failures'] += 1
+                data_error = isinstance(e, self.data_errors)
+                if data_error:
+                    self._data_failures += 1
+                if not data_error or self._data_failures < self.max_retries:
+                    # Put the batch back so the plays are retried once the delay is over
+                    self._requeue(batch, events)
+                    self._back_off(f"Failed to flush {len(batch)} play counts", e)
+                    return 0
+                logger.error(f"Failed to flush {len(batch)} play counts {self._data_failures} times, "
+                             f"writing them one row at a time: {e}")
+                batch, events, complete = await self._flush_rows(batch, events)
+                if not complete:
+                    return 0
+            self._failures = self._data_failures = 0
+            self._retry_at = 0.0
+
+            elapsed = (time.perf_counter() - started) * 1000
+            plays = sum(batch.values())
+            self._stats['flushes'] += 1
+            self._stats['flushed_plays'] += plays
+            self._stats['last_flush_ms'] = elapsed
+            self._stats['total_flush_ms'] += elapsed
+            self._stats['max_flush_ms'] = max(self._stats['max_flush_ms'], elapsed)
+            logger.debug(f"Flushed {plays} plays across {len(batch)} rows in {elapsed:.1f} ms "
+                         f"(backlog: {self.backlog}).")
+            return plays
+
+    def _back_off(self, message, error):
+        self._failures += 1
+        delay = min(self.interval * 2 ** (self._failures - 1), self.max_backoff)
+        self._retry_at = time.monotonic() + delay
+        logger.error(f"{message}, retrying in {delay:.0f}s (backlog: {self.backlog} plays): {error}")
+
+    def _requeue(self, batch, events):
+        for key, count in batch.items():
+            self._pending[key] = self._pending.get(key, 0) + count
+        self._events[:0] = events
+
+    # Flushes every row of a batch on its own and drops the rows rejected with a data error. Returns the
+    # part written and whether every row was tried; on any other error the rows left are put back and
+    # retried after a delay, since the database itself is failing rather than the row.
+    async def _flush_rows(self, batch, events):
+        events_by_key = {}
+        for event in events:
+            events_by_key.setdefault(event[:3], []).append(event)
+        written, written_events, dropped = {}, [], set()
+        for key, count in batch.items():
+            row_events = events_by_key.get(key, [])
+            try:
+                await self.flush_callback({key: count}, row_events)
+            except asyncio.CancelledError:
+                self._requeue_rest(batch, events, written, dropped)
+                raise
+            except self.data_errors as e:
+                dropped.add(key)
+                self._stats['dropped_plays'] += count
+                logger.error(f"Dropping {count} plays of user {key[0]} in guild {key[1]} for song {key[2]}: {e}")
+                continue
+            except Exception as e:
+                self._requeue_rest(batch, events, written, dropped)
+                self._back_off("Failed to flush play counts one row at a time", e)
+                return written, written_events, False
+            written[key] = count
+            written_events.extend(row_events)
+        return written, written_events, True
+
+    def _requeue_rest(self, batch, events, written, dropped):
+        done = written.keys() | dropped
+        self._requeue({key: count for key, count in batch.items() if key not in done},
+                      [event for event in events if event[:3] not in done])
+
+    @property
+    def backlog(self):
+        return sum(self._pending.values())
+
+    def get_stats(self):
+        flushes = self._stats['flushes']
+        return {
+            'backlog_rows': len(self._pending),
+            'backlog_plays': self.backlog,
+            'flushes': flushes,
+            'failures': self._stats['failures'],
+            'dropped_plays': self._stats['dropped_plays'],
+            'flushed_plays': self._stats['flushed_plays'],
+            'last_flush_ms': round(self._stats['last_flush_ms'], 2),
+            'avg_flush_ms': round(self._stats['total_flush_ms'] / flushes, 2) if flushes else 0.0,
+            'max_flush_ms': round(self._stats['max_flush_ms'], 2)
+        }
@@ -0,0 +1,169 @@
+# ========================================= #
+# Author: Noah S. Kipp                      #
+# Collaborator: Samuel Jaden Garcia Munoz   #
+# Created on: 17.10.2026                    #
+# ========================================= #
+
+# Counts the database round trips, rows and time spent per slash command. A trace is started for
+# an interaction and kept in a context variable, so every connection handed out by database.acquire()
+# inside that command (and any task it spawns) reports its queries to the same trace.
+
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Queries a single command may make before its trace is logged as a warning
+DB_QUERY_BUDGET = int(os.getenv('DB_QUERY_BUDGET', 10))
+
+_current_trace = ContextVar('query_trace', default=None)
+
+
+class QueryTrace:
+    def __init__(self, name, budget=DB_QUERY_BUDGET):
+        self.name = name
+        self.budget = budget
+        self.queries = 0
+        self.rows = 0
+        self.query_ms = 0.0
+        self.statements = []  # (elapsed ms, sql) of every query, for the over-budget report
+        self.started = time.perf_counter()
+        self.elapsed_ms = None
+
+    @property
+    def finished(self):
+        return self.elapsed_ms is not None
+
+    def record(self, sql, elapsed_ms):
+        # Background work that outlives the command (e.g. a flush it triggered) is not billed to it
+        if self.finished:
+            return
+        self.queries += 1
+        self.query_ms += elapsed_ms
+        self.statements.append((elapsed_ms, ' '.join(str(sql).split())[:200]))
+
+    def record_rows(self, rows):
+        if not self.finished:
+            self.rows += rows
+
+    def finish(self):
+        if not self.finished:
+            self.elapsed_ms = (time.perf_counter() - self.started) * 1000
+        return self
+
+    def summary(self):
+        return (f"{self.name}: {self.queries} queries, {self.rows} rows, {self.query_ms:.1f} ms in the database, "
+                f"{self.elapsed_ms or 0:.1f} ms total")
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def start_trace(name, budget=DB_QUERY_BUDGET):
+    trace = QueryTrace(name, budget)
+    _current_trace.set(trace)
+    return trace
+
+
+# Finishes the current trace and logs its summary: as a warning with the slowest statements when it
+# went over budget, otherwise at debug level. Returns the trace, or None if none was running.
+def finish_trace():
+    trace = _current_trace.get()
+    if trace is None or trace.finished:
+        return None
+    trace.finish()
+    _current_trace.set(None)
+    if trace.queries > trace.budget:
+        slowest = sorted(trace.statements, reverse=True)[:3]
+        logger.warning(f"Query budget of {trace.budget} exceeded by {trace.summary()}. Slowest: "
+                       + '; '.join(f"{elapsed:.1f} ms {sql}" for elapsed, sql in slowest))
+    else:
+        logger.debug(trace.summary())
+    return trace
+
+
+# Test helper: runs the block under a fresh trace and fails if it makes more than max_queries queries.
+#   async with assert_query_budget(2, '/play'):
+#       await service.play(interaction, query)
+@asynccontextmanager
+async def assert_query_budget(max_queries, name='test'):
+    previous = _current_trace.get()
+    trace = start_trace(name, budget=max_queries)
+    try:
+        yield trace
+    finally:
+        trace.finish()
+        _current_trace.set(previous)
+    if trace.queries > max_queries:
+        raise AssertionError(f"{trace.summary()} (budget: {max_queries}). Queries: "
+                             + '; '.join(sql for _, sql in trace.statements))
+
+
+# Wraps a pooled connection so its cursors report to the current trace. Without a trace the
+# connection is returned untouched, so untraced code pays nothing.
+def wrap(conn):
+    trace = _current_trace.get()
+    if trace is None or trace.finished:
+        return conn
+    return TracedConnection(conn, trace)
+
+
+class TracedConnection:
+    def __init__(self, conn, trace):
+        self._conn = conn
+        self._trace = trace
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return _TracedCursorContext(self._conn.cursor(*args, **kwargs), self._trace)
+
+
+class _TracedCursorContext:
+    def __init__(self, context, trace):
+        self._context = context
+        self._trace = trace
+
+    async def __aenter__(self):
+        return TracedCursor(await self._context.__aenter__(), self._trace)
+
+    async def __aexit__(self, *exc_info):
+        return await self._context.__aexit__(*exc_info)
+
+
+class TracedCursor:
+    def __init__(self, cursor, trace):
+        self._cursor = cursor
+        self._trace = trace
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def execute(self, sql, params=None):
+        started = time.perf_counter()
+        try:
+            return await self._cursor.execute(sql, params)
+        finally:
+            self._trace.record(sql, (time.perf_counter() - started) * 1000)
+
+    async def executemany(self, sql, rows):
+        started = time.perf_counter()
+        try:
+            return await self._cursor.executemany(sql, rows)
+        finally:
+            self._trace.record(sql, (time.perf_counter() - started) * 1000)
+
+    async def fetchone(self):
+        row = await self._cursor.fetchone()
+        self._trace.record_rows(0 if row is None else 1)
+        return row
+
+    async def fetchall(self):
+        rows = await self._cursor.fetchall()
+        self._trace.record_rows(len(rows))
+        return rows
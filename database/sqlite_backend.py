@@ -0,0 +1,193 @@
+# ========================================= #
+# Author: Noah S. Kipp                      #
+# Collaborator: Samuel Jaden Garcia Munoz   #
+# Created on: 17.10.2026                    #
+# ========================================= #
+
+# SQLite storage backend, selected with DB_BACKEND=sqlite. It offers the small part of the aiomysql
+# pool/connection/cursor interface that database.py uses, and translates the MySQL dialect of its
+# queries to SQLite on the way through, so every database function works unchanged on either backend.
+
+import asyncio
+import re
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Seconds close waits for connections still in use before closing them anyway
+CLOSE_TIMEOUT = 10
+
+# Single-quoted string literals, which the translations below must leave alone (e.g. LIKE '%soundcloud%')
+STRING_LITERAL = re.compile(r"('(?:[^']|'')*')")
+
+TRANSLATIONS = [
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\bINSERT\s+IGNORE\b', re.IGNORECASE), 'INSERT OR IGNORE'),
+    (re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', re.IGNORECASE), 'ON CONFLICT DO UPDATE SET'),
+    (re.compile(r'\bVALUES\((\w+)\)', re.IGNORECASE), r'excluded.\1'),
+    (re.compile(r'\s+FOR\s+UPDATE(\s+OF\s+\w+)?(\s+SKIP\s+LOCKED|\s+NOWAIT)?', re.IGNORECASE), ''),
+    (re.compile(r'\bINT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b', re.IGNORECASE), 'INTEGER PRIMARY KEY AUTOINCREMENT')
+]
+
+CREATE_TABLE = re.compile(r'^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', re.IGNORECASE)
+INLINE_INDEX = re.compile(r',\s*(UNIQUE\s+)?(?:INDEX|KEY)\s+(\w+)\s*\(([^)]*)\)', re.IGNORECASE)
+
+
+# Returns the SQLite statements for one MySQL statement. Inline INDEX definitions of a CREATE TABLE
+# become separate CREATE INDEX statements, since SQLite has no inline secondary indexes.
+def translate(sql):
+    parts = STRING_LITERAL.split(sql)
+    for i in range(0, len(parts), 2):  # Even parts are outside string literals
+        for pattern, replacement in TRANSLATIONS:
+            parts[i] = pattern.sub(replacement, parts[i])
+    sql = ''.join(parts)
+
+    table = CREATE_TABLE.match(sql)
+    if not table:
+        return [sql]
+    indexes = [f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table.group(1)} ({columns})"
+               for unique, name, columns in INLINE_INDEX.findall(sql)]
+    return [INLINE_INDEX.sub('', sql)] + indexes
+
+
+def _params(params):
+    if params is None:
+        return ()
+    if isinstance(params, (tuple, list, dict)):
+        return params
+    return (params,)  # aiomysql accepts a bare value for a single placeholder
+
+
+class SQLiteCursor:
+    def __init__(self, conn, dict_rows=False):
+        self._conn = conn
+        self._cursor = None
+        self.dict_rows = dict_rows
+        self.rowcount = -1
+        self.lastrowid = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._cursor is not None:
+            await self._cursor.close()
+            self._cursor = None
+
+    async def execute(self, sql, params=None):
+        statements = translate(sql)
+        await self.close()
+        self._cursor = await self._conn.execute(statements[0], _params(params))
+        for statement in statements[1:]:
+            await (await self._conn.execute(statement)).close()
+        self.rowcount = self._cursor.rowcount
+        self.lastrowid = self._cursor.lastrowid
+        return max(self.rowcount, 0)
+
+    async def executemany(self, sql, rows):
+        (statement,) = translate(sql)
+        await self.close()
+        self._cursor = await self._conn.executemany(statement, [_params(row) for row in rows])
+        self.rowcount = self._cursor.rowcount
+        return max(self.rowcount, 0)
+
+    def _convert(self, row):
+        if row is None or not self.dict_rows:
+            return tuple(row) if row is not None else None
+        return dict(zip((column[0] for column in self._cursor.description), row))
+
+    async def fetchone(self):
+        return self._convert(await self._cursor.fetchone())
+
+    async def fetchall(self):
+        return [self._convert(row) for row in await self._cursor.fetchall()]
+
+
+class SQLiteConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    # Any cursor class (callers pass aiomysql.DictCursor) asks for rows as dicts
+    def cursor(self, cursor_class=None):
+        return SQLiteCursor(self._conn, dict_rows=cursor_class is not None)
+
+    async def begin(self):
+        # Take the write lock up front; a deferred transaction that later writes can fail with SQLITE_BUSY
+        await self._conn.execute('BEGIN IMMEDIATE')
+
+    async def commit(self):
+        if self._conn.in_transaction:
+            await self._conn.commit()
+
+    async def rollback(self):
+        if self._conn.in_transaction:
+            await self._conn.rollback()
+
+
+class SQLitePool:
+    # A fixed set of connections handed out through a queue. In WAL mode readers never block each
+    # other or the writer, and writers queue on the database lock for up to busy_timeout.
+    def __init__(self, connections):
+        self._connections = connections
+        self._free = asyncio.Queue()
+        for conn in connections:
+            self._free.put_nowait(conn)
+
+    @property
+    def size(self):
+        return len(self._connections)
+
+    @property
+    def freesize(self):
+        return self._free.qsize()
+
+    async def acquire(self):
+        return await self._free.get()
+
+    def release(self, conn):
+        self._free.put_nowait(conn)
+
+    def close(self):
+        pass
+
+    # Waits for the connections in use to come back, then closes all of them. Every aiosqlite connection
+    # runs a thread of its own, and one left open keeps the process from exiting.
+    async def wait_closed(self):
+        try:
+            for _ in self._connections:
+                await asyncio.wait_for(self._free.get(), CLOSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"SQLite connections still in use after {CLOSE_TIMEOUT}s, closing them anyway.")
+        finally:
+            for conn in self._connections:
+                await conn._conn.close()
+
+
+async def create_pool(path, size=4, busy_timeout=5000):
+    try:
+        import aiosqlite
+    except ImportError:
+        raise RuntimeError("DB_BACKEND=sqlite requires the aiosqlite package (pip install aiosqlite).")
+
+    # Every connection to :memory: is a separate database, so an in-memory store gets exactly one
+    if path == ':memory:':
+        size = 1
+
+    connections = []
+    try:
+        for _ in range(size):
+            conn = await aiosqlite.connect(path, isolation_level=None)
+            connections.append(SQLiteConnection(conn))
+            await conn.execute('PRAGMA journal_mode=WAL')
+            await conn.execute('PRAGMA synchronous=NORMAL')
+            await conn.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+            # Foreign keys stay off: several tables reference a prefix of a composite key, which MySQL
+            # accepts but SQLite rejects as a foreign key mismatch
+    except Exception:
+        for conn in connections:
+            await conn._conn.close()
+        raise
+    return SQLitePool(connections)
@@ -5,15 +5,38 @@
 # ========================================= #
 
 import discord
+from discord import app_commands
 from discord.ext import commands
 import topgg
 import asyncio
+import os
 import config
 import wavelink
 from utils.logging import setup_logging, get_logger
 from database import database as db
+from database import migrator
+from database import query_tracer
 from utils.sync_utils import sync_commands  # Import the sync function from the new file
 from utils.activity_handler import handle_activity_change
+from services.music_service import autocomplete_cache
+from utils.search_gateway import search_gateway
+from utils.track_store import track_store
+from utils.node_balancer import node_balancer
+
+# Seconds between runtime stats reports in the log (database pool, play counter, caches, Lavalink nodes); 0 turns them off
+STATS_LOG_INTERVAL = float(os.getenv('STATS_LOG_INTERVAL', 300))
+
+
+class MusicMonkeyTree(app_commands.CommandTree):
+    # Starts a database query trace for every slash command; it is finished and logged on completion or error
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.type == discord.InteractionType.application_command and interaction.command is not None:
+            query_tracer.start_trace(f"/{interaction.command.qualified_name}")
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        query_tracer.finish_trace()
+        await super().on_error(interaction, error)
 
 
 class MusicMonkey(commands.AutoShardedBot):
@@ -23,6 +46,7 @@ class MusicMonkey(commands.AutoShardedBot):
         self.creator_ids = ['338735185900077066', '99624063655215104']
         self.logger = get_logger(__name__)  # Initialize logger
         self.member_cache = {}  # Initialize the member cache
+        self.stats_task = None
 
     async def setup_hook(self):
         # Setup top.gg client and webhook
@@ -40,6 +64,7 @@ class MusicMonkey(commands.AutoShardedBot):
                           password=config.LAVALINK_PASSWORD3)
         ]
         await wavelink.Pool.connect(nodes=nodes, client=self)
+        node_balancer.start()  # Track node health to place new players and spread searches
 
         # Load necessary extensions
         extensions = [
@@ -61,11 +86,48 @@ class MusicMonkey(commands.AutoShardedBot):
             await self.load_extension(extension)
 
         self.uptime = discord.utils.utcnow()  # Set the uptime attribute when bot starts
-        await db.setup_database()
+        await db.init_pool()  # Create the shared database connection pool
+        await migrator.run_migrations()  # Bring the schema up to date
+        db.play_counter.start()  # Start flushing buffered play counts
+        db.play_compactor.start()  # Start rolling play events up into the daily rollups
+        await track_store.open()  # Load the resolved track store kept across restarts, if configured
+        await db.load_song_catalog()  # Let autocomplete find previously played songs without a search
+        if STATS_LOG_INTERVAL > 0:
+            self.stats_task = asyncio.create_task(self.report_stats())  # Periodic runtime stats for operators
 
         # Populate member cache
         await self.populate_member_cache()
 
+    async def close(self):
+        await super().close()
+        if self.stats_task is not None:
+            self.stats_task.cancel()
+        await db.play_counter.stop()  # Drain buffered play counts before the pool goes away
+        await db.play_compactor.stop()
+        self.log_stats()
+        await db.close_pool()  # Release pooled database connections on shutdown
+        await track_store.close()
+        await node_balancer.stop()
+
+    def log_stats(self):
+        self.logger.info(f"Database pool stats: {db.get_pool_stats()}")
+        self.logger.info(f"Play counter stats: {db.play_counter.get_stats()}")
+        self.logger.info(f"Autocomplete search cache stats: {autocomplete_cache.get_stats()}")
+        self.logger.info(f"Song catalog stats: {db.song_catalog.get_stats()}")
+        self.logger.info(f"Playlist track cache stats: {db.get_track_cache_stats()}")
+        self.logger.info(f"Lavalink search gateway stats: {search_gateway.get_stats()}")
+        self.logger.info(f"Resolved track store stats: {track_store.get_stats()}")
+        for identifier, stats in node_balancer.get_stats().items():
+            self.logger.info(f"Lavalink node {identifier} stats: {stats}")
+
+    async def report_stats(self):
+        while True:
+            await asyncio.sleep(STATS_LOG_INTERVAL)
+            try:
+                self.log_stats()
+            except Exception as e:
+                self.logger.error(f"Failed to report runtime stats: {e}")
+
     async def populate_member_cache(self):
         """Populate the member cache with all members in all guilds."""
         self.logger.info("Populating member cache...")
@@ -78,6 +140,9 @@ class MusicMonkey(commands.AutoShardedBot):
             except Exception as e:
                 self.logger.error(f"Error caching members for guild {guild.name}: {e}")
 
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        query_tracer.finish_trace()  # Logs the command's database usage, as a warning if over budget
+
     def get_cached_member(self, member_id: int):
         """Retrieve a member from the cache."""
         return self.member_cache.get(member_id)
@@ -107,7 +172,7 @@ async def main():
     intents.guilds = True  # Ensure guild intent is enabled
     intents.messages = True  # For handling messages
 
-    bot = MusicMonkey(command_prefix='/', intents=intents, shard_count=8)
+    bot = MusicMonkey(command_prefix='/', intents=intents, shard_count=8, tree_cls=MusicMonkeyTree)
     await bot.start(config.TOKEN)
 
 
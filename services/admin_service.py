@@ -2,7 +2,7 @@ import discord
 from discord import Interaction
 from discord import app_commands
 from database.database import add_restricted_command, remove_restricted_command, get_restricted_commands, \
-    get_updates_status, get_updates_channel, get_dj_role, get_dj_only_enabled, set_dj_role, set_dj_only_enabled
+    get_dj_only_enabled, set_dj_role, set_dj_only_enabled, get_guild_settings
 from utils.interaction_checks import can_manage_roles
 from utils.voting_checks import has_voted
 from utils.embeds import create_basic_embed, create_error_embed
@@ -31,11 +31,12 @@ class AdminService:
             return
 
         try:
-            # Fetch restricted commands, DJ role, and DJ-only mode status
-            restricted_commands = await get_restricted_commands(interaction.guild.id)
+            # Fetch restricted commands, DJ role, DJ-only mode and updates settings in one lookup
+            settings = await get_guild_settings(interaction.guild.id)
+            restricted_commands = settings['restricted_commands']
             restricted_list = restricted_commands.split(',') if restricted_commands else []
-            current_dj_role_id = await get_dj_role(interaction.guild.id)
-            dj_mode_status = await get_dj_only_enabled(interaction.guild.id)
+            current_dj_role_id = settings['dj_role_id']
+            dj_mode_status = bool(settings['dj_only_enabled'])
 
             dj_role = "None"
             if current_dj_role_id:
@@ -68,9 +69,9 @@ class AdminService:
             )
 
             # Construct the updates information block
-            updates_status = await get_updates_status(interaction.guild.id)
+            updates_status = settings['updates_enabled']
             updates_status_text = "Enabled" if updates_status == 1 else "Disabled"
-            updates_channel_id = await get_updates_channel(interaction.guild.id)
+            updates_channel_id = settings['updates_channel_id']
             if updates_channel_id:
                 updates_channel = interaction.guild.get_channel(updates_channel_id)
                 channel_name = updates_channel.name if updates_channel else "None"
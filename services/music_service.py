@@ -10,10 +10,23 @@ from utils.logging import get_logger
 from database import database as db
 from utils.buttons import QueuePaginationView, MusicButtons
 from utils.voting_checks import has_voted_sources, has_voted
+from utils.search_cache import SearchCache
+from utils.search_gateway import search_gateway, interaction_deadline, RESPONSE_DEADLINE
+from utils.track_store import track_store
+from utils.node_balancer import BalancedPlayer
 
 logger = get_logger(__name__)
 
 
+# Searches Deezer through Lavalink for /play autocomplete and keeps what the choices need
+async def search_deezer(query):
+    search_results: wavelink.Search = await search_gateway.fetch_tracks(f"dzsearch:{query}")
+    return [(track.title, track.author, track.uri) for track in search_results[:25]]
+
+
+autocomplete_cache = SearchCache(search_deezer)
+
+
 class Track(wavelink.Playable):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -29,14 +42,26 @@ class MusicService(commands.Cog):
             if not current:
                 return []
 
-            # Use Lavalink/Wavelink to search Deezer
+            # Previously played songs are found in memory right away
+            search_results = db.song_catalog.search(current, limit=25)
+
+            # Fill up with a Deezer search, answering repeated and narrowed-down queries from the cache.
+            # If it misses Discord's deadline, the played songs are shown alone; the search still completes
+            # and gets cached for the next keystroke.
             ## Implement different search results for different source selections at a later point
-            search_results: wavelink.Search = await wavelink.Pool.fetch_tracks(f"dzsearch:{current}")
+            if len(search_results) < 25:
+                try:
+                    found = await autocomplete_cache.search(
+                        current, deadline=interaction_deadline(interaction, RESPONSE_DEADLINE))
+                except asyncio.TimeoutError:
+                    found = []
+                shown = {uri for _, _, uri in search_results}
+                search_results += [result for result in found if result[2] not in shown]
 
             # Return up to 25 results to display
             return [
-                app_commands.Choice(name=track.title, value=track.uri)
-                for track in search_results[:25]
+                app_commands.Choice(name=title[:100], value=uri)
+                for title, _, uri in search_results[:25]
             ]
         except Exception as e:
             logger.error(f"Error in autocomplete: {e}")
@@ -79,7 +104,7 @@ class MusicService(commands.Cog):
             if not player:
                 try:
                     # Join the user's voice channel immediately
-                    player = await channel.connect(cls=wavelink.Player)
+                    player = await channel.connect(cls=BalancedPlayer)
                     player.guild_id = interaction.guild_id
                     player.interaction_channel_id = interaction.channel_id
                 except discord.Forbidden:
@@ -160,8 +185,18 @@ class MusicService(commands.Cog):
                     search_query = f'{source_prefix}:{query}' if source_prefix else query
 
 
+            # Repeated queries are answered from the resolved track store without asking Lavalink.
             # Use fetch_tracks to avoid default source prefix addition
-            results: wavelink.Search = await wavelink.Pool.fetch_tracks(search_query)
+            results = await track_store.get(search_query)
+            if results is None:
+                try:
+                    results: wavelink.Search = await search_gateway.fetch_tracks(
+                        search_query, deadline=interaction_deadline(interaction))
+                except asyncio.TimeoutError:
+                    embed = create_error_embed('The search took too long. Please try again.')
+                    await interaction.followup.send(embed=embed, ephemeral=True)
+                    return
+                track_store.put(search_query, results)
 
             if not results:
                 embed = create_error_embed('No tracks found with that query.')
@@ -174,7 +209,7 @@ class MusicService(commands.Cog):
             if player is None:
                 channel = interaction.user.voice.channel if interaction.user.voice else None
                 if channel:
-                    player = await channel.connect(cls=wavelink.Player)
+                    player = await channel.connect(cls=BalancedPlayer)
                     player.guild_id = interaction.guild_id
                     player.interaction_channel_id = interaction.channel_id
                 else:
@@ -215,9 +250,9 @@ class MusicService(commands.Cog):
                 await player.play(next_track)
 
             # Update the database with the track information
-            await db.enter_song(player.current.identifier, player.current.title, player.current.author,
-                                player.current.length, player.current.uri)
-            await db.increment_plays(interaction.user.id, player.current.identifier, interaction.guild_id)
+            await db.record_play(interaction.user.id, interaction.guild_id, player.current.identifier,
+                                 player.current.title, player.current.author, player.current.length,
+                                 player.current.uri)
 
         except discord.errors.NotFound:
             logger.error("Interaction not found or expired.")
@@ -744,7 +779,12 @@ class MusicService(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         try:
             # Searches for a song with the user's provided query.
-            search_result = await wavelink.Playable.search(query)
+            try:
+                search_result = await search_gateway.search(query, deadline=interaction_deadline(interaction))
+            except asyncio.TimeoutError:
+                embed = create_error_embed('The search took too long. Please try again.')
+                await interaction.followup.send(embed=embed, ephemeral=True)
+                return
 
             # If the query yields no results, send a message and exit the function.
             if not search_result:
@@ -791,7 +831,7 @@ class MusicService(commands.Cog):
                     return
             else:
                 try:
-                    player = await channel.connect(cls=wavelink.Player)
+                    player = await channel.connect(cls=BalancedPlayer)
                     player.guild_id = interaction.guild_id
                     player.interaction_channel_id = interaction.channel_id
                 except Exception as e:
@@ -814,8 +854,8 @@ class MusicService(commands.Cog):
                         ).set_footer(text="Messages aren't monitored or filtered. View at your own discretion.")
                         await interaction.followup.send(embed=embed)
 
+                    # The trade was already claimed and removed by receive_wonder_trade
                     await self.play_song(interaction, uri, source=None)
-                    await db.delete_wonder_trade(uri)
 
                 else:
                     uri = uri.lstrip('_')
@@ -1,15 +1,17 @@
+import asyncio
 import discord
 import wavelink
-import json
 from utils.voting_checks import has_voted
 from utils.interaction_checks import restriction_check
 from utils.embeds import create_basic_embed, create_error_embed
 from utils.logging import get_logger
+from utils.search_gateway import search_gateway, interaction_deadline
+from utils.node_balancer import BalancedPlayer
 from database import database as db
 from utils.playlistbuttons import (
     PlaylistPlaySelectView, ConfirmDeleteView,
     PlaylistPaginator, create_playlist_selection_embeds, create_invite_view_embeds,
-    create_edit_interface
+    create_edit_interface, create_add_song_embed, resolve_user_names
 )
 
 # Initialize the logger from logging.py
@@ -27,10 +29,11 @@ class PlaylistSelectView(discord.ui.View):
 
     async def select_callback(self, interaction: discord.Interaction):
         selected_playlist = self.select.values[0]
-        await db.add_song_to_playlist(interaction.user.id, selected_playlist, self.track.identifier, self.track.title,
-                                      self.track.author, self.track.raw_data)
-        await interaction.response.send_message(
-            embed=create_basic_embed("", f"Added to your playlist '{selected_playlist}'! 🎶"), ephemeral=True)
+        result = await db.add_song_to_playlist(interaction.user.id, selected_playlist, self.track.identifier,
+                                               self.track.title, self.track.author, self.track.raw_data)
+        embed = create_add_song_embed(result, self.track.title, selected_playlist,
+                                      f"Added to your playlist '{selected_playlist}'! 🎶")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
         self.stop()
 
 
@@ -52,6 +55,7 @@ class EditPlaylistNameModal(discord.ui.Modal, title="Edit Playlist Name"):
 async def create_edit_interface(interaction: discord.Interaction, playlist):
     embed = create_basic_embed(f"Edit Playlist: {playlist['name']}", "")  # Add an empty description
     embed.add_field(name="Current Privacy", value="Public" if playlist['privacy'] == 1 else "Private")
+    embed.add_field(name="Unique Tracks", value="On" if playlist.get('unique_tracks') else "Off")
 
     view = discord.ui.View()
 
@@ -72,6 +76,23 @@ async def create_edit_interface(interaction: discord.Interaction, playlist):
     privacy_select.callback = privacy_callback
     view.add_item(privacy_select)
 
+    unique_options = [
+        discord.SelectOption(label='Unique Tracks On', value='1', description='Each song can only be added once'),
+        discord.SelectOption(label='Unique Tracks Off', value='0')
+    ]
+
+    async def unique_callback(interaction: discord.Interaction):
+        unique_tracks = int(interaction.data['values'][0])
+        removed = await db.update_playlist_unique_tracks(playlist['playlist_id'], unique_tracks)
+        message = f"Unique tracks turned {'on' if unique_tracks else 'off'}"
+        if removed:
+            message += f", {removed} duplicate song{'s' if removed != 1 else ''} removed"
+        await interaction.response.send_message(embed=create_basic_embed("", f"{message} 🎶"), ephemeral=True)
+
+    unique_select = discord.ui.Select(placeholder='Unique Tracks', options=unique_options, custom_id="unique_select")
+    unique_select.callback = unique_callback
+    view.add_item(unique_select)
+
     async def delete_collaborator_callback(interaction: discord.Interaction):
         collaborators = await db.get_playlist_collaborators(playlist['playlist_id'])
         if not collaborators:
@@ -130,16 +151,13 @@ async def create_playlist_selection_embeds(playlists, bot):
     view = PlaylistSelectView(playlists, None)
     await view.update_options(selected_playlist_id=playlists[0]['playlist_id'])
 
+    creators = await resolve_user_names(bot, [playlist['user_id'] for playlist in playlists])
     embeds = []
     for playlist in playlists:
-        creator = bot.get_user(playlist['user_id'])
-        if not creator:
-            creator = await bot.fetch_user(playlist['user_id'])
-        embed = create_basic_embed(f"{playlist['name']}", f"Creator: {creator.name}")
+        embed = create_basic_embed(f"{playlist['name']}", f"Creator: {creators[playlist['user_id']]}")
         embed.add_field(name="Privacy", value="Public" if playlist['privacy'] == 1 else "Private")
         if playlist['privacy'] == 1:  # Public playlist
-            contents = await db.get_playlist_contents(playlist['playlist_id'])
-            embed.add_field(name="Song Count", value=str(len(contents)))
+            embed.add_field(name="Song Count", value=str(playlist['song_count']))
         embeds.append(embed)
 
     return embeds, view
@@ -148,6 +166,7 @@ async def create_playlist_selection_embeds(playlists, bot):
 class PlaylistService:
     def __init__(self, bot):
         self.bot = bot
+        self.background_tasks = set()  # Keeps references to running record_tracks tasks
 
     async def playlist_autocomplete(self, interaction: discord.Interaction, current: str):
         user_id = interaction.user.id
@@ -235,7 +254,11 @@ class PlaylistService:
                                                                      "this playlist. 🎶"))
             return
 
-        search_result = await wavelink.Playable.search(query)
+        try:
+            search_result = await search_gateway.search(query, deadline=interaction_deadline(interaction))
+        except asyncio.TimeoutError:
+            await interaction.followup.send(embed=create_error_embed('The search took too long. Please try again. 🎵'))
+            return
         if not search_result:
             await interaction.followup.send(
                 embed=create_error_embed('Hmm, I couldn’t find any tracks with that query. 🎵'))
@@ -248,11 +271,9 @@ class PlaylistService:
         raw_data = track.raw_data  # Use raw_data instead of URI
 
         result = await db.add_song_to_playlist(user_id, name, song_id, song_name, artist, raw_data)
-        if result == 'Playlist not found':
-            await interaction.followup.send(embed=create_error_embed("Sorry, I couldn't find that playlist. 🎶"))
-        else:
-            await interaction.followup.send(
-                embed=create_basic_embed("", f"Added song '{song_name}' by '{artist}' to playlist '{name}'! <a:tadaMM:1258473486003732642>"))
+        await interaction.followup.send(embed=create_add_song_embed(
+            result, song_name, name,
+            f"Added song '{song_name}' by '{artist}' to playlist '{name}'! <a:tadaMM:1258473486003732642>"))
 
     async def remove_song_from_playlist(self, interaction: discord.Interaction, name: str, query: str):
         if not await restriction_check(interaction):
@@ -268,7 +289,11 @@ class PlaylistService:
                                                                      "from this playlist. 🎶"))
             return
 
-        search_result = await wavelink.Playable.search(query)
+        try:
+            search_result = await search_gateway.search(query, deadline=interaction_deadline(interaction))
+        except asyncio.TimeoutError:
+            await interaction.followup.send(embed=create_error_embed('The search took too long. Please try again. 🎵'))
+            return
         if not search_result:
             await interaction.followup.send(
                 embed=create_error_embed('Hmm, I couldn’t find any tracks with that query. 🎵'))
@@ -303,7 +328,7 @@ class PlaylistService:
             await interaction.followup.send(embed=create_error_embed("Sorry, I couldn't find that playlist. 🎶"))
         else:
             await interaction.followup.send(
-                embed=create_basic_embed("", f"Yay! Removed duplicate songs from playlist '{name}'. <a:tadaMM:1258473486003732642>"))
+                embed=create_basic_embed("", f"Yay! Removed {result} duplicate song{'s' if result != 1 else ''} from playlist '{name}'. <a:tadaMM:1258473486003732642>"))
 
     async def view_playlist(self, interaction: discord.Interaction, name: str):
         if not await restriction_check(interaction):
@@ -328,24 +353,43 @@ class PlaylistService:
 
         if len(viewable_playlists) == 1:
             selected_playlist = viewable_playlists[0]
-            contents = await db.get_playlist_contents(selected_playlist['playlist_id'])
-            if not contents:
+            if not selected_playlist['song_count']:
                 await interaction.followup.send(
                     embed=create_error_embed(f"Oops! The playlist '{selected_playlist['name']}' is empty. 🎶"))
                 return
 
+            # Each page is read by position when it is shown. bounds keeps the first and last position
+            # of the pages seen so far, so a neighbouring page can seek from there.
+            playlist_id = selected_playlist['playlist_id']
+            song_count = selected_playlist['song_count']
             items_per_page = 10
-            total_pages = (len(contents) + items_per_page - 1) // items_per_page
-            embeds = []
-            for i in range(0, len(contents), items_per_page):
+            total_pages = (song_count + items_per_page - 1) // items_per_page
+            bounds = {}
+
+            async def render_page(page):
+                if page in bounds:
+                    songs = await db.get_playlist_songs(playlist_id, after=bounds[page][0] - 1, limit=items_per_page)
+                elif page == 0 or page - 1 in bounds:
+                    after = bounds[page - 1][1] if page else 0
+                    songs = await db.get_playlist_songs(playlist_id, after=after, limit=items_per_page)
+                elif page + 1 in bounds:
+                    songs = await db.get_playlist_songs(playlist_id, before=bounds[page + 1][0], limit=items_per_page)
+                else:
+                    # The last page, which holds whatever is left over
+                    songs = await db.get_playlist_songs(playlist_id, before=0,
+                                                        limit=max(song_count - page * items_per_page, 1))
+                if songs:
+                    bounds[page] = (songs[0]['position'], songs[-1]['position'])
+
                 embed = create_basic_embed("", f"Playlist: {selected_playlist['name']}")
-                for song in contents[i:i + items_per_page]:
+                for song in songs:
                     embed.add_field(name=song['song_name'], value=f"Artist: {song['artist']}", inline=False)
-                embed.set_footer(text=f"Page {i // items_per_page + 1} of {total_pages}")
-                embeds.append(embed)
+                return embed
 
-            paginator = PlaylistPaginator(embeds, total_pages=total_pages)
-            await interaction.followup.send(embed=embeds[0], view=paginator)
+            paginator = PlaylistPaginator(None, total_pages=total_pages, page_renderer=render_page)
+            embed = await paginator.get_page(0)
+            embed.set_footer(text=f"Page 1 of {total_pages}")
+            await interaction.followup.send(embed=embed, view=paginator)
         else:
             embeds, view = await create_playlist_selection_embeds(viewable_playlists, self.bot)
             await interaction.followup.send(embed=embeds[0], view=view)
@@ -358,27 +402,29 @@ class PlaylistService:
             return
 
         guild_id = interaction.guild_id
-        playlists = await db.get_guild_playlists(guild_id)
+        playlists = await db.get_guild_playlists_with_songs(guild_id)
         if not playlists:
             await interaction.followup.send(embed=create_error_embed("No playlists found for this guild. 🎶"))
             return
 
+        # Every playlist and song is loaded in one query; pages are only rendered when they are shown
         items_per_page = 10
-        embeds = []
-        for playlist in playlists:
-            embed = create_basic_embed(f"{playlist['name']}", f"Creator: {playlist['user_id']}")
+        pages = [(playlist, start) for playlist in playlists
+                 for start in range(0, len(playlist['songs']), items_per_page)]
+        creators = await resolve_user_names(self.bot, [playlist['user_id'] for playlist in playlists])
+
+        async def render_page(page):
+            playlist, start = pages[page]
+            embed = create_basic_embed(f"{playlist['name']}", f"Creator: {creators[playlist['user_id']]}")
             embed.add_field(name="Privacy", value="Public" if playlist['privacy'] == 1 else "Private")
-            contents = await db.get_playlist_contents(playlist['playlist_id'])
-            total_pages = (len(contents) + items_per_page - 1) // items_per_page
-            for i in range(0, len(contents), items_per_page):
-                page_embed = embed.copy()
-                for song in contents[i:i + items_per_page]:
-                    page_embed.add_field(name=song['song_name'], value=f"Artist: {song['artist']}", inline=False)
-                page_embed.set_footer(text=f"Page {i // items_per_page + 1} of {total_pages}")
-                embeds.append(page_embed)
-
-        paginator = PlaylistPaginator(embeds, total_pages=total_pages)
-        await interaction.followup.send(embed=embeds[0], view=paginator)
+            for song in playlist['songs'][start:start + items_per_page]:
+                embed.add_field(name=song['song_name'], value=f"Artist: {song['artist']}", inline=False)
+            return embed
+
+        paginator = PlaylistPaginator(None, total_pages=len(pages), page_renderer=render_page)
+        embed = await paginator.get_page(0)
+        embed.set_footer(text=f"Page 1 of {len(pages)}")
+        await interaction.followup.send(embed=embed, view=paginator)
 
     async def edit_playlist(self, interaction: discord.Interaction, name: str):
         if not await restriction_check(interaction):
@@ -494,7 +540,7 @@ class PlaylistService:
 
         player = interaction.guild.voice_client
         if not player:
-            player = await channel.connect(cls=wavelink.Player)
+            player = await channel.connect(cls=BalancedPlayer)
             player.guild_id = guild_id
             player.interaction_channel_id = interaction.channel_id
 
@@ -544,8 +590,7 @@ class PlaylistService:
         try:
             tracks = []
             for song in songs:
-                raw_data = json.loads(song['raw_data'])
-                track = wavelink.Playable(data=raw_data)
+                track = wavelink.Playable(data=song['track'])
                 tracks.append(track)
 
             for track in tracks:
@@ -560,9 +605,10 @@ class PlaylistService:
             if not player.playing and not player.paused:
                 await player.play(player.queue.get())
 
-            for track in tracks:
-                await db.enter_song(track.identifier, track.title, track.author, track.length, track.uri)
-                await db.increment_plays(interaction.user.id, track.identifier, interaction.guild_id)
+            # Record the songs and plays in bulk once playback has started, without holding up the command
+            task = asyncio.create_task(self.record_tracks(interaction.user.id, interaction.guild_id, tracks))
+            self.background_tasks.add(task)
+            task.add_done_callback(self.background_tasks.discard)
 
         except discord.errors.NotFound:
             logger.error("Interaction not found or expired.")
@@ -574,6 +620,14 @@ class PlaylistService:
             except discord.errors.NotFound:
                 logger.error("Failed to send follow-up message: Interaction not found or expired.")
 
+    async def record_tracks(self, user_id, guild_id, tracks):
+        try:
+            await db.enter_songs(
+                [(track.identifier, track.title, track.author, track.length, track.uri) for track in tracks])
+            db.increment_plays_bulk(user_id, [track.identifier for track in tracks], guild_id)
+        except Exception as e:
+            logger.error(f"Error recording {len(tracks)} playlist tracks: {e}")
+
     async def add_song_to_playlist_via_heart_button(self, interaction: discord.Interaction, track: wavelink.Playable):
         user_id = interaction.user.id
         guild_id = interaction.guild_id
@@ -585,16 +639,18 @@ class PlaylistService:
             # No playlists found, create a new one called "{User}'s Favorites"
             playlist_name = f"{interaction.user.name}'s Favorites"
             await db.create_playlist(user_id, guild_id, playlist_name, privacy=0)
-            await db.add_song_to_playlist(user_id, playlist_name, track.identifier, track.title, track.author,
-                                          track.raw_data)
-            embed = create_basic_embed("", f"Added to your new playlist '{playlist_name}'! 🎶")
+            result = await db.add_song_to_playlist(user_id, playlist_name, track.identifier, track.title,
+                                                   track.author, track.raw_data)
+            embed = create_add_song_embed(result, track.title, playlist_name,
+                                          f"Added to your new playlist '{playlist_name}'! 🎶")
             await interaction.followup.send(embed=embed, ephemeral=True)
         elif len(playlists) == 1:
             # Only one playlist found, add to that playlist
             playlist_name = playlists[0]['name']
-            await db.add_song_to_playlist(user_id, playlist_name, track.identifier, track.title, track.author,
-                                          track.raw_data)
-            embed = create_basic_embed("", f"Added to your playlist '{playlist_name}'! 🎶")
+            result = await db.add_song_to_playlist(user_id, playlist_name, track.identifier, track.title,
+                                                   track.author, track.raw_data)
+            embed = create_add_song_embed(result, track.title, playlist_name,
+                                          f"Added to your playlist '{playlist_name}'! 🎶")
             await interaction.followup.send(embed=embed, ephemeral=True)
         else:
             # Multiple playlists found, show a dropdown menu to select one
@@ -4,15 +4,21 @@
 # Created on: 07.05.2024                    #
 # ========================================= #
 
+import asyncio
 import discord
 from utils.embeds import create_basic_embed, create_error_embed
 from utils.voting_checks import has_voted
 from utils.interaction_checks import restriction_check
 from utils.logging import get_logger
+from utils.playlistbuttons import PlaylistPaginator
 from database import database as db
 
 logger = get_logger(__name__)
 
+# Leaderboard entries per page, and the number of pages /leaderboard shows
+LEADERBOARD_PAGE_SIZE = 10
+LEADERBOARD_MAX_PAGES = 10
+
 
 class ProfileService:
     def __init__(self, bot):
@@ -70,31 +76,56 @@ class ProfileService:
             return
 
         try:
-            leaderboard_data = await db.get_leaderboard(interaction.guild_id)  # Retrieve leaderboard data from the database
+            leaderboard_data, total = await db.get_leaderboard(interaction.guild_id, per_page=LEADERBOARD_PAGE_SIZE)
             if not leaderboard_data:
                 await interaction.followup.send(embed=create_error_embed("No data available yet."))
                 return
 
-            # Create and populate an embed with the server's music leaderboard
-            embed = create_basic_embed(title="🎵 Music Leaderboard 🎵", description="Top music players in the server!")
-
-            for idx, (user_id, count) in enumerate(leaderboard_data, start=1):
-                user = await self.bot.fetch_user(user_id)
-                if idx == 1:
-                    embed.set_thumbnail(url=user.display_avatar.url)
+            own_rank = await db.get_leaderboard_rank(interaction.guild_id, interaction.user.id)
 
-                # Add medals for top positions and format the leaderboard entries
-                medal = "🥇" if idx == 1 else "🥈" if idx == 2 else "🥉" if idx == 3 else f"{idx}."
-                name = f"{medal} {user.display_name}"
-                value = f"🎶 Plays: {count}"
-                embed.add_field(name=name, value=value, inline=False)
+            # Pages of the server's music leaderboard, up to LEADERBOARD_MAX_PAGES, are built when they are shown
+            total_pages = min(-(-total // LEADERBOARD_PAGE_SIZE), LEADERBOARD_MAX_PAGES)
 
-            embed.set_footer(text="Leaderboard updated")
-            embed.timestamp = discord.utils.utcnow()
+            async def render_page(page):
+                page_data, _ = await db.get_leaderboard(interaction.guild_id, page, LEADERBOARD_PAGE_SIZE,
+                                                        with_total=False)
+                return await self.create_leaderboard_embed(page_data, page, own_rank)
 
-            await interaction.followup.send(embed=embed)
+            embed = await self.create_leaderboard_embed(leaderboard_data, 0, own_rank)
+            embed.set_footer(text=f"Page 1 of {total_pages}")
+            view = PlaylistPaginator(None, total_pages=total_pages, page_renderer=render_page) \
+                if total_pages > 1 else discord.utils.MISSING
+            await interaction.followup.send(embed=embed, view=view)
         except Exception as e:
             # Log the error and inform the user if something goes wrong
             logger.error(f"Error retrieving leaderboard: {e}")
             await interaction.followup.send(
                 embed=create_error_embed("An error occurred while retrieving the leaderboard."))
+
+    async def create_leaderboard_embed(self, leaderboard_data, page, own_rank):
+        embed = create_basic_embed(title="🎵 Music Leaderboard 🎵", description="Top music players in the server!")
+
+        # Users missing from the client's cache are fetched concurrently; any that cannot be are shown by ID
+        users = {user_id: self.bot.get_user(user_id) for user_id, _ in leaderboard_data}
+        missing = [user_id for user_id, user in users.items() if user is None]
+        fetched = await asyncio.gather(*(self.bot.fetch_user(user_id) for user_id in missing), return_exceptions=True)
+        for user_id, user in zip(missing, fetched):
+            users[user_id] = user if isinstance(user, discord.User) else None
+
+        for idx, (user_id, count) in enumerate(leaderboard_data, start=page * LEADERBOARD_PAGE_SIZE + 1):
+            user = users[user_id]
+            if idx == 1 and user:
+                embed.set_thumbnail(url=user.display_avatar.url)
+
+            # Add medals for top positions and format the leaderboard entries
+            medal = "🥇" if idx == 1 else "🥈" if idx == 2 else "🥉" if idx == 3 else f"{idx}."
+            name = f"{medal} {user.display_name if user else user_id}"
+            value = f"🎶 Plays: {count}"
+            embed.add_field(name=name, value=value, inline=False)
+
+        if own_rank:
+            rank, plays = own_rank
+            embed.add_field(name="📍 Your Rank", value=f"#{rank} with {plays} plays", inline=False)
+
+        embed.timestamp = discord.utils.utcnow()
+        return embed
@@ -6,11 +6,11 @@
 
 import discord
 import json
+from datetime import date
 import google.generativeai as genai
 from utils.embeds import create_basic_embed, create_error_embed
 from database import database as db
 from utils.logging import get_logger
-import aiomysql
 
 import config
 
@@ -32,8 +32,9 @@ class RecapService:
         try:
             user_id = interaction.user.id
 
-            # Fetch data from the database
-            stats = await db.get_user_stats(user_id)
+            # Fetch this year's stats in one go from the daily rollup tables
+            year = date.today().year
+            stats = await db.get_user_recap(user_id, since=date(year, 1, 1), until=date(year + 1, 1, 1))
 
             if not stats:
                 await interaction.followup.send(
@@ -47,12 +48,12 @@ class RecapService:
             top_artist = stats['top_artist'] or "None"
             top_song = stats['top_song'] or "None"
 
-            # Additional fun stats from the database
-            total_artists = await self.get_total_artists(user_id)
-            total_unique_songs = await self.get_total_unique_songs(user_id)
-            most_used_source = await self.get_most_used_source(user_id)
-            top_3_artists = await self.get_top_3_artists(user_id)
-            top_3_songs = await self.get_top_3_songs(user_id)
+            # Additional fun stats
+            total_artists = stats['total_artists']
+            total_unique_songs = stats['total_unique_songs']
+            most_used_source = stats['most_used_source']
+            top_3_artists = [f"{artist} ({plays} plays)" for artist, plays in stats['top_artists']]
+            top_3_songs = [f"{name} by {artist} ({plays} plays)" for name, artist, plays in stats['top_songs']]
 
             # Check if all stats are zero
             if (
@@ -104,7 +105,7 @@ class RecapService:
 
             # Create the embed
             embed = create_basic_embed(
-                title="🎶 Your 2024 Recap 🎶",
+                title=f"🎶 Your {year} Recap 🎶",
                 description=(
                     f"✨**{identity}**\n"
                     f"{personality_description}\n"
@@ -140,109 +141,6 @@ class RecapService:
                 embed=create_error_embed("An error occurred while generating your recap.")
             )
 
-    async def execute_query(self, query, params):
-        async with aiomysql.connect(**db.MYSQL_CONFIG) as conn:
-            async with conn.cursor(aiomysql.DictCursor) as cur:
-                await cur.execute(query, params)
-                return await cur.fetchall()
-
-    async def get_total_artists(self, user_id):
-        try:
-            query = '''
-                SELECT COUNT(DISTINCT songs.artist) AS total_artists
-                FROM plays
-                JOIN songs ON plays.song_id = songs.song_id
-                WHERE plays.user_id = %s
-            '''
-            result = await self.execute_query(query, (user_id,))
-            return result[0]["total_artists"] if result and "total_artists" in result[0] else 0
-        except Exception as e:
-            logger.error(f"Error fetching total artists count: {e}")
-            return 0
-
-    async def get_total_unique_songs(self, user_id):
-        try:
-            query = '''
-                SELECT COUNT(DISTINCT plays.song_id) AS total_unique_songs
-                FROM plays
-                WHERE plays.user_id = %s
-            '''
-            result = await self.execute_query(query, (user_id,))
-            return result[0]["total_unique_songs"] if result and "total_unique_songs" in result[0] else 0
-        except Exception as e:
-            logger.error(f"Error fetching total unique songs count: {e}")
-            return 0
-
-    async def get_top_3_artists(self, user_id):
-        try:
-            query = '''
-                SELECT songs.artist, SUM(plays.count) AS play_count
-                FROM plays
-                JOIN songs ON plays.song_id = songs.song_id
-                WHERE plays.user_id = %s
-                GROUP BY songs.artist
-                ORDER BY play_count DESC
-                LIMIT 3
-            '''
-            result = await self.execute_query(query, (user_id,))
-            return [f"{row['artist']} ({row['play_count']} plays)" for row in result] if result else []
-        except Exception as e:
-            logger.error(f"Error fetching top 3 artists: {e}")
-            return []
-
-    async def get_top_3_songs(self, user_id):
-        try:
-            query = '''
-                SELECT songs.name, songs.artist, SUM(plays.count) AS play_count
-                FROM plays
-                JOIN songs ON plays.song_id = songs.song_id
-                WHERE plays.user_id = %s
-                GROUP BY songs.name, songs.artist
-                ORDER BY play_count DESC
-                LIMIT 3
-            '''
-            result = await self.execute_query(query, (user_id,))
-            return [f"{row['name']} by {row['artist']} ({row['play_count']} plays)" for row in result] if result else []
-        except Exception as e:
-            logger.error(f"Error fetching top 3 songs: {e}")
-            return []
-
-    async def get_most_used_source(self, user_id):
-        try:
-            query = '''
-                SELECT songs.uri
-                FROM plays
-                JOIN songs ON plays.song_id = songs.song_id
-                WHERE plays.user_id = %s
-            '''
-            result = await self.execute_query(query, (user_id,))
-            if not result:
-                return "Unknown"
-
-            # Analyze URIs to determine the most used source
-            sources = {}
-            for row in result:
-                uri = row["uri"]
-                if "youtube" in uri.lower():
-                    source = "YouTube"
-                elif "soundcloud" in uri.lower():
-                    source = "SoundCloud"
-                elif "spotify" in uri.lower():
-                    source = "Spotify"
-                elif "deezer" in uri.lower():
-                    source = "Deezer"
-                else:
-                    source = "Other"
-
-                sources[source] = sources.get(source, 0) + 1
-
-            most_used = max(sources, key=sources.get)
-            return most_used
-
-        except Exception as e:
-            logger.error(f"Error fetching most used source: {e}")
-            return "Unknown"
-
     async def generate_gemini_identity(self, top_artist, top_song, total_artists, total_unique_songs, most_used_source,
                                        total_songs_played, total_hours_played, top_3_songs):
         try:
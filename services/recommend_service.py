@@ -1,3 +1,4 @@
+import asyncio
 import google.generativeai as genai
 import discord
 import wavelink
@@ -6,6 +7,7 @@ from utils.logging import get_logger
 from utils.interaction_checks import restriction_check
 from utils.voting_checks import has_voted
 from utils.embeds import create_basic_embed, create_error_embed
+from utils.search_gateway import search_gateway, interaction_deadline
 
 # Configure Google Gemini API
 genai.configure(api_key=config.GEMINI)
@@ -86,17 +88,26 @@ class SongButton(discord.ui.Button):
         self.player = player
 
     async def callback(self, interaction: discord.Interaction):
-        # Search for the song using the query and add it to the queue if found
-        tracks = await wavelink.Playable.search(self.song_query, source=wavelink.TrackSource.YouTubeMusic)
+        # Search for the song using the query and add it to the queue if found. Deferred first, so the
+        # search gets the same time as any other command instead of the three seconds before a reply is due.
+        await interaction.response.defer(ephemeral=True)
+        try:
+            tracks = await search_gateway.search(self.song_query, source='ytmsearch',
+                                                 deadline=interaction_deadline(interaction))
+        except asyncio.TimeoutError:
+            await interaction.followup.send(embed=create_error_embed(
+                error_message="The search took too long. Please try again."
+            ), ephemeral=True)
+            return
         if tracks:
             track = tracks[0] if isinstance(tracks, list) and tracks else tracks
             track.extras = {"requester_id": interaction.user.id}  # Add requester ID to track metadata
             self.player.queue.put(track)
-            await interaction.response.send_message(embed=create_basic_embed(
+            await interaction.followup.send(embed=create_basic_embed(
                 title="Added to Queue",
                 description=f"Added to queue: {self.song_query}"
             ), ephemeral=True)
         else:
-            await interaction.response.send_message(embed=create_error_embed(
+            await interaction.followup.send(embed=create_error_embed(
                 error_message="Unable to find the song."
             ), ephemeral=True)
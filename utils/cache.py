@@ -0,0 +1,158 @@
+# ========================================= #
+# Author: Noah S. Kipp                      #
+# Collaborator: Samuel Jaden Garcia Munoz   #
+# Created on: 17.10.2026                    #
+# ========================================= #
+
+import time
+from collections import OrderedDict
+
+
+class LRUSet:
+    # A set holding at most maxsize keys. Membership checks refresh a key, and adding past
+    # the limit evicts the least recently used one.
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._keys = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key):
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.maxsize:
+            self._keys.popitem(last=False)
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    def discard(self, key):
+        self._keys.pop(key, None)
+
+    def clear(self):
+        self._keys.clear()
+
+    def get_stats(self):
+        return {'size': len(self._keys), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+class LRUCache:
+    # A mapping holding at most maxsize entries. Reads refresh an entry, and writes past
+    # the limit evict the least recently used one.
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self._entries.pop(key, default)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self):
+        return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+class TTLCache:
+    # An LRU mapping whose entries also expire ttl seconds after they were set. It holds at most maxsize
+    # entries and, when max_bytes is given, at most that many bytes as measured by sizeof(key, value).
+    def __init__(self, maxsize=1000, ttl=300.0, max_bytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda key, value: 0)
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Returns a live entry without refreshing it or counting a hit or miss
+    def peek(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[2]
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    # ttl overrides the cache's lifetime for this entry
+    def set(self, key, value, ttl=None):
+        if key in self._entries:
+            self._remove(key)
+        size = self.sizeof(key, value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), size, value)
+        self.bytes += size
+        while len(self._entries) > self.maxsize or (self.max_bytes is not None and self.bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        if key not in self._entries:
+            return default
+        value = self._entries[key][2]
+        self._remove(key)
+        return value
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def get_stats(self):
+        return {'size': len(self._entries), 'maxsize': self.maxsize, 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'expirations': self.expirations}
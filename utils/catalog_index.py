@@ -0,0 +1,106 @@
+# ========================================= #
+# Author: Noah S. Kipp                      #
+# Collaborator: Samuel Jaden Garcia Munoz   #
+# Created on: 17.10.2026                    #
+# ========================================= #
+
+import heapq
+from collections import OrderedDict
+from utils.formatters import normalize_query
+
+
+# Returns the grams a folded text is indexed under: every three characters of it with a space in front,
+# plus a space and the first character of each word, so one-letter words can be looked up as well.
+def _text_grams(text):
+    padded = ' ' + text
+    grams = {padded[i:i + 3] for i in range(len(padded) - 2)}
+    grams.update(' ' + word[0] for word in text.split())
+    return grams
+
+
+# Returns the grams every song matching the query word has to be indexed under
+def _word_grams(word):
+    if len(word) == 1:
+        return {' ' + word}
+    padded = ' ' + word
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CatalogIndex:
+    # Finds songs by the beginnings of the words in their title and artist, so "rick never" finds
+    # "Never Gonna Give You Up - Rick Astley". Songs are kept under n-grams of their folded text, and a
+    # query only looks at the songs sharing all of its grams instead of scanning every title. Holds at
+    # most maxsize songs; adding past the limit drops the one added longest ago.
+    def __init__(self, maxsize=20000):
+        self.maxsize = maxsize
+        self._songs = OrderedDict()  # uri -> (title, author, folded text)
+        self._postings = {}  # gram -> uris of the songs indexed under it
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._songs)
+
+    def __contains__(self, uri):
+        return uri in self._songs
+
+    def add(self, title, author, uri):
+        if not uri or uri in self._songs:
+            return
+        text = normalize_query(f"{title} {author}")
+        self._songs[uri] = (title, author, text)
+        for gram in _text_grams(text):
+            self._postings.setdefault(gram, set()).add(uri)
+        while len(self._songs) > self.maxsize:
+            self._remove(next(iter(self._songs)))
+
+    def _remove(self, uri):
+        _, _, text = self._songs.pop(uri)
+        for gram in _text_grams(text):
+            uris = self._postings[gram]
+            uris.discard(uri)
+            if not uris:
+                del self._postings[gram]
+
+    # Returns up to limit (title, author, uri) tuples for songs where every word of the query starts a
+    # word of the title or artist. Titles starting with the query come first, then shorter titles.
+    def search(self, query, limit=25):
+        key = normalize_query(query)
+        words = key.split()
+        if not words:
+            return []
+
+        grams = set().union(*(_word_grams(word) for word in words))
+        postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for uris in postings[1:]:
+            if not candidates:
+                break
+            candidates &= uris
+
+        # The grams can also come from different words, so check each match word by word
+        matches = []
+        for uri in candidates:
+            title, author, text = self._songs[uri]
+            text_words = text.split()
+            if all(any(text_word.startswith(word) for text_word in text_words) for word in words):
+                matches.append((not text.startswith(key), len(title), title, author, uri))
+
+        if matches:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return [(title, author, uri) for _, _, title, author, uri in heapq.nsmallest(limit, matches)]
+
+    def clear(self):
+        self._songs.clear()
+        self._postings.clear()
+
+    def get_stats(self):
+        return {
+            'size': len(self._songs),
+            'maxsize': self.maxsize,
+            'grams': len(self._postings),
+            'hits': self.hits,
+            'misses': self.misses
+        }
@@ -4,6 +4,9 @@
 # Created on: 15.08.2024                    #
 # ========================================= #
 
+import unicodedata
+
+
 def format_duration(ms: int) -> str:
     # Formats a duration from milliseconds into a readable string
     seconds = int((ms / 1000) % 60)
@@ -14,3 +17,8 @@ def format_duration(ms: int) -> str:
         return f"{hours}h {minutes}m {seconds}s"
     else:
         return f"{minutes}m {seconds}s"
+
+
+def normalize_query(query: str) -> str:
+    # Folds a search query to the form it is cached and matched under: Unicode-normalized, case-folded, single-spaced
+    return ' '.join(unicodedata.normalize('NFKC', query or '').casefold().split())
@@ -14,9 +14,11 @@ async def restriction_check(interaction: discord.Interaction) -> bool:
     # Checks if the user is restricted by DJ-only mode or specific command restrictions
     logging.debug(f'Restriction check for {interaction.user} in guild {interaction.guild_id}')
 
-    dj_only = await db.get_dj_only_enabled(interaction.guild_id)
-    dj_role_id = await db.get_dj_role(interaction.guild_id)
-    restricted_commands = await db.get_restricted_commands(interaction.guild_id)
+    # Single cached lookup of the guild's settings row
+    settings = await db.get_guild_settings(interaction.guild_id)
+    dj_only = bool(settings['dj_only_enabled'])
+    dj_role_id = settings['dj_role_id']
+    restricted_commands = settings['restricted_commands']
 
     if not dj_only:
         return True
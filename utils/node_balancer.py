@@ -0,0 +1,196 @@
+# ========================================= #
+# Author: Noah S. Kipp                      #
+# Collaborator: Samuel Jaden Garcia Munoz   #
+# Created on: 17.10.2026                    #
+# ========================================= #
+
+import asyncio
+import os
+import time
+import wavelink
+from discord.utils import MISSING
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Seconds between polls of every node's stats, and how long a poll may take before the node counts as down
+NODE_STATS_INTERVAL = float(os.getenv('NODE_STATS_INTERVAL', 30))
+NODE_STATS_TIMEOUT = float(os.getenv('NODE_STATS_TIMEOUT', 5))
+
+# Milliseconds of REST latency that weigh as much as one more playing player on a node
+LATENCY_PENALTY_MS = 10
+
+# Weight of the newest latency sample in a node's smoothed latency
+LATENCY_SMOOTHING = 0.3
+
+# Frames Lavalink sends per minute for one player
+FRAMES_PER_MINUTE = 3000
+
+
+def _empty_health():
+    return {
+        'players': 0,
+        'playing': 0,
+        'system_load': 0.0,
+        'lavalink_load': 0.0,
+        'deficit': 0,
+        'nulled': 0,
+        'latency_ms': None,
+        'local_players': 0,  # Players of this bot on the node when it was last polled
+        'healthy': True,
+        'polled_at': None,
+        'failures': 0,
+        'searches': 0,
+        'searching': 0
+    }
+
+
+# Turns a /v4/loadtracks response into what wavelink.Pool.fetch_tracks returns for it
+def _load_result(resp):
+    if resp['loadType'] == 'track':
+        return [wavelink.Playable(resp['data'])]
+    if resp['loadType'] == 'search':
+        return [wavelink.Playable(data) for data in resp['data']]
+    if resp['loadType'] == 'playlist':
+        return wavelink.Playlist(resp['data'])
+    if resp['loadType'] == 'error':
+        raise wavelink.LavalinkLoadException(data=resp['data'])
+    return []
+
+
+class NodeBalancer:
+    # Chooses Lavalink nodes by their health instead of wavelink's default of the node with the fewest
+    # players. Every node's stats are polled over REST, which also measures its latency; the stats event
+    # wavelink dispatches does not say which node it came from. New players go to the node with the lowest
+    # penalty (players, CPU load, missing frames, latency), while searches are spread by the searches
+    # already running on each node, so a burst of searches does not pile onto the node chosen for playback.
+    def __init__(self, interval=NODE_STATS_INTERVAL):
+        self.interval = interval
+        self._health = {}  # node identifier -> health as last polled
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Polling Lavalink node stats failed, will retry: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def poll(self):
+        await asyncio.gather(*(self._poll_node(node) for node in wavelink.Pool.nodes.values()))
+
+    async def _poll_node(self, node):
+        health = self._health_of(node)
+        started = time.perf_counter()
+        try:
+            stats = await asyncio.wait_for(node.fetch_stats(), NODE_STATS_TIMEOUT)
+        except Exception as e:
+            health['failures'] += 1
+            if health['healthy']:
+                logger.warning(f"Lavalink node {node.identifier} is not answering, moving new players off it: {e}")
+            health['healthy'] = False
+            return
+        latency = (time.perf_counter() - started) * 1000
+
+        if not health['healthy']:
+            logger.info(f"Lavalink node {node.identifier} is answering again.")
+        health.update({
+            'players': stats.players,
+            'playing': stats.playing,
+            'system_load': stats.cpu.system_load,
+            'lavalink_load': stats.cpu.lavalink_load,
+            'deficit': stats.frames.deficit if stats.frames else 0,
+            'nulled': stats.frames.nulled if stats.frames else 0,
+            'latency_ms': latency if health['latency_ms'] is None
+            else health['latency_ms'] + LATENCY_SMOOTHING * (latency - health['latency_ms']),
+            'local_players': len(node.players),
+            'healthy': True,
+            'polled_at': time.time()
+        })
+
+    def _health_of(self, node):
+        return self._health.setdefault(node.identifier, _empty_health())
+
+    # Nodes that are connected and answered their last poll. If none did, every connected node.
+    def _candidates(self):
+        nodes = [node for node in wavelink.Pool.nodes.values() if node.status is wavelink.NodeStatus.CONNECTED]
+        healthy = [node for node in nodes if self._health_of(node)['healthy']]
+        return healthy or nodes
+
+    # Penalties as in Lavalink's own client load balancing, growing steeply with CPU load and with frames
+    # that could not be sent in time, plus the node's REST latency. Players started on the node since the
+    # last poll are counted too, so a burst of new players does not all land on the same node.
+    def penalty(self, node):
+        health = self._health_of(node)
+        players = health['playing'] + max(len(node.players) - health['local_players'], 0)
+        cpu = 1.05 ** (100 * health['system_load']) * 10 - 10
+        deficit = 1.03 ** (500 * max(health['deficit'], 0) / FRAMES_PER_MINUTE) * 600 - 600
+        nulled = (1.03 ** (500 * max(health['nulled'], 0) / FRAMES_PER_MINUTE) * 300 - 300) * 2
+        latency = (health['latency_ms'] or 0) / LATENCY_PENALTY_MS
+        return players + cpu + deficit + nulled + latency
+
+    # Returns the node a new player should be created on
+    def playback_node(self):
+        nodes = self._candidates()
+        if not nodes:
+            return wavelink.Pool.get_node()  # Raises wavelink's own error for having no connected node
+        penalties = {node.identifier: self.penalty(node) for node in nodes}
+        node = min(nodes, key=lambda candidate: penalties[candidate.identifier])
+        logger.debug(f"Placing a new player on Lavalink node {node.identifier} (penalty "
+                     f"{penalties[node.identifier]:.1f}); candidates: "
+                     + ', '.join(f"{identifier} {penalty:.1f}" for identifier, penalty in penalties.items()))
+        return node
+
+    # Returns the node the next search should go to: the one with the fewest searches running, then the
+    # one answering fastest. Playback load is left out, since a search does not touch the audio pipeline.
+    def search_node(self):
+        nodes = self._candidates()
+        if not nodes:
+            return wavelink.Pool.get_node()
+        healths = {node.identifier: self._health_of(node) for node in nodes}
+        return min(nodes, key=lambda node: (healths[node.identifier]['searching'],
+                                            healths[node.identifier]['latency_ms'] or 0))
+
+    # Looks an identifier up like wavelink.Pool.fetch_tracks, on the node chosen by search_node
+    async def fetch_tracks(self, identifier):
+        node = self.search_node()
+        health = self._health_of(node)
+        health['searches'] += 1
+        health['searching'] += 1
+        try:
+            resp = await node.send('GET', path='v4/loadtracks', params={'identifier': identifier})
+        finally:
+            health['searching'] -= 1
+        return _load_result(resp)
+
+    def get_stats(self):
+        stats = {}
+        for node in wavelink.Pool.nodes.values():
+            health = self._health_of(node)
+            stats[node.identifier] = dict(health, status=node.status.name, bot_players=len(node.players),
+                                          penalty=round(self.penalty(node), 2))
+        return stats
+
+
+node_balancer = NodeBalancer()
+
+
+class BalancedPlayer(wavelink.Player):
+    # A wavelink.Player created on the node the balancer picks for playback. Use it as
+    # channel.connect(cls=BalancedPlayer).
+    def __init__(self, client=MISSING, channel=MISSING, *, nodes=None):
+        super().__init__(client, channel, nodes=nodes or [node_balancer.playback_node()])
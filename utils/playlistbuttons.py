@@ -4,10 +4,12 @@
 # Created on: 15.08.2024                    #
 # ========================================= #
 
+import asyncio
 import discord
 from database import database as db
 from utils.embeds import create_basic_embed, create_error_embed
 from utils.logging import get_logger
+from utils.node_balancer import BalancedPlayer
 
 # Initialize the logger from logging.py
 logger = get_logger(__name__)
@@ -99,13 +101,13 @@ class PlaylistPlaySelectView(discord.ui.View):
                         embed=create_error_embed("Please join a voice channel to play music. 🎶"),
                         ephemeral=True)
                     return
-                player = await channel.connect(cls=wavelink.Player)
+                player = await channel.connect(cls=BalancedPlayer)
                 player.guild_id = interaction.guild_id
                 player.interaction_channel_id = interaction.channel_id
 
             playlist_cog = interaction.client.get_cog("Playlist")
             if playlist_cog:
-                await playlist_cog.play_songs(interaction, contents, player)
+                await playlist_cog.service.play_songs(interaction, contents, player)
                 await interaction.followup.send(
                     embed=create_basic_embed("", f"Playing all songs from playlist '{selected_playlist['name']}'! 🎶"),
                     ephemeral=False)
@@ -146,12 +148,15 @@ class ConfirmDeleteView(discord.ui.View):
 
 
 # PlaylistPaginator for navigating through playlist contents
+# Pass a page_renderer (an async callable taking a page index) instead of embeds to build each page when
+# it is shown; only the page on screen is held in memory.
 class PlaylistPaginator(discord.ui.View):
-    def __init__(self, embeds, current_page=0, total_pages=None, timeout=180):
+    def __init__(self, embeds, current_page=0, total_pages=None, timeout=180, page_renderer=None):
         super().__init__(timeout=timeout)
-        self.embeds = embeds
+        self.embeds = embeds or []
+        self.page_renderer = page_renderer
         self.current_page = current_page
-        self.total_pages = total_pages if total_pages else len(embeds)
+        self.total_pages = total_pages if total_pages else len(self.embeds)
 
         self.first_button = discord.ui.Button(label="First", style=discord.ButtonStyle.grey, custom_id="first_page")
         self.prev_button = discord.ui.Button(label="Previous", style=discord.ButtonStyle.primary, custom_id="prev_page")
@@ -170,14 +175,22 @@ class PlaylistPaginator(discord.ui.View):
 
         self.update_buttons()
 
+    async def get_page(self, page):
+        if self.page_renderer is None:
+            return self.embeds[page]
+        return await self.page_renderer(page)
+
     async def update(self, interaction: discord.Interaction, message=None):
         self.update_buttons()
-        if self.embeds:
-            embed = self.embeds[self.current_page]
+        if self.embeds or self.page_renderer:
+            embed = await self.get_page(self.current_page)
             embed.set_footer(
                 text=f"Page {self.current_page + 1} of {self.total_pages}")  # Update the footer with the page number
             try:
-                await interaction.response.edit_message(embed=embed, view=self)
+                if interaction.response.is_done():
+                    await interaction.edit_original_response(embed=embed, view=self)
+                else:
+                    await interaction.response.edit_message(embed=embed, view=self)
                 if message:
                     await interaction.followup.send(embed=create_basic_embed("", message), ephemeral=True)
             except discord.errors.InteractionResponded:
@@ -360,7 +373,8 @@ class PlaylistSelection(discord.ui.View):
         if self.selected_playlist:
             if self.selected_playlist['privacy'] == 1 or user_id == self.selected_playlist[
                 'user_id'] or await db.is_collaborator(user_id, self.selected_playlist['playlist_id']):
-                contents = await db.get_playlist_contents(self.selected_playlist['playlist_id'])
+                # An embed holds at most 25 fields, so only that many songs are fetched
+                contents = await db.get_playlist_songs(self.selected_playlist['playlist_id'], limit=25)
                 embed = discord.Embed(title=f"Playlist: {self.selected_playlist['name']}",
                                       color=discord.Color.dark_red())
                 for song in contents:
@@ -384,8 +398,7 @@ class PlaylistSelection(discord.ui.View):
         embed = create_basic_embed(self.selected_playlist['name'], f"Creator: {creator.name}")
         embed.add_field(name="Privacy", value="Public" if self.selected_playlist['privacy'] == 1 else "Private")
         if self.selected_playlist['privacy'] == 1:  # Public playlist
-            contents = await db.get_playlist_contents(self.selected_playlist['playlist_id'])
-            embed.add_field(name="Song Count", value=str(len(contents)))
+            embed.add_field(name="Song Count", value=str(self.selected_playlist['song_count']))
 
         return embed
 
@@ -403,28 +416,55 @@ class PlaylistSelectView(discord.ui.View):
 
     async def select_callback(self, interaction: discord.Interaction):
         selected_playlist = self.select.values[0]
-        await db.add_song_to_playlist(interaction.user.id, selected_playlist, self.track.identifier, self.track.title,
-                                      self.track.author, self.track.raw_data)
-        await interaction.response.send_message(
-            embed=create_basic_embed("", f"Added to your playlist '{selected_playlist}'! 🎶"), ephemeral=True)
+        result = await db.add_song_to_playlist(interaction.user.id, selected_playlist, self.track.identifier,
+                                               self.track.title, self.track.author, self.track.raw_data)
+        embed = create_add_song_embed(result, self.track.title, selected_playlist,
+                                      f"Added to your playlist '{selected_playlist}'! 🎶")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
         self.stop()
 
 
+# Returns the embed answering an add to a playlist, given what db.add_song_to_playlist returned.
+# added_message is shown when the song was added.
+def create_add_song_embed(result, song_name, playlist_name, added_message):
+    if result == 'Playlist not found':
+        return create_error_embed("Sorry, I couldn't find that playlist. 🎶")
+    if result == 'Song already in playlist':
+        return create_error_embed(
+            f"'{song_name}' is already in playlist '{playlist_name}', which only holds unique tracks. 🎶")
+    return create_basic_embed("", added_message)
+
+
+# Resolves user IDs to names, using the client's user cache first and fetching all misses concurrently.
+# Users that cannot be fetched are shown by their ID.
+async def resolve_user_names(bot, user_ids):
+    names = {}
+    missing = []
+    for user_id in set(user_ids):
+        user = bot.get_user(user_id)
+        if user:
+            names[user_id] = user.name
+        else:
+            missing.append(user_id)
+
+    fetched = await asyncio.gather(*(bot.fetch_user(user_id) for user_id in missing), return_exceptions=True)
+    for user_id, user in zip(missing, fetched):
+        names[user_id] = user.name if isinstance(user, discord.User) else str(user_id)
+    return names
+
+
 # Create playlist selection embeds and view
 async def create_playlist_selection_embeds(playlists, bot):
     view = PlaylistSelection(playlists, bot)
     await view.update_options(selected_playlist_id=playlists[0]['playlist_id'])
 
+    creators = await resolve_user_names(bot, [playlist['user_id'] for playlist in playlists])
     embeds = []
     for playlist in playlists:
-        creator = bot.get_user(playlist['user_id'])
-        if not creator:
-            creator = await bot.fetch_user(playlist['user_id'])
-        embed = create_basic_embed(playlist['name'], f"Creator: {creator.name}")
+        embed = create_basic_embed(playlist['name'], f"Creator: {creators[playlist['user_id']]}")
         embed.add_field(name="Privacy", value="Public" if playlist['privacy'] == 1 else "Private")
         if playlist['privacy'] == 1:  # Public playlist
-            contents = await db.get_playlist_contents(playlist['playlist_id'])
-            embed.add_field(name="Song Count", value=str(len(contents)))
+            embed.add_field(name="Song Count", value=str(playlist['song_count']))
         embeds.append(embed)
 
     return embeds, view
@@ -452,6 +492,7 @@ async def create_invite_view_embeds(invites, bot):
 async def create_edit_interface(interaction: discord.Interaction, playlist):
     embed = create_basic_embed(f"Edit Playlist: {playlist['name']}", "")  # Add an empty description
     embed.add_field(name="Current Privacy", value="Public" if playlist['privacy'] == 1 else "Private")
+    embed.add_field(name="Unique Tracks", value="On" if playlist.get('unique_tracks') else "Off")
 
     view = discord.ui.View()
 
@@ -472,6 +513,23 @@ async def create_edit_interface(interaction: discord.Interaction, playlist):
     privacy_select.callback = privacy_callback
     view.add_item(privacy_select)
 
+    unique_options = [
+        discord.SelectOption(label='Unique Tracks On', value='1', description='Each song can only be added once'),
+        discord.SelectOption(label='Unique Tracks Off', value='0')
+    ]
+
+    async def unique_callback(interaction: discord.Interaction):
+        unique_tracks = int(interaction.data['values'][0])
+        removed = await db.update_playlist_unique_tracks(playlist['playlist_id'], unique_tracks)
+        message = f"Unique tracks turned {'on' if unique_tracks else 'off'}"
+        if removed:
+            message += f", {removed} duplicate song{'s' if removed != 1 else ''} removed"
+        await interaction.response.send_message(embed=create_basic_embed("", f"{message} 🎶"), ephemeral=True)
+
+    unique_select = discord.ui.Select(placeholder='Unique Tracks', options=unique_options, custom_id="unique_select")
+    unique_select.callback = unique_callback
+    view.add_item(unique_select)
+
     async def delete_collaborator_callback(interaction: discord.Interaction):
         collaborators = await db.get_playlist_collaborators(playlist['playlist_id'])
         if not collaborators:
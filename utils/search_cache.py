@@ -0,0 +1,96 @@
+# ========================================= #
+# Author: Noah S. Kipp                      #
+# Collaborator: Samuel Jaden Garcia Munoz   #
+# Created on: 17.10.2026                    #
+# ========================================= #
+
+import asyncio
+import os
+from utils.cache import TTLCache
+from utils.formatters import normalize_query
+from utils.search_gateway import wait_until
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Seconds a search result stays cached, the number of queries kept, and the memory they may take up
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', 600))
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', 2000))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv('SEARCH_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+
+# A cached result for a shorter prefix of the query (at least this long) answers it if filtering
+# it down to the query still leaves this many results
+SEARCH_PREFIX_MIN_LENGTH = 3
+SEARCH_PREFIX_MIN_RESULTS = 5
+
+# Rough per-result and per-entry bookkeeping overhead of Python objects, in bytes
+RESULT_OVERHEAD = 200
+ENTRY_OVERHEAD = 300
+
+
+def _result_size(key, results):
+    return ENTRY_OVERHEAD + len(key) + sum(RESULT_OVERHEAD + sum(len(field or '') for field in result)
+                                           for result in results)
+
+
+class SearchCache:
+    # Caches search results per normalized query. fetch is an async callable taking the normalized
+    # query and returning a list of (title, author, uri) tuples. While a user types, each new keystroke
+    # first tries to narrow down what was cached for the query typed so far, and only searches on a miss.
+    def __init__(self, fetch, ttl=SEARCH_CACHE_TTL, maxsize=SEARCH_CACHE_SIZE, max_bytes=SEARCH_CACHE_MAX_BYTES):
+        self.fetch = fetch
+        self._cache = TTLCache(maxsize, ttl, max_bytes=max_bytes, sizeof=_result_size)
+        self._stats = {
+            'hits': 0,
+            'prefix_hits': 0,
+            'misses': 0
+        }
+
+    # Waits for a search until the loop time `deadline` at most; see search_gateway.interaction_deadline.
+    async def search(self, query, deadline=None):
+        key = normalize_query(query)
+        if not key:
+            return []
+
+        results = self._cache.get(key)
+        if results is not None:
+            self._stats['hits'] += 1
+            return results
+
+        results = self._from_prefix(key)
+        if results is not None:
+            self._stats['prefix_hits'] += 1
+            return results
+
+        self._stats['misses'] += 1
+        # The results are cached when they arrive, even if this caller has stopped waiting by then
+        fill = asyncio.get_running_loop().create_task(self._fill(key))
+        fill.add_done_callback(lambda task: task.cancelled() or task.exception())  # The gateway logs failures
+        return await wait_until(fill, deadline)
+
+    async def _fill(self, key):
+        results = await self.fetch(key)
+        self._cache.set(key, results)
+        return results
+
+    # Filters the results of the longest cached prefix down to those matching every word of the query.
+    def _from_prefix(self, key):
+        words = key.split()
+        for length in range(len(key) - 1, SEARCH_PREFIX_MIN_LENGTH - 1, -1):
+            cached = self._cache.peek(key[:length])
+            if cached is None:
+                continue
+            matches = [result for result in cached
+                       if all(word in normalize_query(f"{result[0]} {result[1]}") for word in words)]
+            return matches if len(matches) >= SEARCH_PREFIX_MIN_RESULTS else None
+        return None
+
+    def clear(self):
+        self._cache.clear()
+
+    def get_stats(self):
+        lookups = sum(self._stats.values())
+        stats = self._cache.get_stats()
+        stats.update(self._stats)  # The cache's own hits and misses do not tell prefix hits apart
+        stats['hit_rate'] = round((self._stats['hits'] + self._stats['prefix_hits']) / lookups, 3) if lookups else 0.0
+        return stats
@@ -0,0 +1,98 @@
+# ========================================= #
+# Author: Noah S. Kipp                      #
+# Collaborator: Samuel Jaden Garcia Munoz   #
+# Created on: 17.10.2026                    #
+# ========================================= #
+
+import asyncio
+import copy
+import os
+from datetime import datetime, timezone
+import wavelink
+from utils.node_balancer import node_balancer
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Seconds a deferred command waits for a Lavalink search before giving up
+LAVALINK_SEARCH_TIMEOUT = float(os.getenv('LAVALINK_SEARCH_TIMEOUT', 10))
+
+# Seconds after an interaction was created by which a search must be done when the interaction is
+# answered without deferring, as autocomplete is. Discord allows three; the rest is for sending the response.
+RESPONSE_DEADLINE = 2.5
+
+
+# Returns the event loop time by which a search made for the interaction has to be done, `seconds`
+# after the interaction was created.
+def interaction_deadline(interaction, seconds=LAVALINK_SEARCH_TIMEOUT):
+    age = (datetime.now(timezone.utc) - interaction.created_at).total_seconds()
+    return asyncio.get_running_loop().time() + seconds - age
+
+
+# Waits for a shared task until the loop time `deadline` (if any). Giving up raises asyncio.TimeoutError
+# but leaves the task running for whoever else is waiting on it.
+async def wait_until(task, deadline=None):
+    timeout = None if deadline is None else max(deadline - asyncio.get_running_loop().time(), 0)
+    return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+
+# Returns a copy of a search result whose tracks can be changed (extras, queueing) without affecting
+# anyone else who was handed the same result.
+def _copy_result(result):
+    if isinstance(result, wavelink.Playlist):
+        playlist = copy.copy(result)
+        playlist.tracks = [wavelink.Playable(track.raw_data, playlist=track.playlist) for track in result.tracks]
+        return playlist
+    return [wavelink.Playable(track.raw_data) for track in result]
+
+
+class SearchGateway:
+    # Sends Lavalink lookups through one place, so that identical lookups made at the same time (a popular
+    # song typed in several guilds at once) share a single in-flight request. Every waiter gets its own
+    # copy of the result and can stop waiting at its own deadline without cancelling the request.
+    def __init__(self):
+        self._inflight = {}  # identifier -> task fetching it
+        self._stats = {
+            'requests': 0,
+            'coalesced': 0,
+            'timeouts': 0,
+            'failures': 0
+        }
+
+    async def fetch_tracks(self, identifier, deadline=None):
+        task = self._inflight.get(identifier)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(node_balancer.fetch_tracks(identifier))
+            self._inflight[identifier] = task
+            task.add_done_callback(lambda done: self._finish(identifier, done))
+            self._stats['requests'] += 1
+        else:
+            self._stats['coalesced'] += 1
+
+        try:
+            result = await wait_until(task, deadline)
+        except asyncio.TimeoutError:
+            self._stats['timeouts'] += 1
+            raise
+        return _copy_result(result)
+
+    # Searches like wavelink.Playable.search: URLs are looked up as they are, anything else is searched
+    # on the source given by its search prefix (YouTube Music by default).
+    async def search(self, query, source='ytmsearch', deadline=None):
+        if query.startswith('https://') or query.startswith('http://') or not source:
+            return await self.fetch_tracks(query, deadline)
+        return await self.fetch_tracks(f'{source}:{query}', deadline)
+
+    def _finish(self, identifier, task):
+        if self._inflight.get(identifier) is task:
+            del self._inflight[identifier]
+        # Retrieve the error even when every waiter gave up, so it is logged once here
+        if not task.cancelled() and task.exception() is not None:
+            self._stats['failures'] += 1
+            logger.warning(f"Lavalink lookup of '{identifier}' failed: {task.exception()}")
+
+    def get_stats(self):
+        return dict(self._stats, inflight=len(self._inflight))
+
+
+search_gateway = SearchGateway()
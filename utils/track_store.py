@@ -0,0 +1,172 @@
+# ========================================= #
+# Author: Noah S. Kipp                      #
+# Collaborator: Samuel Jaden Garcia Munoz   #
+# Created on: 17.10.2026                    #
+# ========================================= #
+
+# Remembers what Lavalink resolved a /play query or URL to, as the tracks' raw data (which carries the
+# encoded track), so a repeated request is answered without a search round trip. Entries live in memory
+# and, when TRACK_STORE_PATH is set, in a small SQLite file that survives restarts.
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import wavelink
+from database.database import song_source
+from utils.cache import TTLCache
+from utils.formatters import normalize_query
+from utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+# SQLite file the store is kept in across restarts; memory only when empty
+TRACK_STORE_PATH = os.getenv('TRACK_STORE_PATH', '')
+
+# Number of resolved queries kept in memory
+TRACK_STORE_SIZE = int(os.getenv('TRACK_STORE_SIZE', 5000))
+
+# Seconds a resolution stays valid, per source. Searches on a catalogue that rarely changes can be kept
+# longer than YouTube results. Override with e.g. TRACK_STORE_TTLS="YouTube=3600,Deezer=86400".
+DEFAULT_TRACK_STORE_TTLS = {
+    'YouTube': 24 * 3600,
+    'SoundCloud': 24 * 3600,
+    'Spotify': 7 * 24 * 3600,
+    'Deezer': 7 * 24 * 3600,
+    'Other': 6 * 3600
+}
+
+# Lavalink search prefixes and the source they search
+SEARCH_PREFIX_SOURCES = {
+    'ytsearch': 'YouTube',
+    'ytmsearch': 'YouTube',
+    'scsearch': 'SoundCloud',
+    'spsearch': 'Spotify',
+    'dzsearch': 'Deezer'
+}
+
+
+def parse_ttls(value):
+    ttls = dict(DEFAULT_TRACK_STORE_TTLS)
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        source, _, seconds = item.partition('=')
+        try:
+            ttls[source.strip()] = float(seconds)
+        except ValueError:
+            logger.warning(f"Ignoring invalid TRACK_STORE_TTLS entry '{item}'.")
+    return ttls
+
+
+TRACK_STORE_TTLS = parse_ttls(os.getenv('TRACK_STORE_TTLS'))
+
+
+# Returns the key an identifier is stored under, and the source it resolves on. Search terms are
+# normalized, so "Never Gonna" and "never  gonna" share an entry; URLs are kept as they are.
+def identify(identifier):
+    prefix, separator, term = identifier.partition(':')
+    if separator and prefix in SEARCH_PREFIX_SOURCES:
+        return f'{prefix}:{normalize_query(term)}', SEARCH_PREFIX_SOURCES[prefix]
+    return identifier, song_source(identifier)
+
+
+class ResolvedTrackStore:
+    def __init__(self, path=TRACK_STORE_PATH, size=TRACK_STORE_SIZE, ttls=None):
+        self.path = path
+        self.ttls = ttls or TRACK_STORE_TTLS
+        self._memory = TTLCache(size, self.ttls['Other'])
+        self._db = None
+        # sqlite3 connections are not thread-safe, so every disk access runs on this one thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='track-store')
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stored': 0
+        }
+
+    async def open(self):
+        if self.path and self._db is None:
+            await self._run(self._open_db)
+            logger.info(f"Resolved track store opened at {self.path}.")
+
+    async def close(self):
+        if self._db is not None:
+            await self._run(self._db.close)
+            self._db = None
+        self._executor.shutdown(wait=False)
+
+    # Returns fresh Playables for what the identifier resolved to earlier, or None if it is not stored.
+    async def get(self, identifier):
+        key, _ = identify(identifier)
+        tracks = self._memory.get(key)
+        if tracks is not None:
+            self._stats['memory_hits'] += 1
+        elif self._db is not None:
+            row = await self._run(self._read, key)
+            if row is not None:
+                tracks, expires_at = row
+                self._memory.set(key, tracks, ttl=expires_at - time.time())
+                self._stats['disk_hits'] += 1
+        if tracks is None:
+            self._stats['misses'] += 1
+            return None
+        return [wavelink.Playable(data) for data in tracks]
+
+    # Stores a list of resolved tracks. Playlists are not stored, since their contents change.
+    def put(self, identifier, result):
+        if not result or isinstance(result, wavelink.Playlist):
+            return
+        key, source = identify(identifier)
+        ttl = self.ttls.get(source, self.ttls['Other'])
+        tracks = [track.raw_data for track in result]
+        self._memory.set(key, tracks, ttl=ttl)
+        self._stats['stored'] += 1
+        if self._db is not None:
+            # Written in the background; the memory entry already answers the next request
+            write = asyncio.get_running_loop().run_in_executor(self._executor, self._write, key, tracks,
+                                                               time.time() + ttl)
+            write.add_done_callback(self._write_done)
+
+    def _write_done(self, future):
+        if future.exception() is not None:
+            logger.warning(f"Failed to persist resolved tracks: {future.exception()}")
+
+    def get_stats(self):
+        return dict(self._stats, **{'memory_' + name: value for name, value in self._memory.get_stats().items()
+                                    if name in ('size', 'evictions', 'expirations')})
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _open_db(self):
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+        CREATE TABLE IF NOT EXISTS resolved_tracks (
+            identifier TEXT NOT NULL PRIMARY KEY,
+            tracks BLOB NOT NULL,
+            expires_at REAL NOT NULL
+        )''')
+        purged = self._db.execute('DELETE FROM resolved_tracks WHERE expires_at <= ?', (time.time(),)).rowcount
+        self._db.commit()
+        if purged:
+            logger.info(f"Purged {purged} expired resolved tracks.")
+
+    def _read(self, key):
+        row = self._db.execute('SELECT tracks, expires_at FROM resolved_tracks WHERE identifier = ? AND expires_at > ?',
+                               (key, time.time())).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0])), row[1]
+
+    def _write(self, key, tracks, expires_at):
+        data = zlib.compress(json.dumps(tracks, separators=(',', ':')).encode('utf-8'))
+        self._db.execute('INSERT OR REPLACE INTO resolved_tracks (identifier, tracks, expires_at) VALUES (?, ?, ?)',
+                         (key, data, expires_at))
+        self._db.commit()
+
+
+track_store = ResolvedTrackStore()